@@ -0,0 +1,46 @@
+"""
+Benchmark of the numpy transforms of CoordinateConverter against the point by point ones.
+Footprints are random polygons, no network is used.
+
+The point by point transforms return lazy asShape adapters which build the geometry on every use,
+so every result is used once (its area is calculated) to compare the real cost.
+
+    python benchmarks/bench_coordinates.py [count of polygons] [count of points]
+"""
+import os
+import random
+import sys
+import timeit
+
+from shapely.geometry import Polygon
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ee_downloader.utils import CoordinateConverter
+
+
+def footprints(count, points):
+    rnd = random.Random(1)
+    return [Polygon([(rnd.uniform(-200, 200), rnd.uniform(-100, 100)) for _ in range(points)])
+            for _ in range(count)]
+
+
+def bench(name, polygons, number=3):
+    points = getattr(CoordinateConverter, '_{0}Points'.format(name))
+    single = getattr(CoordinateConverter, name)
+    batch = getattr(CoordinateConverter, name + 'Batch')
+
+    old_time = min(timeit.repeat(lambda: [points(p).area for p in polygons], number=number, repeat=3)) / number
+    single_time = min(timeit.repeat(lambda: [single(p).area for p in polygons], number=number, repeat=3)) / number
+    batch_time = min(timeit.repeat(lambda: [p.area for p in batch(polygons)], number=number, repeat=3)) / number
+    print '{0:<18} points {1:9.2f} ms   numpy {2:9.2f} ms (x{3:.1f})   batch {4:9.2f} ms (x{5:.1f})'.format(
+        name, old_time * 1000, single_time * 1000, old_time / single_time, batch_time * 1000, old_time / batch_time)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    points = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    polygons = footprints(count, points)
+    for name in ('toWorkProj', 'toOrignProj', 'intersectionWork'):
+        bench(name, polygons)
@@ -0,0 +1,89 @@
+"""
+End-to-end benchmark of the downloader against the local EarthExplorer stand-in (tests/mock_server.py).
+Reports scenes per second of the search and of the metadata and download options filling,
+and MB per second of the downloads.
+
+    python benchmarks/bench_end_to_end.py --scenes 200 --latency 0.02 --file-size 4194304 --bandwidth 10485760
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tests'))
+
+from ee_downloader import config as downloader_config
+from ee_downloader.downloader import search_scenes, fill_scenes, download_scenes_by_ids
+from ee_downloader.metrics import default_metrics
+from ee_downloader.session import EESession
+from mock_server import MockEarthExplorer
+
+
+PRODUCT_NAME = 'Landsat 8 OLI/TIRS C1 Level-1'
+PRODUCT_FORMAT = 'Level-1 GeoTIFF Data Product'
+
+
+def report(name, count, unit, seconds):
+    print '{0:<24} {1:8d} {2:<7} {3:8.2f} s   {4:10.2f} {2}/s'.format(name, count, unit, seconds,
+                                                                    count / seconds if seconds else 0)
+
+
+def bench_search(server, identifiers):
+    session = EESession(server.login, server.password)
+    start = time.time()
+    scenes = list(search_scenes(session, identifiers, PRODUCT_NAME))
+    report('search', len(scenes), 'scenes', time.time() - start)
+    return session, scenes
+
+
+def bench_fill(session, scenes):
+    start = time.time()
+    count = sum(1 for _ in fill_scenes(session, scenes, PRODUCT_NAME))
+    report('metadata and options', count, 'scenes', time.time() - start)
+
+
+def bench_download(server, identifiers, workers, segments):
+    temp_dir = tempfile.mkdtemp()
+    try:
+        start = time.time()
+        scenes = download_scenes_by_ids(server.login, server.password, identifiers, temp_dir, PRODUCT_NAME,
+                                        PRODUCT_FORMAT, workers=workers, segments=segments)
+        seconds = time.time() - start
+        size = sum(os.path.getsize(scene['file_name']) for scene in scenes if scene.get('file_name'))
+        report('download (end-to-end)', len(scenes), 'scenes', seconds)
+        report('download (end-to-end)', size // (1024 * 1024), 'MB', seconds)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenes', type=int, default=100, help='count of scenes')
+    parser.add_argument('--file-size', type=int, default=1024 * 1024, help='size of every file in bytes')
+    parser.add_argument('--latency', type=float, default=0.01, help='delay of every response in seconds')
+    parser.add_argument('--bandwidth', type=int, default=None, help='bytes per second of every connection')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of 503 responses')
+    parser.add_argument('--workers', type=int, default=None, help='count of simultaneous downloads')
+    parser.add_argument('--segments', type=int, default=None, help='count of connections for one file')
+    parser.add_argument('--rate', type=float, default=1000, help='requests per second allowed by the client')
+    parser.add_argument('--metrics', action='store_true', help='print timings of every stage in Prometheus format')
+    args = parser.parse_args()
+
+    # The limits are for the real server, here the client is measured
+    downloader_config.SEARCH_RATE = args.rate
+    downloader_config.SCHEDULER_DEFAULT_RATE = args.rate
+    downloader_config.RETRY_DELAY = 0.01
+
+    with MockEarthExplorer(scene_count=args.scenes, file_size=args.file_size, latency=args.latency,
+                           bandwidth=args.bandwidth, error_rate=args.error_rate) as server:
+        with server.patch_config():
+            identifiers = server.identifiers()
+            session, scenes = bench_search(server, identifiers)
+            bench_fill(session, scenes)
+            bench_download(server, identifiers, args.workers, args.segments)
+
+    if args.metrics:
+        print default_metrics().dump_prometheus()
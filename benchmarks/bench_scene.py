@@ -0,0 +1,77 @@
+"""
+Micro-benchmark of Scene records against the plain dictionaries used before: memory of the filled scenes
+and the lookup of the download option of the format. Scenes are filled from the fixtures of the tests,
+no network is used.
+
+    python benchmarks/bench_scene.py [count of scenes]
+"""
+import io
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ee_downloader.scene import Scene
+from ee_downloader.scraper import parse_metadata, parse_download_options
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), '..', 'tests', 'fixtures')
+FORMAT = 'Level-1 GeoTIFF Data Product'
+
+
+def read_fixture(name):
+    with io.open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def fill(scene, i, metadata, options):
+    scene['id'] = 'LC8%013dLGN00' % i
+    scene['preview'] = 'https://ims.cr.usgs.gov/browse/%d.jpg' % i
+    scene['metadata'] = 'https://earthexplorer.usgs.gov/form/metadatalookup/?entity_id=%d' % i
+    scene.update(metadata)
+    scene.update(options)
+    return scene
+
+
+def container_size(scene):
+    """
+    Size of the containers of the scene without the values, which are the same for both kinds.
+    """
+    if isinstance(scene, Scene):
+        return sys.getsizeof(scene) + sys.getsizeof(scene._values)
+    # Keys of the parsed dictionaries are new strings for every scene
+    return sys.getsizeof(scene) + sum(sys.getsizeof(name) for name in scene)
+
+
+def dict_option(scene):
+    return [key for key in scene.keys() if FORMAT in key][0]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 25000
+    metadata_html = read_fixture('metadata.html')
+    options_html = read_fixture('download_options.html')
+
+    def parsed():
+        options = dict((name, url) for name, url, disabled in parse_download_options(options_html) if not disabled)
+        return parse_metadata(metadata_html), options
+
+    dicts = [fill(dict(), i, *parsed()) for i in range(count)]
+    scenes = [fill(Scene(), i, *parsed()) for i in range(count)]
+
+    dict_bytes = sum(container_size(scene) for scene in dicts)
+    scene_bytes = sum(container_size(scene) for scene in scenes)
+    print '{0} scenes with {1} fields'.format(count, len(scenes[0]))
+    print 'dict:   {0:8.1f} MB'.format(dict_bytes / 1024.0 / 1024)
+    print 'Scene:  {0:8.1f} MB ({1:.1f}x)'.format(scene_bytes / 1024.0 / 1024, float(dict_bytes) / scene_bytes)
+
+    dict_time = timeit.timeit(lambda: [dict_option(scene) for scene in dicts], number=1)
+    scene_time = timeit.timeit(lambda: [scene.download_option(FORMAT) for scene in scenes], number=1)
+    print 'Download option lookup of all the scenes:'
+    print 'dict:   {0:8.3f} s'.format(dict_time)
+    print 'Scene:  {0:8.3f} s ({1:.1f}x)'.format(scene_time, dict_time / scene_time)
+
+
+if __name__ == '__main__':
+    main()
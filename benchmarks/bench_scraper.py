@@ -0,0 +1,76 @@
+"""
+Micro-benchmark of the scraper against the BeautifulSoup parsing used before.
+Pages are built from the fixtures of the tests, no network is used.
+
+    python benchmarks/bench_scraper.py [count of scenes]
+"""
+import io
+import os
+import re
+import sys
+import timeit
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ee_downloader.scraper import parse_result_index, parse_metadata, parse_download_options
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), '..', 'tests', 'fixtures')
+
+
+def read_fixture(name):
+    with io.open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def result_index_page(count):
+    html = read_fixture('result_index.html')
+    row = re.search(r'<tr>.*?</tr>', html, re.S).group(0)
+    rows = u''.join(row.replace('LC81370172017096LGN00', 'LC8%013dLGN00' % i) for i in range(count))
+    return html.replace(row, rows, 1)
+
+
+def soup_result_index(html):
+    scene_list = []
+    soup = BeautifulSoup(html, 'html.parser')
+    for imgtag in soup.find_all('img'):
+        scene_list.append({'id': imgtag['class'][0],
+                           'preview': imgtag['src'].replace('/browse/thumbnails/', '/browse/')})
+    return scene_list
+
+
+def soup_metadata(html):
+    metadata = dict()
+    soup = BeautifulSoup(html, 'html.parser')
+    for tr in soup.find_all('tr'):
+        if tr.td is not None:
+            metadata[tr.td.a.string] = tr.td.next_sibling.next_sibling.string
+    return metadata
+
+
+def soup_download_options(html):
+    options = []
+    soup = BeautifulSoup(html, 'html.parser')
+    for input in soup.find_all('input'):
+        onclick = input['onclick'].replace("'", "").replace("window.location=", "")
+        options.append((unicode.strip(input.findNext('div').text), onclick, 'disabled' in input.attrs))
+    return options
+
+
+def bench(name, old, new, html, number):
+    old_time = min(timeit.repeat(lambda: old(html), number=number, repeat=3)) / number
+    new_time = min(timeit.repeat(lambda: new(html), number=number, repeat=3)) / number
+    print '{0:<20} BeautifulSoup {1:10.3f} ms   scraper {2:10.3f} ms   x{3:.1f}'.format(
+        name, old_time * 1000, new_time * 1000, old_time / new_time)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    bench('result index ({0})'.format(count), soup_result_index, lambda html: parse_result_index(html, 12864),
+          result_index_page(count), 3)
+    bench('metadata', soup_metadata, parse_metadata, read_fixture('metadata.html'), 200)
+    bench('download options', soup_download_options, parse_download_options,
+          read_fixture('download_options.html'), 200)
@@ -0,0 +1,47 @@
+"""
+Benchmark of the geometry simplification methods on synthetic coastlines, no network is used.
+
+    python benchmarks/bench_simplify.py [count of vertices...]
+"""
+import math
+import os
+import sys
+import time
+
+import shapely.wkt
+from shapely.geometry import Polygon, MultiPolygon
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ee_downloader import utils
+from ee_downloader.utils import CoordinateConverter, simplify_geom
+
+
+def coastline(points, cx=175, cy=60, radius=4):
+    coords = []
+    for i in range(points):
+        angle = 2 * math.pi * i / points
+        r = radius * (1 + 0.3 * math.sin(7 * angle) + 0.15 * math.sin(53 * angle) + 0.02 * math.sin(997 * angle))
+        x = cx + r * math.cos(angle)
+        coords.append((x - 360 if x > 180 else x, cy + 0.5 * r * math.sin(angle)))
+    return MultiPolygon([Polygon(coords)]).wkt
+
+
+def bench(wkt, method):
+    utils._simplify_cache.clear()
+    start = time.time()
+    result = shapely.wkt.loads(simplify_geom(wkt, 30, method))
+    seconds = time.time() - start
+
+    original = CoordinateConverter.toWorkProj(shapely.wkt.loads(wkt).geoms[0])
+    area = CoordinateConverter.toWorkProj(result).area / original.area
+    print '{0:>8} {1:<8} {2:9.3f} s   {3:3d} points   area x{4:.2f}'.format(
+        len(original.exterior.coords) - 1, method, seconds, len(result.exterior.coords), area)
+
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or [500, 2000, 10000]
+    for size in sizes:
+        wkt = coastline(size)
+        for method in ('buffer', 'bisect'):
+            bench(wkt, method)
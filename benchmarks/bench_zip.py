@@ -0,0 +1,64 @@
+"""
+Benchmark of utils.zip (parallel blocks) against single-threaded zipfile on synthetic band files.
+
+    python benchmarks/bench_zip.py [size of every band in MB] [count of processes]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ee_downloader.packing import write_zip
+
+
+def make_bands(directory, size):
+    filenames = []
+    # Uncompressed rasters: noise over a smooth gradient compresses like real bands
+    row = ''.join(chr((i // 64) % 256) for i in range(64 * 1024))
+    for band in range(1, 5):
+        filename = os.path.join(directory, 'LC08_L1TP_BENCH_B{0}.TIF'.format(band))
+        with open(filename, 'wb') as f:
+            written = 0
+            while written < size:
+                chunk = row[:32 * 1024] + os.urandom(256) + row[32 * 1024:]
+                f.write(chunk)
+                written += len(chunk)
+        filenames.append(filename)
+    jp2 = os.path.join(directory, 'T39UWB_B04.jp2')
+    with open(jp2, 'wb') as f:
+        f.write(os.urandom(size))
+    filenames.append(jp2)
+    return filenames
+
+
+def zipfile_baseline(filenames, archive):
+    zf = zipfile.ZipFile(archive, mode='w', compression=zipfile.ZIP_DEFLATED, allowZip64=True)
+    for filename in filenames:
+        zf.write(filename, os.path.basename(filename))
+    zf.close()
+
+
+def bench(name, func):
+    start = time.time()
+    archive = func()
+    seconds = time.time() - start
+    print '{0:<24} {1:8.2f} s   {2:8.1f} MB'.format(name, seconds, os.path.getsize(archive) / 1024.0 / 1024)
+
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    directory = tempfile.mkdtemp()
+    try:
+        filenames = make_bands(directory, size * 1024 * 1024)
+        baseline = os.path.join(directory, 'baseline.zip')
+        parallel = os.path.join(directory, 'parallel.zip')
+        bench('zipfile', lambda: zipfile_baseline(filenames, baseline) or baseline)
+        bench('write_zip', lambda: write_zip(filenames, parallel, processes=processes) and parallel)
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,128 @@
+__author__ = "NextGIS (info@nextgis.com)"
+__copyright__ = "Copyright (C) NextGIS"
+__license__ = "GPL v.2"
+
+import json
+import sqlite3
+import threading
+import time
+
+import config as downloader_config
+
+
+METADATA = 'metadata'
+DOWNLOAD_OPTIONS = 'options'
+
+
+class MetadataCache(object):
+    """
+    SQLite store of the scene metadata and download options keyed by (product id, entity id).
+
+    Every kind of records has its own TTL: metadata of a scene never changes,
+    but download URLs may expire. When the count of records exceeds max_entries,
+    the least recently used records are evicted. The count is kept by the cache,
+    so the table isn't counted on every write.
+    """
+
+    def __init__(self, path, metadata_ttl=None, options_ttl=None, max_entries=None):
+        """
+        :param path:    path to the SQLite database (':memory:' for in-memory cache)
+        :param metadata_ttl:    lifetime of the metadata in seconds, None for unlimited
+                                (CACHE_METADATA_TTL from config by default)
+        :param options_ttl:    lifetime of the download options in seconds, None for unlimited
+                               (CACHE_OPTIONS_TTL from config by default)
+        :param max_entries:    max count of the records (CACHE_MAX_ENTRIES from config by default)
+        """
+        self.ttl = {
+            METADATA: metadata_ttl if metadata_ttl is not None else downloader_config.CACHE_METADATA_TTL,
+            DOWNLOAD_OPTIONS: options_ttl if options_ttl is not None else downloader_config.CACHE_OPTIONS_TTL
+        }
+        self.max_entries = max_entries if max_entries is not None else downloader_config.CACHE_MAX_ENTRIES
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS scenes ('
+                'product_id TEXT, entity_id TEXT, kind TEXT, data TEXT, created REAL, accessed REAL, '
+                'PRIMARY KEY (product_id, entity_id, kind))')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS scenes_accessed ON scenes (accessed)')
+            self._count = self._connection.execute('SELECT COUNT(*) FROM scenes').fetchone()[0]
+
+    def get(self, product_id, entity_id, kind):
+        """
+        Return the cached dictionary or None if it is absent or expired.
+        """
+        key = (str(product_id), entity_id, kind)
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                'SELECT data, created FROM scenes WHERE product_id = ? AND entity_id = ? AND kind = ?',
+                key).fetchone()
+            if row is None:
+                return None
+
+            data, created = row
+            ttl = self.ttl.get(kind)
+            if ttl is not None and created + ttl < now:
+                deleted = self._connection.execute(
+                    'DELETE FROM scenes WHERE product_id = ? AND entity_id = ? AND kind = ?', key).rowcount
+                self._count -= deleted
+                return None
+
+            self._connection.execute(
+                'UPDATE scenes SET accessed = ? WHERE product_id = ? AND entity_id = ? AND kind = ?',
+                (now,) + key)
+        return json.loads(data)
+
+    def put(self, product_id, entity_id, kind, data):
+        key = (str(product_id), entity_id, kind)
+        now = time.time()
+        with self._lock, self._connection:
+            updated = self._connection.execute(
+                'UPDATE scenes SET data = ?, created = ?, accessed = ? '
+                'WHERE product_id = ? AND entity_id = ? AND kind = ?',
+                (json.dumps(data), now, now) + key).rowcount
+            if not updated:
+                self._connection.execute('INSERT INTO scenes VALUES (?, ?, ?, ?, ?, ?)',
+                                         key + (json.dumps(data), now, now))
+                self._count += 1
+                self._evict()
+
+    def _evict(self):
+        if self._count > self.max_entries:
+            self._count -= self._connection.execute(
+                'DELETE FROM scenes WHERE rowid IN (SELECT rowid FROM scenes ORDER BY accessed LIMIT ?)',
+                (self._count - self.max_entries,)).rowcount
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM scenes')
+            self._count = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._count
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache():
+    """
+    Return the cache stored at CACHE_PATH from config or None if the path isn't set.
+    """
+    global _default_cache
+
+    if not downloader_config.CACHE_PATH:
+        return None
+
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = MetadataCache(downloader_config.CACHE_PATH)
+    return _default_cache
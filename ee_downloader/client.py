@@ -0,0 +1,242 @@
+__author__ = "NextGIS (info@nextgis.com)"
+__copyright__ = "Copyright (C) NextGIS"
+__license__ = "GPL v.2"
+
+import sys
+import threading
+import Queue
+
+from cache import default_cache
+from downloader import download_preview, download_scene, fill_scene, fill_scenes, find_scenes
+from session import EESession, SessionPool
+from workers import DownloadScheduler, HostThrottle, RateLimiter, download_priority
+import config as downloader_config
+
+
+class TimeoutError(RuntimeError):
+    pass
+
+
+class Future(object):
+    """
+    Result of the call running on a worker thread of EEClient.
+    """
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exc_info):
+        """
+        :param exc_info:    sys.exc_info() of the exception raised by the call
+        """
+        self._exc_info = exc_info
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def done(self):
+        return self._done.is_set()
+
+    def _wait(self, timeout):
+        if not self._done.wait(timeout):
+            raise TimeoutError('The call isn\'t finished in {0} seconds'.format(timeout))
+
+    def result(self, timeout=None):
+        """
+        Wait for the call and return its result or re-raise its exception.
+        """
+        self._wait(timeout)
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        self._wait(timeout)
+        return self._exc_info[1] if self._exc_info is not None else None
+
+    def add_done_callback(self, callback):
+        """
+        Call callback(future) when the call is finished (at once if it is finished already).
+        The callback runs in the thread finishing the call.
+        """
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+
+def as_completed(futures, timeout=None):
+    """
+    Yield the futures as soon as they are finished.
+    """
+    futures = list(futures)
+    finished = Queue.Queue()
+    for future in futures:
+        future.add_done_callback(finished.put)
+    for _ in futures:
+        try:
+            yield finished.get(timeout=timeout)
+        except Queue.Empty:
+            raise TimeoutError('The calls aren\'t finished in {0} seconds'.format(timeout))
+
+
+class EEClient(object):
+    """
+    Futures facade of the whole EarthExplorer workflow over the pools of threads of DownloadScheduler:
+    every method returns Future at once and the call runs on a worker thread.
+
+    It isn't an event-driven client: every running call holds its worker thread (and its connection)
+    until it is done, so count of simultaneous requests is bounded by the count of workers,
+    the other calls wait in the queue. Count of submitted and not finished calls is bounded
+    by max_pending: submitting more waits (backpressure), so a producer of thousands of scenes
+    doesn't pile them up in memory.
+
+    All the calls share one logged in session with its pool of keep-alive connections,
+    the workers, the limit of connections per host and the rate limiter of the metadata requests.
+    Searches, metadata requests and previews run on the workers of the interactive class, so they
+    don't wait for the bulk downloads (see DownloadScheduler). Search criteria are the state
+    of the server session, so simultaneous searches run on their own sessions.
+
+        with EEClient(login, password) as client:
+            scenes = client.get_scenes(identifiers, product_name).result()
+            futures = client.download_scenes(scenes, result_dir, tmp_path, product_name, product_format)
+            for future in as_completed(futures):
+                print future.result()
+    """
+
+    def __init__(self, login, password, workers=None, max_per_host=None, max_pending=None, cache=None,
+                 store=None, interactive_workers=None):
+        """
+        :param workers: count of bulk calls running simultaneously (DOWNLOAD_WORKERS from config by default)
+        :param max_per_host:    count of simultaneous connections to one host (MAX_CONNECTIONS_PER_HOST by default)
+        :param max_pending: max count of submitted and not finished calls (CLIENT_MAX_PENDING from config
+                            by default)
+        :param cache:   MetadataCache (the cache at CACHE_PATH from config by default)
+        :param store:   SceneStore of the downloaded files (see downloader.download_scene)
+        :param interactive_workers: count of interactive calls running simultaneously (INTERACTIVE_WORKERS
+                                    from config by default)
+        """
+        self.login = login
+        self.password = password
+        self.workers = workers or downloader_config.DOWNLOAD_WORKERS
+        self.session = EESession(login, password, max(self.workers, downloader_config.SESSION_POOL_SIZE))
+        # Interactive downloads take the connections reserved for them ahead of the bulk ones
+        self.throttle = HostThrottle(max_per_host)
+        self.limiter = RateLimiter()
+        self.cache = cache if cache is not None else default_cache()
+        self.store = store
+
+        # Sessions of the searches and of their sub-queries, a new one is cloned when all of them are busy
+        self._search_sessions = SessionPool(self.session)
+
+        self._pending = threading.BoundedSemaphore(max_pending or downloader_config.CLIENT_MAX_PENDING)
+        self._scheduler = DownloadScheduler(self.workers, interactive_workers)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Call the function on the bulk workers of the client. Return Future of its result.
+        Wait while max_pending calls aren't finished.
+        """
+        return self._submit(downloader_config.PRIORITY_BULK, 0, func, args, kwargs)
+
+    def _submit(self, priority, size, func, args=(), kwargs=None):
+        kwargs = kwargs or {}
+        self._pending.acquire()
+        future = Future()
+
+        def call():
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                self._pending.release()
+                future.set_exception(sys.exc_info())
+            else:
+                self._pending.release()
+                future.set_result(result)
+
+        self._scheduler.submit(priority, size, call)
+        return future
+
+    def _find_scenes(self, identifiers, product_name):
+        return find_scenes(self.session, identifiers, product_name, sessions=self._search_sessions) or []
+
+    def search_scenes(self, identifiers, product_name):
+        """
+        Return Future of the list of the found scenes which contain only id, preview and metadata URLs.
+        """
+        return self._submit(downloader_config.PRIORITY_INTERACTIVE, 0, self._find_scenes, (identifiers, product_name))
+
+    def fill_scene(self, scene, product_name):
+        """
+        Return Future of the scene with its metadata and download options.
+        """
+        return self._submit(downloader_config.PRIORITY_INTERACTIVE, 0, fill_scene,
+                            (self.session, scene, product_name, self.limiter, self.cache))
+
+    def get_scenes(self, identifiers, product_name):
+        """
+        Return Future of the list of the found scenes with their metadata and download options.
+        """
+        def get():
+            scenes = self._find_scenes(identifiers, product_name)
+            for _ in fill_scenes(self.session, scenes, product_name, limiter=self.limiter, cache=self.cache):
+                pass
+            return scenes
+
+        return self._submit(downloader_config.PRIORITY_INTERACTIVE, 0, get)
+
+    def download_preview(self, scene, result_dir):
+        """
+        Return Future of the path to the preview image of the scene (see downloader.download_preview).
+        """
+        return self._submit(downloader_config.PRIORITY_INTERACTIVE, downloader_config.PREVIEW_SIZE,
+                            download_preview, (scene, self.login, self.password, result_dir,
+                                               self.throttle, self.session))
+
+    def download_scene(self, scene, result_dir, tmp_path, product_name, product_format, **kwargs):
+        """
+        Return Future of the path to the downloaded file (None if the scene can't be downloaded,
+        the reason is stored in scene['error']).
+
+        :param kwargs:  other parameters of downloader.download_scene (segments, bands...)
+        """
+        kwargs.setdefault('store', self.store)
+        priority, size = download_priority(product_format, scene)
+        return self._submit(priority, size, download_scene,
+                            (scene, self.login, self.password, result_dir, tmp_path, product_name, product_format,
+                             self.throttle, self.session), kwargs)
+
+    def download_scenes(self, scenes, result_dir, tmp_path, product_name, product_format, **kwargs):
+        """
+        Return list of Future of the downloads of the scenes (see download_scene).
+        """
+        return [self.download_scene(scene, result_dir, tmp_path, product_name, product_format, **kwargs)
+                for scene in scenes]
+
+    def close(self):
+        """
+        Wait for the submitted calls and close the session.
+        """
+        self._scheduler.join()
+        self._search_sessions.close()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -2,6 +2,111 @@ EE_URL = 'https://earthexplorer.usgs.gov'
 AUTH_URL = 'https://ers.cr.usgs.gov/login/'
 MAX_SCENE_COUNT = 25000
 
+# Count of scenes downloaded simultaneously
+DOWNLOAD_WORKERS = 4
+# Count of workers downloading only the interactive class (previews and quick-look images),
+# so they don't wait for the bulk downloads occupying DOWNLOAD_WORKERS
+INTERACTIVE_WORKERS = 2
+# Priority classes of the downloads, the lower class goes first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+# Cap of the total speed of all the downloads in bytes per second (None for unlimited).
+# Interactive downloads take the bandwidth ahead of the bulk ones.
+DOWNLOAD_BANDWIDTH = None
+# Expected size of the preview image of the scene in bytes
+PREVIEW_SIZE = 256 * 1024
+# Count of simultaneous connections to one download host
+MAX_CONNECTIONS_PER_HOST = 4
+# Count of MAX_CONNECTIONS_PER_HOST connections the bulk downloads leave to the interactive ones
+INTERACTIVE_CONNECTIONS_PER_HOST = 1
+# Count of keep-alive connections of the shared session kept for every host
+SESSION_POOL_SIZE = 10
+# Count of scenes which metadata and download options are requested simultaneously
+SEARCH_WORKERS = 8
+# Max count of metadata and download options requests per second
+SEARCH_RATE = 10
+# Count of search sub-queries (every one on its own session) running simultaneously
+SEARCH_PARTITION_WORKERS = 4
+# Count of attempts for every request and delay (in seconds) before the first repeat
+REQUEST_RETRIES = 3
+RETRY_DELAY = 1
+# Max count of requests per second to every endpoint ('host' or 'host/first part of the path')
+SCHEDULER_RATES = {
+    'earthexplorer.usgs.gov/form': 10,
+    'earthexplorer.usgs.gov/result': 10,
+    'earthexplorer.usgs.gov/download': 5,
+}
+# Max count of requests per second to other endpoints
+SCHEDULER_DEFAULT_RATE = 20
+# Share of the initial rate restored by every successful request after the server pushed back
+SCHEDULER_RECOVERY = 0.05
+# Count of consecutive failed requests pausing all the requests and the first pause in seconds
+SCHEDULER_BREAKER_THRESHOLD = 5
+SCHEDULER_BREAKER_PAUSE = 5
+# Max delay in seconds before the repeat of the request (Retry-After included)
+SCHEDULER_MAX_DELAY = 120
+# Max count of scenes waiting between the stages of the streaming download
+PIPELINE_QUEUE_SIZE = 16
+# Max count of calls submitted to EEClient and not finished yet, submitting more waits
+CLIENT_MAX_PENDING = 1000
+# Count of bytes downloaded between the updates of the partial download journal
+JOURNAL_INTERVAL = 8 * 1024 * 1024
+# Size of the buffer for reading the downloaded data in bytes
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Extend the downloaded file to its Content-Length before writing
+DOWNLOAD_PREALLOCATE = False
+# Max count of connections downloading one file (1 disables the segmented download)
+DOWNLOAD_SEGMENTS = 1
+# Segments of the file smaller than this size in bytes aren't split
+SEGMENT_MIN_SIZE = 16 * 1024 * 1024
+# Period in seconds of the speed measurement deciding whether one more segment is added
+SEGMENT_PROBE_INTERVAL = 1.0
+# Min relative gain of the speed from the last added segment to add one more
+SEGMENT_GAIN = 0.1
+# Hash algorithms computed while the file is downloaded
+INTEGRITY_HASHES = ('md5', 'sha256')
+# Check the structure of the archives (tar headers, zip end record) while they are downloaded
+INTEGRITY_WALK_ARCHIVES = True
+
+# Path to SQLite cache of the scene metadata and download options (None disables the cache)
+CACHE_PATH = None
+# Lifetime of the cached metadata and download options in seconds (None for unlimited)
+CACHE_METADATA_TTL = None
+CACHE_OPTIONS_TTL = 24 * 3600
+# Max count of the cached records, the least recently used ones are evicted
+CACHE_MAX_ENTRIES = 100000
+
+# Flush every line of the job manifest to the disk
+MANIFEST_FSYNC = True
+
+# Directory of the scene store shared by the result directories (None disables the store), max total size
+# of its files in bytes (None for unlimited) and methods handing out its files in turn ('reflink', 'hardlink', 'copy')
+STORE_PATH = None
+STORE_MAX_SIZE = None
+STORE_LINK_METHODS = ('reflink', 'hardlink', 'copy')
+
+# Command decompressing gzip to stdout used for the extraction of the archives, e.g. ['pigz', '-d', '-c']
+# (None finds igzip or pigz, [] uses zlib) and count of processes extracting the archives (None for count of CPUs)
+EXTRACT_GZIP_COMMAND = None
+EXTRACT_PROCESSES = None
+
+# Min size in bytes of every Range request reading the remote archive when only its bands are fetched
+SUBSET_BLOCK_SIZE = 64 * 1024
+
+# Extensions of the files stored by utils.zip without compression (compressed TIFF files are found by their tags),
+# size in bytes of the blocks deflated simultaneously, compression level and count of processes
+# deflating the blocks (None for count of CPUs)
+ZIP_STORED_EXTENSIONS = ('.jp2', '.j2k', '.jpg', '.jpeg', '.png', '.gz', '.tgz', '.zip')
+ZIP_BLOCK_SIZE = 4 * 1024 * 1024
+ZIP_COMPRESSION_LEVEL = 6
+ZIP_PROCESSES = None
+
+# Geometry simplification method ('bisect' or 'buffer'), max count of its iterations
+# and count of the memoized results
+SIMPLIFY_METHOD = 'bisect'
+SIMPLIFY_MAX_ITERATIONS = 40
+SIMPLIFY_CACHE_SIZE = 1024
+
 PRODUCTS = {
     'Landsat 8 OLI/TIRS C1 Level-1': {
         'id': 12864,
@@ -18,20 +123,31 @@ PRODUCTS = {
     }
 }
 
+# Download formats: extension of the file, priority class and expected size of the file in bytes
+# (downloads of one class go in the order of the size shown by the download option of every scene,
+# the expected size is used when the option doesn't show it)
 FORMATS = {
     # For Landsat 8
     'LandsatLook Quality Image': {
-        'extension': '.jpg'
+        'extension': '.jpg',
+        'priority': PRIORITY_INTERACTIVE,
+        'size': 5 * 1024 * 1024
     },
     'Level-1 GeoTIFF Data Product': {
-        'extension': '.tar.gz'
+        'extension': '.tar.gz',
+        'priority': PRIORITY_BULK,
+        'size': 1024 * 1024 * 1024
     },
 
     # For Sentinel-2
     'Full Resolution Browse in GeoTIFF format': {
-        'extension': '.tif'
+        'extension': '.tif',
+        'priority': PRIORITY_INTERACTIVE,
+        'size': 30 * 1024 * 1024
     },
     'L1C Tile in JPEG2000 format': {
-        'extension': '.zip'
+        'extension': '.zip',
+        'priority': PRIORITY_BULK,
+        'size': 700 * 1024 * 1024
     }
 }
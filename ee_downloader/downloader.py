@@ -3,32 +3,31 @@ __copyright__ = "Copyright (C) NextGIS"
 __license__ = "GPL v.2"
 
 import os
-import requests
 import json
 import time
-import tempfile
 import shutil
-import re
-
-from bs4 import BeautifulSoup
-
-from utils import check_archive_fast, silent_remove
+import urlparse
+
+from utils import silent_remove
+from integrity import StreamVerifier
+from extract import StreamExtractor, archive_extract_dir, extract_bands, scan_extracted
+from cache import METADATA, DOWNLOAD_OPTIONS, default_cache
+from manifest import JobManifest, SEARCHED, ENRICHED, DOWNLOADING, VERIFIED, FAILED
+from metrics import default_metrics
+from partial import PartialDownload
+from scene import Scene, download_option
+from scraper import parse_result_index, parse_metadata, parse_download_options
+from segmented import SegmentedDownload, probe_ranges
+from session import EESession, SessionPool, get_session_id
+from store import default_store
+from subset import fetch_bands
+from transfer import StreamWriter
+from workers import WorkerPool, DownloadScheduler, HostThrottle, DownloadResults, RateLimiter, default_bandwidth, \
+    download_priority, imap_unordered, pipeline
 import credentials as creds
 import config as downloader_config
 
 
-def get_session_id(s, login, password):
-    response = s.get(downloader_config.AUTH_URL)
-    match = re.search(r'value="(.*?)" id="csrf_token"', response.content)
-    csrf_token = match.group(1)
-
-    payload = {'username': login, 'password': password, 'csrf_token': csrf_token}
-    response = s.post(downloader_config.AUTH_URL, data=payload, allow_redirects=False)
-
-    if response.status_code != 302:
-        raise RuntimeError('Authentication Failed')
-
-
 def set_empty_filter(session):
     payload = {
         'tab': 1,
@@ -91,34 +90,156 @@ def set_dataset_additional_criteria(session, dataset_id, identifiers, product_na
     _ = session.post(downloader_config.EE_URL + '/tabs/save', data=params)
 
 
-def fill_metadata(session, scene):
-    req = session.get(scene['metadata'])
+def _get_cached(cache, product_name, scene, kind):
+    if cache is None or product_name is None:
+        return None
+    return cache.get(downloader_config.PRODUCTS[product_name]['id'], scene['id'], kind)
+
+
+def _put_cached(cache, product_name, scene, kind, data):
+    if cache is not None and product_name is not None:
+        cache.put(downloader_config.PRODUCTS[product_name]['id'], scene['id'], kind, data)
+
+
+def fill_metadata(session, scene, product_name=None, cache=None, limiter=None):
+    """
+    Fill scene metadata. Metadata are taken from the cache if it contains them.
+
+    :param product_name:  name of the product from config (required for the cache)
+    :param cache:  MetadataCache
+    :param limiter:  RateLimiter waited before the request
+    """
+    metrics = default_metrics()
+    metadata = _get_cached(cache, product_name, scene, METADATA)
+    if metadata is not None:
+        metrics.increment('metadata_cache_hits')
+        scene.update(metadata)
+        return
+
+    if limiter is not None:
+        limiter.wait()
+    with metrics.timer('metadata'):
+        req = session.get(scene['metadata'])
+        req.raise_for_status()
+        metadata = parse_metadata(req.text)
+    scene.update(metadata)
+    _put_cached(cache, product_name, scene, METADATA, metadata)
 
-    soup = BeautifulSoup(req.text, 'html.parser')
-    for tr in soup.find_all('tr'):
-        if tr.td is not None:
-            scene[tr.td.a.string] = tr.td.next_sibling.next_sibling.string
 
+def fill_download_options(session, scene, product_name, cache=None, limiter=None):
+    """
+    Fill scene download URLs. Download options are taken from the cache if it contains them.
+
+    :param cache:  MetadataCache
+    :param limiter:  RateLimiter waited before the request
+    """
+    metrics = default_metrics()
+    options = _get_cached(cache, product_name, scene, DOWNLOAD_OPTIONS)
+    if options is not None:
+        metrics.increment('download_options_cache_hits')
+        scene.update(options)
+        return
 
-def fill_download_options(session, scene, product_name):
     product_id = str(downloader_config.PRODUCTS[product_name]['id'])
     headers = {
         'X-Requested-With': 'XMLHttpRequest'
     }
-    req = session.get(downloader_config.EE_URL + '/download/options/' + product_id + '/' + scene['id'], headers=headers)
-
-    soup = BeautifulSoup(req.text, 'html.parser')
-    for input in soup.find_all('input'):
-        onclick = input['onclick']
-        onclick = onclick.replace("'", "")
-        onclick = onclick.replace("window.location=", "")
-        if 'disabled' in input.attrs:
-            print 'Skip download URL ' + onclick
+    if limiter is not None:
+        limiter.wait()
+    with metrics.timer('download_options'):
+        req = session.get(downloader_config.EE_URL + '/download/options/' + product_id + '/' + scene['id'],
+                          headers=headers)
+        req.raise_for_status()
+        parsed_options = parse_download_options(req.text)
+
+    options = dict()
+    for name, url, disabled in parsed_options:
+        if disabled:
+            print 'Skip download URL ' + url
         else:
-            scene[unicode.strip(input.findNext('div').text)] = onclick
+            options[name] = url
+
+    scene.update(options)
+    _put_cached(cache, product_name, scene, DOWNLOAD_OPTIONS, options)
+
+
+def scene_filenames(scene, result_dir, tmp_path, product_name, product_format):
+    """
+    Return the name of the downloaded scene file and the name of its partial file.
+    """
+    scene_identifier_key = downloader_config.PRODUCTS[product_name]['scene_identifier_key']
+    filename = os.path.join(result_dir,
+                            '{name}{extension}'.format(name=scene[scene_identifier_key],
+                                                       extension=downloader_config.FORMATS[product_format][
+                                                           'extension']))
+    # Partial file is kept in the stable place to be resumed by the next call
+    return filename, os.path.join(tmp_path, os.path.basename(filename) + '.part')
+
+
+def _promote(tmp_filename, filename):
+    """
+    Move the file to its place. The file appears under its name only complete,
+    even if it is copied to another file system.
+    """
+    moving_filename = filename + '.moving'
+    shutil.move(tmp_filename, moving_filename)
+    os.rename(moving_filename, filename)
 
 
-def download_scene(scene, login, password, result_dir, tmp_path, product_name, product_format):
+def _extract_scene(scene, filename, extractor=None, bands=None):
+    """
+    Finish the extraction of the bands of the downloaded archive (or extract them from the file
+    if extractor isn't set) and store the result in scene['extracted'].
+    """
+    extract_dir = archive_extract_dir(filename)
+    try:
+        with default_metrics().timer('extract'):
+            if extractor is not None:
+                scene['extracted'] = extractor.close()
+            else:
+                scene['extracted'] = extract_bands(filename, extract_dir, bands)
+    except Exception as e:
+        print 'ERROR: Failed extraction of "{file_name}": {error}'.format(file_name=filename, error=e)
+        scene['error'] = 'Failed extraction: {0}'.format(e)
+        shutil.rmtree(extract_dir, ignore_errors=True)
+
+
+def _discard_extraction(extractor):
+    if extractor is None:
+        return
+    try:
+        extractor.close()
+    except Exception:
+        pass
+    shutil.rmtree(extractor.extract_dir, ignore_errors=True)
+
+
+def _fetch_scene_bands(scene, login, password, url, extension, extract_dir, bands, throttle=None, session=None,
+                       priority=None):
+    """
+    Fetch only the bands of the scene to extract_dir (see subset.fetch_bands). The fetched bytes are accounted
+    in DOWNLOAD_BANDWIDTH from config as the bytes of _download_file are.
+    """
+    if session is None:
+        session = EESession(login, password)
+    if throttle is None:
+        throttle = HostThrottle()
+
+    try:
+        with throttle.acquire(url, priority):
+            scene['extracted'] = fetch_bands(session, url, extension, extract_dir, bands, default_bandwidth(),
+                                             priority)
+    except Exception as e:
+        print 'ERROR: Failed download of bands {bands} to "{dir_name}"'.format(bands=bands, dir_name=extract_dir)
+        scene['error'] = 'Failed download: {0}'.format(e)
+        return None
+    scene['downloaded'] = True
+    print 'Bands are downloaded to "{dir_name}"'.format(dir_name=extract_dir)
+    return extract_dir
+
+
+def download_scene(scene, login, password, result_dir, tmp_path, product_name, product_format, throttle=None,
+                   session=None, segments=None, bands=None, bands_only=False, store=None):
     """
     Download Landsat Scene. Return result filename or None if the scene can't be downloaded.
 
@@ -128,74 +249,224 @@ def download_scene(scene, login, password, result_dir, tmp_path, product_name, p
     :param result_dir:  directory for store the scene archive
     :param tmp_path:  temporary directory for store the scene archive
     :param product_name:  name of the product from config (e.g. 'Landsat 8 OLI/TIRS C1 Level-1' or 'Sentinel-2')
-    :return:    path to the archive or None if an error occurs
+    :param throttle:  HostThrottle limiting simultaneous connections to the download host
+    :param session:  shared EESession (a new one is logged in if it isn't set)
+    :param segments:  max count of connections downloading the file (DOWNLOAD_SEGMENTS from config by default)
+    :param bands:  list of band numbers extracted with _MTL.txt from .tar.gz archive while it is downloaded
+                   to the directory next to the archive (see extract.extract_bands). The result is stored
+                   in scene['extracted']. Nothing is extracted by default.
+    :param bands_only:  fetch only the bands (all the rasters if bands isn't set) and the metadata file
+                        of .tar.gz or .zip archive to the directory named as the archive instead of
+                        the whole archive (see subset.fetch_bands)
+    :param store:  SceneStore shared by the result directories (the store at STORE_PATH from config by default).
+                   The archive is taken from the store if it is there, otherwise it is downloaded to the store.
+                   Then it is linked to result_dir. Workers asking for the same scene wait for the one
+                   downloading it.
+    :return:    path to the archive (to the directory of the bands if bands_only is set) or None
+                if an error occurs (the reason is stored in scene['error'])
     """
     scene_identifier_key = downloader_config.PRODUCTS[product_name]['scene_identifier_key']
     scene_id = scene[scene_identifier_key]
-    filename = os.path.join(result_dir,
-                            '{name}{extension}'.format(name=scene_id,
-                                                       extension=downloader_config.FORMATS[product_format][
-                                                           'extension']))
-    if os.path.isfile(filename):
+    filename, tmp_scene_file = scene_filenames(scene, result_dir, tmp_path, product_name, product_format)
+    extension = downloader_config.FORMATS[product_format]['extension']
+    if bands_only and extension not in ('.tar.gz', '.zip'):
+        print 'Bands can be fetched only from .tar.gz and .zip archives, "{format}" is downloaded as is'.format(
+            format=product_format)
+        bands_only = False
+    if bands is not None and not bands_only and extension != '.tar.gz':
+        print 'Bands can be extracted only from .tar.gz archives, "{format}" is downloaded as is'.format(
+            format=product_format)
+        bands = None
+    if bands_only:
+        extract_dir = archive_extract_dir(filename)
+        if os.path.isdir(extract_dir):
+            scene['extracted'] = scan_extracted(extract_dir, bands)
+            return extract_dir
+    elif os.path.isfile(filename):
+        if bands is not None:
+            _extract_scene(scene, filename, bands=bands)
         return filename
 
-    data_format_keys = [key for key in scene.keys() if product_format in key]
+    if store is None:
+        store = default_store()
+    if store is None or bands_only:
+        return _download_scene(scene, login, password, filename, tmp_scene_file, product_name, product_format,
+                               throttle, session, segments, bands, bands_only)
+
+    store_key = (downloader_config.PRODUCTS[product_name]['id'], scene_id, product_format)
+    with store.lock(*store_key):
+        stored = store.get(*store_key)
+        if stored is None:
+            return _download_scene(scene, login, password, filename, tmp_scene_file, product_name, product_format,
+                                   throttle, session, segments, bands, bands_only, store, store_key)
+        if not _link_stored(scene, store, stored, filename):
+            return None
+    print 'File "{file_name}" is taken from the store'.format(file_name=filename)
+    if bands is not None:
+        _extract_scene(scene, filename, bands=bands)
+    return filename
+
 
-    if data_format_keys:
-        data_format_key = data_format_keys[0]
-    else:
+def _link_stored(scene, store, stored, filename):
+    try:
+        store.link(stored, filename)
+    except (IOError, OSError) as e:
+        print 'ERROR: Failed link of "{stored}" to "{file_name}"'.format(stored=stored, file_name=filename)
+        scene['error'] = 'Failed link from the store: {0}'.format(e)
+        return False
+    scene['stored'] = stored
+    return True
+
+
+def _download_scene(scene, login, password, filename, tmp_scene_file, product_name, product_format, throttle,
+                    session, segments, bands, bands_only, store=None, store_key=None):
+    """
+    Download the scene file to filename (to the store if it is set) after the checks of download_scene.
+    """
+    scene_id = scene[downloader_config.PRODUCTS[product_name]['scene_identifier_key']]
+    extension = downloader_config.FORMATS[product_format]['extension']
+    data_format_key = download_option(scene, product_format)
+    if data_format_key is None:
         print 'Format "{format}" is unavailable for scene "{scene_id}"'.format(format=product_format,
                                                                                scene_id=scene_id)
+        scene['error'] = 'Format is unavailable'
         return None
 
-    if scene[data_format_key]:
+    if scene[data_format_key] and bands_only:
+        return _fetch_scene_bands(scene, login, password, scene[data_format_key], extension,
+                                  archive_extract_dir(filename), bands, throttle, session,
+                                  download_priority(product_format)[0])
+    elif scene[data_format_key]:
         download_url = scene[data_format_key]
-        tmp_scene_file = tempfile.mktemp(dir=tmp_path) + \
-                         downloader_config.FORMATS[product_format]['extension']
+        verifier = StreamVerifier(product_format)
+        extractor = StreamExtractor(archive_extract_dir(filename), bands) if bands is not None else None
         try:
-            _download_file(login, password, download_url, tmp_scene_file)
-        except Exception:
+            writer = _download_file(login, password, download_url, tmp_scene_file, throttle, session,
+                                    verifier=verifier, segments=segments, extractor=extractor,
+                                    priority=download_priority(product_format)[0])
+        except Exception as e:
             print 'ERROR: Failed download "{format}" for scene "{scene_id}"' \
                 .format(format=product_format, scene_id=scene_id)
+            scene['error'] = 'Failed download: {0}'.format(e)
+            _discard_extraction(extractor)
             return None
-        finally:
-            if os.path.isfile(tmp_scene_file):
-                shutil.move(tmp_scene_file, filename)
-            print 'File "{file_name}" is downloaded'.format(file_name=filename)
+        print 'File "{file_name}" is downloaded ({speed:.2f} MB/s)'.format(file_name=tmp_scene_file,
+                                                                          speed=writer.speed / 1024 / 1024)
     else:
         print 'ERROR: No url for "{format}" for scene "{scene_id}"' \
             .format(format=product_format, scene_id=scene_id)
+        scene['error'] = 'No download URL'
         return None
 
-    if check_archive_fast(filename, product_format):
-         scene['downloaded'] = True
-         print 'File "{file_name}" is checked successfully'.format(file_name=filename)
-         return filename
+    # The file is checked while it is downloaded, so it isn't read again
+    with default_metrics().timer('verify'):
+        scene['integrity'] = verifier.result()
+    if scene['integrity']['valid']:
+        if store is None:
+            _promote(tmp_scene_file, filename)
+        elif not _link_stored(scene, store, store.put(*(store_key + (tmp_scene_file,))), filename):
+            _discard_extraction(extractor)
+            return None
+        scene['downloaded'] = True
+        print 'File "{file_name}" is checked successfully'.format(file_name=filename)
+        if extractor is not None:
+            _extract_scene(scene, filename, extractor)
+        return filename
     else:
-         print 'Downloaded file "{file_name}" is broken. The file will be removed.'.format(file_name=filename)
-         silent_remove(filename)
-         return None 
+        print 'Downloaded file "{file_name}" is broken ({errors}). The file will be removed.'.format(
+            file_name=tmp_scene_file, errors='; '.join(scene['integrity']['errors']))
+        scene['error'] = 'Broken file: ' + '; '.join(scene['integrity']['errors'])
+        silent_remove(tmp_scene_file)
+        _discard_extraction(extractor)
+        return None
+
+
+def download_preview(scene, login, password, result_dir, throttle=None, session=None):
+    """
+    Download the preview image of the scene (scene['preview']) to result_dir with the interactive priority,
+    so it isn't slowed down by the bulk downloads. Return the file name or None if the preview
+    can't be downloaded (the reason is stored in scene['error']). The name is stored in scene['preview_file'].
+    """
+    url = scene.get('preview')
+    if not url:
+        scene['error'] = 'No preview URL'
+        return None
+
+    filename = os.path.join(result_dir, os.path.basename(urlparse.urlparse(url).path))
+    if not os.path.isfile(filename):
+        tmp_filename = filename + '.part'
+        try:
+            _download_file(login, password, url, tmp_filename, throttle, session,
+                           priority=downloader_config.PRIORITY_INTERACTIVE)
+        except Exception as e:
+            print 'ERROR: Failed download of the preview "{url}"'.format(url=url)
+            scene['error'] = 'Failed preview download: {0}'.format(e)
+            return None
+        _promote(tmp_filename, filename)
+    scene['preview_file'] = filename
+    return filename
+
 
-def get_scenes(login, password, identifiers, product_name):
+def fill_scene(session, scene, product_name, limiter=None, cache=None):
+    """
+    Fill metadata and download options of the scene. Every request waits for the limiter
+    and is repeated on the network errors by the scheduler of the session. Cached data are used without requests.
+    """
+    fill_metadata(session, scene, product_name, cache, limiter)
+    fill_download_options(session, scene, product_name, cache, limiter)
+    return scene
+
+
+def fill_scenes(session, scenes, product_name, workers=None, limiter=None, cache=None):
+    """
+    Fill metadata and download options of the scenes simultaneously.
+    Scenes are yielded as soon as they are filled.
+
+    :param session:  EESession
+    :param scenes:  scenes found by find_scenes
+    :param product_name:  name of the product from config
+    :param workers:  count of scenes filled simultaneously (SEARCH_WORKERS from config by default)
+    :param limiter:  RateLimiter shared by the requests (SEARCH_RATE requests per second by default)
+    :param cache:  MetadataCache (the cache at CACHE_PATH from config by default)
+    """
+    if limiter is None:
+        limiter = RateLimiter()
+    if cache is None:
+        cache = default_cache()
+
+    return imap_unordered(lambda scene: fill_scene(session, scene, product_name, limiter, cache), scenes, workers)
+
+
+def _search_partition(session, identifiers, product_name):
+    """
+    Search the scenes by at most len(field_identifier_ids) identifiers.
+    If too many scenes are found, the identifiers are split and searched again.
+    """
     product_id = str(downloader_config.PRODUCTS[product_name]['id'])
+    metrics = default_metrics()
 
-    session = requests.session()
-    get_session_id(session, login, password)
-    set_empty_filter(session)
-    set_dataset(session, product_id)
-    set_dataset_additional_criteria(session, product_id, identifiers, product_name)
+    with metrics.timer('search_filter'):
+        set_empty_filter(session)
+        set_dataset(session, product_id)
+        set_dataset_additional_criteria(session, product_id, identifiers, product_name)
 
-    req = session.get('{url}/result/count?collection_id={product_id}&_={time}'
-                      .format(url=downloader_config.EE_URL, product_id=product_id, time=str(int(time.time() * 1000))))
-    dictionary = req.json()
+    with metrics.timer('search_count'):
+        req = session.get('{url}/result/count?collection_id={product_id}&_={time}'
+                          .format(url=downloader_config.EE_URL, product_id=product_id,
+                                  time=str(int(time.time() * 1000))))
+        dictionary = req.json()
 
     scenes_count = int(dictionary.get('collectionCount'))
     print 'Received ' + dictionary.get('collectionCount') + ' scenes'
 
     if scenes_count == 0:
-        return
+        return []
     elif scenes_count > downloader_config.MAX_SCENE_COUNT:
-        raise RuntimeError('Too mach scenes. Modify search criteria')
+        if not identifiers or len(identifiers) == 1:
+            raise RuntimeError('Too mach scenes. Modify search criteria')
+        middle = len(identifiers) // 2
+        return _search_partition(session, identifiers[:middle], product_name) + \
+            _search_partition(session, identifiers[middle:], product_name)
 
     headers = {
         'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
@@ -205,52 +476,261 @@ def get_scenes(login, password, identifiers, product_name):
         'Cache-Control': 'no-cache'
     }
 
-    req = session.post(downloader_config.EE_URL + '/result/index', data='collectionId=' + product_id, headers=headers)
+    with metrics.timer('result_index'):
+        req = session.post(downloader_config.EE_URL + '/result/index', data='collectionId=' + product_id,
+                           headers=headers)
+    with metrics.timer('result_index_parse') as fields:
+        scenes = parse_result_index(req.text, product_id)
+        fields['scenes'] = len(scenes)
+    return scenes
 
-    soup = BeautifulSoup(req.text, 'html.parser')
 
-    scene_list = []
+def search_scenes(session, identifiers, product_name, workers=None, sessions=None):
+    """
+    Search the scenes by any count of identifiers. Yield scenes which contain only id, preview
+    and metadata URLs as soon as every sub-query is done.
+
+    EarthExplorer accepts a few identifiers per query, so the identifiers are split into
+    sub-queries. Search criteria are the state of the server session, so the sub-queries
+    run simultaneously on their own sessions logged in with the same credentials.
+    Scenes found by several sub-queries are yielded once.
+
+    :param session:  EESession (used by the first sub-query)
+    :param workers:  count of simultaneous sub-queries (SEARCH_PARTITION_WORKERS from config by default)
+    :param sessions:  SessionPool the sub-queries take their sessions from, so the sessions are reused
+                      by the next searches. By default the session is cloned only for the sub-queries
+                      running at once, and the clones are closed when the search is done.
+    """
+    identifiers = list(identifiers or [])
+    size = len(downloader_config.PRODUCTS[product_name]['field_identifier_ids'])
+    partitions = [identifiers[i:i + size] for i in range(0, len(identifiers), size)] or [[]]
 
-    for imgtag in soup.find_all('img'):
-        id = imgtag['class']
-        if id is not None:
-            scene = dict()
-            scene['id'] = id[0]
-            scene['preview'] = imgtag['src'].replace('/browse/thumbnails/', '/browse/')
-            scene['metadata'] = downloader_config.EE_URL + '/form/metadatalookup/?collection_id=' + \
-                                product_id + '&entity_id=' + scene['id']
-            scene_list.append(scene)
+    if workers is None:
+        workers = downloader_config.SEARCH_PARTITION_WORKERS
+    workers = max(1, min(workers, len(partitions)))
 
-    for scene in scene_list:
-        fill_metadata(session, scene)
-        fill_download_options(session, scene, product_name)
+    own_sessions = sessions is None
+    if own_sessions:
+        sessions = SessionPool(session)
 
-    return scene_list
+    def search(partition):
+        partition_session = sessions.get()
+        try:
+            return _search_partition(partition_session, partition, product_name)
+        finally:
+            sessions.put(partition_session)
 
+    found = set()
+    try:
+        for scene_list in imap_unordered(search, partitions, workers):
+            for scene in scene_list:
+                if scene['id'] not in found:
+                    found.add(scene['id'])
+                    yield scene
+    finally:
+        if own_sessions:
+            sessions.close()
 
-def _download_file(login, password, url, filename):
-    session = requests.session()
-    get_session_id(session, login, password)
-    r = session.get(url, stream=True)
-    with open(filename, 'wb') as f:
-        for chunk in r.iter_content(chunk_size=1024):
-            if chunk:  # filter out keep-alive new chunks
-                f.write(chunk)
 
+def find_scenes(session, identifiers, product_name, workers=None, sessions=None):
+    """
+    Search the scenes. Return list of scenes which contain only id, preview
+    and metadata URLs or None if nothing is found.
 
-def download_scenes_by_ids(login, password, identifiers, temp_dir, product_name, product_format, result_dir=None):
+    :param sessions:  SessionPool of the sub-queries (see search_scenes)
     """
-    Download Scene by identifiers. Return result array of scenes info.
+    return list(search_scenes(session, identifiers, product_name, workers, sessions)) or None
 
-    :param login:   login
-    :param password:    password
-    :param identifiers: array of scene identifiers
-    :param temp_dir:  temporary directory for store the scene archive
-    :param product_name:  name of the product from config (e.g. 'Landsat 8 OLI/TIRS C1 Level-1' or 'Sentinel-2')
-    :param product_format:  file format name from config (e.g. 'Level-1 GeoTIFF Data Product' or 'LandsatLook Quality Image')
-    :param result_dir:  directory for store the scene archive
-    :return:    array of scenes info
+
+def iter_scenes(login, password, identifiers, product_name, session=None, workers=None, cache=None):
+    """
+    Search the scenes and yield every one as soon as its metadata and download options are filled.
+    Filling starts as soon as the first sub-query of the search is done.
+    """
+    if session is None:
+        session = EESession(login, password)
+
+    scenes = search_scenes(session, identifiers, product_name)
+    for scene in fill_scenes(session, scenes, product_name, workers, cache=cache):
+        yield scene
+
+
+def _record_search(manifest, scenes):
+    for scene in scenes:
+        if manifest.state(scene['id']) is None:
+            manifest.record(scene['id'], SEARCHED, scene)
+        yield scene
+    manifest.finish_search()
+
+
+def _as_scene(scene):
+    # Scenes of the manifest written by the previous run are read as dictionaries
+    return scene if isinstance(scene, Scene) else Scene(scene)
+
+
+def iter_job_scenes(session, identifiers, product_name, manifest, workers=None, cache=None):
+    """
+    Search and fill the scenes recording their states in the job manifest. Yield every scene
+    as soon as it is filled. Scenes found and filled by the previous run of the job are taken
+    from the manifest without requests to the server.
+
+    :param manifest:  JobManifest
+    """
+    if manifest.search_done:
+        found = manifest.scenes()
+    else:
+        found = _record_search(manifest, search_scenes(session, identifiers, product_name))
+
+    limiter = RateLimiter()
+    if cache is None:
+        cache = default_cache()
+
+    def fill(scene):
+        record = manifest.get(scene['id'])
+        if record is not None and record['state'] != SEARCHED:
+            return _as_scene(record['scene'])
+        scene = _as_scene(scene)
+        fill_scene(session, scene, product_name, limiter, cache)
+        manifest.record(scene['id'], ENRICHED, scene)
+        return scene
+
+    return imap_unordered(fill, found, workers)
+
+
+def get_scenes(login, password, identifiers, product_name, session=None, workers=None, cache=None):
+    if session is None:
+        session = EESession(login, password)
+
+    scene_list = find_scenes(session, identifiers, product_name)
+    if scene_list is None:
+        return
+
+    for _ in fill_scenes(session, scene_list, product_name, workers, cache=cache):
+        pass
+
+    return scene_list
+
+
+def _observe_download(url, start, first_byte, size):
+    """
+    Record the duration, the time to the first byte and the speed of the download.
     """
+    metrics = default_metrics()
+    seconds = time.time() - start
+    metrics.observe('download_ttfb', first_byte - start, url=url)
+    metrics.observe('download', seconds, url=url, bytes=size, ttfb=first_byte - start,
+                    speed=size / seconds if seconds else None)
+    metrics.increment('download_bytes', size)
+
+
+def _download_file(login, password, url, filename, throttle=None, session=None, writer=None, verifier=None,
+                   segments=None, extractor=None, priority=None):
+    """
+    Download the file. If the file was partially downloaded before and the server
+    says it isn't changed (same ETag or Last-Modified), the download is resumed by the Range request.
+    The journal of the partial download is removed only when the file is complete.
+
+    :param writer:  StreamWriter copying the data (a new one with the config settings by default)
+    :param verifier:  StreamVerifier checking the data while they are written. When the download is resumed,
+                      the part downloaded before is fed to the verifier from the disk.
+    :param segments:  max count of connections for one file (DOWNLOAD_SEGMENTS from config by default).
+                      Segmented download is used for new files of SEGMENT_MIN_SIZE * 2 bytes and more
+                      if the server supports Range requests. Segments are written out of order,
+                      so the verifier reads the file once after the download.
+    :param extractor:  StreamExtractor receiving the data as the verifier does
+    :param priority:  priority class of the download (PRIORITY_BULK by default). All the downloads share
+                      DOWNLOAD_BANDWIDTH from config, the higher classes take it first (see BandwidthLimiter).
+    :return:    the writer keeping the count of bytes and the achieved speed
+    """
+    if session is None:
+        session = EESession(login, password)
+    if throttle is None:
+        throttle = HostThrottle()
+    if writer is None:
+        writer = StreamWriter()
+
+    if segments is None:
+        segments = downloader_config.DOWNLOAD_SEGMENTS
+    bandwidth = default_bandwidth()
+
+    partial = PartialDownload(filename)
+    start = time.time()
+    if segments > 1 and not partial.offset:
+        with throttle.acquire(url, priority):
+            r, size = probe_ranges(session, url)
+            if size is not None and size >= 2 * downloader_config.SEGMENT_MIN_SIZE:
+                download = SegmentedDownload(session, url, filename, size, segments, bandwidth=bandwidth,
+                                             priority=priority, throttle=throttle)
+                seconds = download.run()
+                writer.bytes += size
+                writer.seconds += seconds
+                _observe_download(url, start, download.first_byte, size)
+                if verifier is not None:
+                    verifier.start(r, size)
+                    verifier.update_from_file(filename, size)
+                if extractor is not None:
+                    extractor.update_from_file(filename, size)
+                return writer
+
+    with throttle.acquire(url, priority):
+        start = time.time()
+        r = session.get(url, stream=True, headers=partial.range_headers())
+        first_byte = time.time()
+        if r.status_code == 416:
+            r.close()
+            if partial.is_complete_by(r):
+                if verifier is not None:
+                    verifier.update_from_file(filename, partial.offset)
+                    verifier.expected_size = partial.size
+                if extractor is not None:
+                    extractor.update_from_file(filename, partial.offset)
+                partial.complete()
+                return writer
+            # The journal doesn't match the remote file (its size is changed or the journal is broken),
+            # so the same Range would be rejected by every attempt. The download starts again.
+            partial.discard()
+            partial = PartialDownload(filename)
+            r = session.get(url, stream=True)
+            first_byte = time.time()
+        r.raise_for_status()
+
+        mode = partial.start(url, r)
+        if verifier is not None:
+            verifier.start(r, partial.size)
+            verifier.update_from_file(filename, partial.offset)
+        if extractor is not None:
+            extractor.update_from_file(filename, partial.offset)
+        state = {'saved_offset': partial.offset, 'started_offset': partial.offset}
+
+        def written(chunk):
+            if bandwidth is not None:
+                bandwidth.transfer(len(chunk), priority)
+            if verifier is not None:
+                verifier.update(chunk)
+            if extractor is not None:
+                extractor.update(chunk)
+            partial.offset += len(chunk)
+            if partial.offset - state['saved_offset'] >= downloader_config.JOURNAL_INTERVAL:
+                f.flush()
+                partial.save()
+                state['saved_offset'] = partial.offset
+
+        with open(filename, mode) as f:
+            f.seek(partial.offset)
+            try:
+                writer.write(r, f, partial.size - partial.offset if partial.size else None, written)
+            finally:
+                f.flush()
+                partial.save()
+
+    if partial.size is not None and partial.offset != partial.size:
+        raise IOError('Incomplete download of "{0}": {1} of {2} bytes'.format(url, partial.offset, partial.size))
+    partial.complete()
+    _observe_download(url, start, first_byte, partial.offset - state['started_offset'])
+    return writer
+
+
+def _check_download_parameters(login, password, identifiers, product_name, product_format):
     if not login:
         raise ValueError('Login should be no empty')
     if not password:
@@ -264,22 +744,233 @@ def download_scenes_by_ids(login, password, identifiers, temp_dir, product_name,
     if not identifiers:
         raise ValueError('Identifiers should be no empty list')
 
+
+def _open_manifest(manifest, identifiers, product_name, product_format):
+    if manifest is None or isinstance(manifest, JobManifest):
+        return manifest
+    job = {'product_name': product_name, 'product_format': product_format, 'identifiers': identifiers}
+    return JobManifest(manifest, job)
+
+
+def _scene_downloader(login, password, result_dir, temp_dir, product_name, product_format, session, throttle,
+                      results, segments=None, manifest=None, bands=None, bands_only=False, store=None):
+    def download(scene_info):
+        if manifest is not None:
+            record = manifest.get(scene_info['id'])
+            if record is not None and record['state'] == VERIFIED and os.path.exists(record['file_name']):
+                scene_info['file_name'] = record['file_name']
+                results.add(scene_info, record['file_name'])
+                return scene_info
+
+            _, tmp_scene_file = scene_filenames(scene_info, result_dir, temp_dir, product_name, product_format)
+            manifest.record(scene_info['id'], DOWNLOADING, offset=PartialDownload(tmp_scene_file).offset)
+
+        filename = None
+        try:
+            filename = download_scene(scene_info, login, password, result_dir, temp_dir, product_name,
+                                      product_format, throttle, session, segments, bands, bands_only, store)
+        except Exception as e:
+            scene_info['error'] = 'Failed download: {0}'.format(e)
+            raise
+        finally:
+            scene_info['file_name'] = filename
+            results.add(scene_info, filename)
+            if manifest is not None:
+                if filename is not None:
+                    manifest.record(scene_info['id'], VERIFIED, scene_info, file_name=filename)
+                else:
+                    manifest.record(scene_info['id'], FAILED, scene_info,
+                                    reason=scene_info.get('error', 'Unknown error'))
+        print scene_info
+        return scene_info
+
+    return download
+
+
+def stream_scenes_by_ids(login, password, identifiers, temp_dir, product_name, product_format, result_dir=None,
+                         workers=None, max_per_host=None, results=None, queue_size=None, segments=None,
+                         manifest=None, bands=None, bands_only=False, store=None):
+    """
+    Download Scene by identifiers while the search results are still being filled.
+    Yield scenes info as soon as every scene is downloaded.
+
+    Search, filling of metadata and download options, and download are separate stages
+    linked by bounded queues, so every scene is downloaded as soon as its download URL is known.
+    Parameters are the same as for download_scenes_by_ids.
+
+    :param queue_size:  max count of scenes waiting between the stages (PIPELINE_QUEUE_SIZE from config by default)
+    """
+    _check_download_parameters(login, password, identifiers, product_name, product_format)
+
     current_result_dir = result_dir if result_dir else temp_dir
 
-    scenes_info = get_scenes(login=login, password=password, identifiers=identifiers, product_name=product_name)
+    session = EESession(login, password, max(workers or downloader_config.DOWNLOAD_WORKERS,
+                                             downloader_config.SESSION_POOL_SIZE))
+    if results is None:
+        results = DownloadResults()
+    manifest = _open_manifest(manifest, identifiers, product_name, product_format)
+    download = _scene_downloader(login, password, current_result_dir, temp_dir, product_name, product_format,
+                                 session, HostThrottle(max_per_host), results, segments, manifest, bands,
+                                 bands_only, store)
+
+    if manifest is not None:
+        scenes = iter_job_scenes(session, identifiers, product_name, manifest)
+    else:
+        scenes = iter_scenes(login=login, password=password, identifiers=identifiers, product_name=product_name,
+                             session=session)
+    for scene_info in pipeline(scenes, download, workers, queue_size):
+        yield scene_info
+
 
-    if scenes_info is None:
+def download_scenes_by_ids(login, password, identifiers, temp_dir, product_name, product_format, result_dir=None,
+                           workers=None, max_per_host=None, results=None, streaming=False, segments=None,
+                           manifest=None, bands=None, bands_only=False, store=None):
+    """
+    Download Scene by identifiers. Return result array of scenes info.
+
+    :param login:   login
+    :param password:    password
+    :param identifiers: array of scene identifiers
+    :param temp_dir:  temporary directory for store the scene archive
+    :param product_name:  name of the product from config (e.g. 'Landsat 8 OLI/TIRS C1 Level-1' or 'Sentinel-2')
+    :param product_format:  file format name from config (e.g. 'Level-1 GeoTIFF Data Product' or 'LandsatLook Quality Image')
+    :param result_dir:  directory for store the scene archive
+    :param workers:  count of scenes downloaded simultaneously (DOWNLOAD_WORKERS from config by default)
+    :param max_per_host:  count of simultaneous connections to one host (MAX_CONNECTIONS_PER_HOST by default)
+    :param results:  DownloadResults receiving (scene, filename) pairs as soon as every scene is processed
+    :param streaming:  start downloading before all search results are filled (see stream_scenes_by_ids).
+                       Scenes are returned in the order they are downloaded.
+    :param segments:  max count of connections downloading one file (DOWNLOAD_SEGMENTS from config by default)
+    :param manifest:  path to the job manifest or JobManifest. States of the scenes are recorded there,
+                      so the job restarted with the same manifest continues where it stopped.
+    :param bands:  list of band numbers extracted from .tar.gz archives while they are downloaded
+                   (see download_scene)
+    :param bands_only:  fetch only the bands and the metadata files instead of the whole archives.
+                        The directories of the bands are returned as the file names (see download_scene).
+    :param store:  SceneStore the archives are taken from and downloaded to (see download_scene)
+    :return:    array of scenes info
+    """
+    _check_download_parameters(login, password, identifiers, product_name, product_format)
+
+    if streaming:
+        return list(stream_scenes_by_ids(login, password, identifiers, temp_dir, product_name, product_format,
+                                         result_dir, workers, max_per_host, results, segments=segments,
+                                         manifest=manifest, bands=bands, bands_only=bands_only, store=store))
+
+    current_result_dir = result_dir if result_dir else temp_dir
+
+    session = EESession(login, password, max(workers or downloader_config.DOWNLOAD_WORKERS,
+                                             downloader_config.SESSION_POOL_SIZE))
+    manifest = _open_manifest(manifest, identifiers, product_name, product_format)
+    if manifest is not None:
+        scenes_info = list(iter_job_scenes(session, identifiers, product_name, manifest))
+    else:
+        scenes_info = get_scenes(login=login, password=password, identifiers=identifiers,
+                                 product_name=product_name, session=session)
+
+    if not scenes_info:
         return []
 
-    for scene_info in scenes_info:
-        filename = download_scene(scene_info, login, password, current_result_dir, temp_dir, product_name,
-                                  product_format)
-        scene_info['file_name'] = filename
-        print scene_info
+    if results is None:
+        results = DownloadResults()
+    download = _scene_downloader(login, password, current_result_dir, temp_dir, product_name, product_format,
+                                 session, HostThrottle(max_per_host), results, segments, manifest, bands,
+                                 bands_only, store)
+
+    with WorkerPool(workers) as pool:
+        for scene_info in scenes_info:
+            pool.submit(download, scene_info)
+    if pool.errors:
+        # Errors of the scenes are stored in them, the first unexpected one stops the job as before
+        raise pool.errors[0]
 
     return scenes_info
 
 
+def _scene_matches(scene, product_name, identifiers):
+    """
+    Check whether the scene is found by one of the identifiers (the search matches them
+    with the parts of the identifiers of the scenes).
+    """
+    scene_identifier_key = downloader_config.PRODUCTS[product_name]['scene_identifier_key']
+    names = [scene.get('id') or '', scene.get(scene_identifier_key) or '']
+    return any(identifier in name for identifier in identifiers for name in names)
+
+
+def download_orders(login, password, jobs, temp_dir, result_dir=None, workers=None, max_per_host=None,
+                    results=None, segments=None, store=None):
+    """
+    Download the scenes of many jobs in one run. Return list of arrays of scenes info in the order of the jobs.
+
+    Identifiers of the jobs of every product are searched together and every scene is filled once,
+    so a scene requested by several jobs (e.g. in several formats) costs one search and one metadata request.
+    A scene requested by several jobs in the same format is downloaded once and its scene info
+    is shared by the jobs. All the jobs use one logged in session, and their downloads share the workers
+    and the limit of connections per host. Downloads start as soon as the scenes are filled.
+
+    Downloads are scheduled by the priority classes and the expected sizes of their formats (see DownloadScheduler),
+    so the quick-look images of all the jobs are ready long before the archives. Interactive downloads
+    go ahead of the bulk ones waiting for a connection to the host (see HostThrottle).
+
+    :param jobs:    list of (product_name, product_format, identifiers)
+    :param workers:  count of files of the bulk formats downloaded simultaneously by all the jobs
+                     (DOWNLOAD_WORKERS from config by default), the interactive ones have INTERACTIVE_WORKERS
+    Other parameters are the same as for download_scenes_by_ids.
+    """
+    jobs = [tuple(job) for job in jobs]
+    if not jobs:
+        raise ValueError('Jobs should be no empty list')
+    for product_name, product_format, identifiers in jobs:
+        _check_download_parameters(login, password, identifiers, product_name, product_format)
+
+    current_result_dir = result_dir if result_dir else temp_dir
+
+    session = EESession(login, password, max(workers or downloader_config.DOWNLOAD_WORKERS,
+                                             downloader_config.SESSION_POOL_SIZE))
+    throttle = HostThrottle(max_per_host)
+    if results is None:
+        results = DownloadResults()
+
+    products = []
+    product_identifiers = {}
+    for product_name, _, identifiers in jobs:
+        if product_name not in product_identifiers:
+            products.append(product_name)
+            product_identifiers[product_name] = []
+        unique = product_identifiers[product_name]
+        unique.extend(identifier for identifier in identifiers if identifier not in unique)
+
+    orders = [[] for _ in jobs]
+    downloaders = {}
+    downloads = {}
+    with DownloadScheduler(workers) as scheduler:
+        for product_name in products:
+            product_jobs = [(i, job) for i, job in enumerate(jobs) if job[0] == product_name]
+            for scene in iter_scenes(login, password, product_identifiers[product_name], product_name,
+                                     session=session):
+                for i, (_, product_format, identifiers) in product_jobs:
+                    if len(product_jobs) > 1 and not _scene_matches(scene, product_name, identifiers):
+                        continue
+
+                    key = (product_name, product_format, scene['id'])
+                    scene_info = downloads.get(key)
+                    if scene_info is None:
+                        # Download of every format changes its own copy (file name, integrity, errors)
+                        scene_info = downloads[key] = scene.copy()
+                        priority, size = download_priority(product_format, scene)
+                        download = downloaders.get((product_name, product_format))
+                        if download is None:
+                            download = downloaders[(product_name, product_format)] = _scene_downloader(
+                                login, password, current_result_dir, temp_dir, product_name, product_format,
+                                session, throttle, results, segments, store=store)
+                        scheduler.submit(priority, size, download, scene_info)
+                    orders[i].append(scene_info)
+    if scheduler.errors:
+        raise scheduler.errors[0]
+
+    return orders
+
+
 if __name__ == "__main__":
     login = creds.login
     password = creds.password
@@ -287,12 +978,14 @@ if __name__ == "__main__":
     product_name = 'Sentinel-2'
     product_format = 'Full Resolution Browse in GeoTIFF format'
 
+    session = EESession(login, password)
     scenes = get_scenes(login=login,
                         password=password,
                         identifiers=[
                             'S2A_OPER_MSI_L1C_TL_SGS__20160716T080034_20160716T113445_A005566_T39UWB_N02_04_01'],
-                        product_name=product_name)
+                        product_name=product_name,
+                        session=session)
 
     for s in scenes:
         print s
-        download_scene(s, login, password, '/tmp/', '/tmp', product_name, product_format)
+        download_scene(s, login, password, '/tmp/', '/tmp', product_name, product_format, session=session)
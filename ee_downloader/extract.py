@@ -0,0 +1,298 @@
+__author__ = "NextGIS (info@nextgis.com)"
+__copyright__ = "Copyright (C) NextGIS"
+__license__ = "GPL v.2"
+
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tarfile
+import threading
+import zipfile
+from distutils.spawn import find_executable
+
+from utils import filename_to_bandnumber
+import config as downloader_config
+
+
+# Decoders of gzip faster than zlib and their arguments for decompressing to stdout
+GZIP_DECODERS = [('igzip', ['-d', '-c']), ('pigz', ['-d', '-c'])]
+
+
+def gzip_decoder():
+    """
+    Return the command decompressing gzip file to stdout (EXTRACT_GZIP_COMMAND from config
+    or the first installed of GZIP_DECODERS) or None if zlib should be used.
+    """
+    if downloader_config.EXTRACT_GZIP_COMMAND is not None:
+        return list(downloader_config.EXTRACT_GZIP_COMMAND) or None
+    for name, args in GZIP_DECODERS:
+        path = find_executable(name)
+        if path is not None:
+            return [path] + args
+    return None
+
+
+def _requested(name, bands):
+    """
+    Return (kind, band number) if the member should be extracted: kind is 'meta' for the metadata
+    file (_MTL.txt of Landsat or MTD_MSI*.xml of Sentinel-2) and 'band' for the rasters (.TIF or .jp2,
+    band number is None for QA rasters). Otherwise return None.
+    """
+    if name.endswith('_MTL.txt') or (name.startswith('MTD_MSI') and name.endswith('.xml')):
+        return 'meta', None
+    if name.upper().endswith(('.TIF', '.JP2')) and '_' in name:
+        number = filename_to_bandnumber(name)
+        if bands is None or number in bands:
+            return 'band', number
+    return None
+
+
+def _new_result():
+    return {'meta': None, 'bands': {}, 'files': []}
+
+
+def _add_file(result, filename, requested):
+    result['files'].append(filename)
+    kind, number = requested
+    if kind == 'meta':
+        result['meta'] = filename
+    elif number is not None:
+        result['bands'][number] = filename
+
+
+def _is_complete(result, bands):
+    return bands is not None and result['meta'] is not None and all(band in result['bands'] for band in bands)
+
+
+def _extract_stream(archive, extract_dir, bands):
+    result = _new_result()
+    for member in archive:
+        if not member.isfile():
+            continue
+        name = os.path.basename(member.name)
+        requested = _requested(name, bands)
+        if requested is None:
+            continue
+
+        filename = os.path.join(extract_dir, name)
+        source = archive.extractfile(member)
+        with open(filename, 'wb') as f:
+            shutil.copyfileobj(source, f, downloader_config.DOWNLOAD_CHUNK_SIZE)
+        _add_file(result, filename, requested)
+
+        if _is_complete(result, bands):
+            # Everything is found, the rest of the archive isn't decompressed
+            break
+    return result
+
+
+def extract_zip_members(source, extract_dir, bands=None):
+    """
+    Extract the requested bands and the metadata file of .zip archive. Only the central directory
+    and the requested members are read, so source may be a remote file (see subset.RangeFile).
+    CRC of every extracted member is checked by zipfile.
+
+    :param source:  path to the archive or seekable file object
+    :return:    the same dictionary as extract_bands returns
+    """
+    if not os.path.isdir(extract_dir):
+        os.makedirs(extract_dir)
+    if bands is not None:
+        bands = set(bands)
+
+    result = _new_result()
+    archive = zipfile.ZipFile(source)
+    try:
+        for info in archive.infolist():
+            name = os.path.basename(info.filename)
+            requested = _requested(name, bands) if name else None
+            if requested is None:
+                continue
+
+            filename = os.path.join(extract_dir, name)
+            source_member = archive.open(info)
+            try:
+                with open(filename, 'wb') as f:
+                    shutil.copyfileobj(source_member, f, downloader_config.DOWNLOAD_CHUNK_SIZE)
+            finally:
+                source_member.close()
+            _add_file(result, filename, requested)
+    finally:
+        archive.close()
+    return result
+
+
+def scan_extracted(extract_dir, bands=None):
+    """
+    Return the result of the extraction done before (the same dictionary as extract_bands returns)
+    from the files of the directory.
+    """
+    if bands is not None:
+        bands = set(bands)
+    result = _new_result()
+    for name in sorted(os.listdir(extract_dir)):
+        filename = os.path.join(extract_dir, name)
+        requested = _requested(name, bands)
+        if requested is not None and os.path.isfile(filename):
+            _add_file(result, filename, requested)
+    return result
+
+
+def extract_bands(source, extract_dir, bands=None, decoder=None):
+    """
+    Extract the requested bands and the _MTL.txt file of Landsat .tar.gz archive in one pass,
+    without listing the archive before. Members are written as soon as they are decompressed.
+
+    :param source:  path to the archive or file object with the gzipped data (e.g. response.raw)
+    :param extract_dir: directory for the extracted files (created if it doesn't exist)
+    :param bands:   list of band numbers (all the rasters by default)
+    :param decoder: command decompressing gzip to stdout (see gzip_decoder) used for the files,
+                    gzip_decoder() by default
+    :return:    dictionary with 'meta' (path to _MTL.txt), 'bands' ({band number: path})
+                and 'files' (all the extracted files)
+    """
+    if not os.path.isdir(extract_dir):
+        os.makedirs(extract_dir)
+    if bands is not None:
+        bands = set(bands)
+
+    if not isinstance(source, basestring):
+        archive = tarfile.open(fileobj=source, mode='r|gz')
+        try:
+            return _extract_stream(archive, extract_dir, bands)
+        finally:
+            archive.close()
+
+    if decoder is None:
+        decoder = gzip_decoder()
+    if not decoder:
+        archive = tarfile.open(source, mode='r|gz')
+        try:
+            return _extract_stream(archive, extract_dir, bands)
+        finally:
+            archive.close()
+
+    process = subprocess.Popen(decoder + [source], stdout=subprocess.PIPE)
+    try:
+        archive = tarfile.open(fileobj=process.stdout, mode='r|')
+        result = _extract_stream(archive, extract_dir, bands)
+        archive.close()
+    finally:
+        # The decoder may still be writing the part of the archive which isn't needed
+        if process.poll() is None:
+            process.kill()
+        process.stdout.close()
+        process.wait()
+    return result
+
+
+def _extract_task(args):
+    return extract_bands(*args)
+
+
+def archive_extract_dir(archive, extract_root=None):
+    """
+    Return the directory for the files of the archive: directory named as the archive
+    without the extension in extract_root (in the directory of the archive by default).
+    """
+    name = os.path.basename(archive)
+    for extension in ('.tar.gz', '.tgz', '.tar', '.zip'):
+        if name.endswith(extension):
+            name = name[:-len(extension)]
+            break
+    return os.path.join(extract_root or os.path.dirname(archive), name)
+
+
+def extract_archives(archives, extract_root=None, bands=None, processes=None):
+    """
+    Extract the bands of many archives on a pool of processes.
+    Return list of the results of extract_bands in the order of the archives.
+
+    :param extract_root:    directory for the directories of the archives (see archive_extract_dir)
+    :param processes:   count of processes (EXTRACT_PROCESSES from config or count of CPUs by default)
+    """
+    if processes is None:
+        processes = downloader_config.EXTRACT_PROCESSES
+    tasks = [(archive, archive_extract_dir(archive, extract_root), bands) for archive in archives]
+
+    if processes == 1 or len(tasks) <= 1:
+        return [_extract_task(task) for task in tasks]
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(_extract_task, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+
+class StreamExtractor(object):
+    """
+    Extract the bands while the archive is downloaded.
+
+    The chunks passed to update() (e.g. by the callback of StreamWriter) are written to a pipe
+    as they are, memoryview of the reused buffer included, so they aren't copied to new strings.
+    The data are decompressed and the requested members are written by a separate thread reading
+    the pipe, so the download doesn't wait for the extraction unless the pipe is full.
+    """
+
+    def __init__(self, extract_dir, bands=None):
+        """
+        :param extract_dir: directory for the extracted files
+        :param bands:   list of band numbers (all the rasters by default)
+        """
+        self.extract_dir = extract_dir
+        self.bands = bands
+        self.result = None
+        self.error = None
+
+        read_fd, write_fd = os.pipe()
+        self._reader = os.fdopen(read_fd, 'rb')
+        self._writer = os.fdopen(write_fd, 'wb', 0)
+        self._done = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self.result = extract_bands(self._reader, self.extract_dir, self.bands)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._done = True
+            # The rest of the archive isn't needed, but the writer shouldn't block on the full pipe
+            while self._reader.read(downloader_config.DOWNLOAD_CHUNK_SIZE):
+                pass
+            self._reader.close()
+
+    def update(self, chunk):
+        if self._done:
+            return
+        self._writer.write(chunk)
+
+    def update_from_file(self, filename, length):
+        """
+        Feed the first bytes of the file, e.g. the part downloaded before the resumed download.
+        """
+        if length <= 0:
+            return
+        with open(filename, 'rb') as f:
+            while length > 0 and not self._done:
+                chunk = f.read(min(length, downloader_config.DOWNLOAD_CHUNK_SIZE))
+                if not chunk:
+                    break
+                self.update(chunk)
+                length -= len(chunk)
+
+    def close(self):
+        """
+        Wait for the extraction of the fed data. Return the result of extract_bands
+        or raise the error of the extraction.
+        """
+        self._writer.close()
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.result
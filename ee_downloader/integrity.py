@@ -0,0 +1,244 @@
+__author__ = "NextGIS (info@nextgis.com)"
+__copyright__ = "Copyright (C) NextGIS"
+__license__ = "GPL v.2"
+
+import base64
+import binascii
+import hashlib
+import zlib
+
+import config as downloader_config
+
+
+TAR_BLOCK_SIZE = 512
+ZIP_LOCAL_HEADER = 'PK\x03\x04'
+ZIP_END_OF_CENTRAL_DIRECTORY = 'PK\x05\x06'
+# End of central directory record (22 bytes) and the max length of the zip comment
+ZIP_TAIL_SIZE = 22 + 65535
+
+
+def published_checksums(headers):
+    """
+    Extract checksums published by the server from the response headers
+    (Content-MD5 and RFC 3230 Digest). Return dictionary {algorithm: hex digest}.
+    """
+    checksums = {}
+
+    content_md5 = headers.get('Content-MD5')
+    if content_md5:
+        try:
+            checksums['md5'] = binascii.hexlify(base64.b64decode(content_md5))
+        except (TypeError, binascii.Error):
+            pass
+
+    for digest in headers.get('Digest', '').split(','):
+        algorithm, _, value = digest.strip().partition('=')
+        algorithm = algorithm.lower().replace('-', '')
+        if algorithm in ('md5', 'sha256') and value:
+            try:
+                checksums[algorithm] = binascii.hexlify(base64.b64decode(value))
+            except (TypeError, binascii.Error):
+                pass
+
+    return checksums
+
+
+def _bytes(chunk):
+    # zlib and the string operations of Python 2 don't take memoryview
+    return chunk.tobytes() if isinstance(chunk, memoryview) else chunk
+
+
+class TarGzWalker(object):
+    """
+    Check the gzip stream and the headers of every tar member while the data are coming.
+    """
+
+    def __init__(self):
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._buffer = ''
+        self._skip = 0
+        self.members = 0
+        self.finished = False
+        self.error = None
+
+    def update(self, chunk):
+        if self.error is not None:
+            return
+        try:
+            self._parse(self._decompressor.decompress(_bytes(chunk)))
+        except zlib.error as e:
+            self.error = 'Broken gzip stream: {0}'.format(e)
+
+    def _parse(self, data):
+        if self.finished:
+            return
+
+        if self._skip:
+            skipped = min(self._skip, len(data))
+            self._skip -= skipped
+            data = data[skipped:]
+
+        self._buffer += data
+        while not self._skip and len(self._buffer) >= TAR_BLOCK_SIZE:
+            header = self._buffer[:TAR_BLOCK_SIZE]
+            self._buffer = self._buffer[TAR_BLOCK_SIZE:]
+
+            if header == '\0' * TAR_BLOCK_SIZE:
+                self.finished = True
+                self._buffer = ''
+                return
+
+            try:
+                checksum = int(header[148:156].strip(' \0') or '0', 8)
+                size = int(header[124:136].strip(' \0') or '0', 8)
+            except ValueError:
+                self.error = 'Broken tar header of member {0}'.format(self.members + 1)
+                return
+            calculated = sum(bytearray(header[:148])) + 8 * ord(' ') + sum(bytearray(header[156:]))
+            if checksum != calculated:
+                self.error = 'Wrong checksum of tar header of member {0}'.format(self.members + 1)
+                return
+
+            self.members += 1
+            # Member data are padded to the whole count of blocks
+            self._skip = (size + TAR_BLOCK_SIZE - 1) // TAR_BLOCK_SIZE * TAR_BLOCK_SIZE
+            skipped = min(self._skip, len(self._buffer))
+            self._skip -= skipped
+            self._buffer = self._buffer[skipped:]
+
+    def result(self):
+        if self.error is not None:
+            return False, self.error
+        if not self.finished:
+            return False, 'Unexpected end of tar archive'
+        return True, '{0} members'.format(self.members)
+
+
+class MagicWalker(object):
+    """
+    Check the signatures at the beginning and (optionally) at the end of the file.
+    """
+
+    def __init__(self, heads, tail=None, tail_size=None):
+        self.heads = heads
+        self.tail = tail
+        self.tail_size = tail_size or (len(tail) if tail else 0)
+        self._head = ''
+        self._tail = ''
+
+    def update(self, chunk):
+        head_size = max(len(head) for head in self.heads)
+        if len(self._head) < head_size:
+            self._head += _bytes(chunk[:head_size - len(self._head)])
+        if self.tail_size:
+            # Only the end of the chunk is copied
+            self._tail = (self._tail + _bytes(chunk[-self.tail_size:]))[-self.tail_size:]
+
+    def result(self):
+        if not any(self._head.startswith(head) for head in self.heads):
+            return False, 'Unknown file signature'
+        if self.tail and self.tail not in self._tail:
+            return False, 'File end is not found'
+        return True, 'Signature is correct'
+
+
+def archive_walker(product_format):
+    """
+    Return the walker checking the structure of the file of the format or None if the format is unknown.
+    """
+    extension = downloader_config.FORMATS.get(product_format, {}).get('extension')
+    if extension == '.tar.gz':
+        return TarGzWalker()
+    if extension == '.zip':
+        return MagicWalker([ZIP_LOCAL_HEADER], ZIP_END_OF_CENTRAL_DIRECTORY, ZIP_TAIL_SIZE)
+    if extension == '.jpg':
+        return MagicWalker(['\xff\xd8'], '\xff\xd9', 2)
+    if extension == '.tif':
+        return MagicWalker(['II*\0', 'MM\0*', 'II+\0', 'MM\0+'])
+    return None
+
+
+class StreamVerifier(object):
+    """
+    Verify the downloaded file inline, while the bytes stream through the writer.
+
+    The data are hashed incrementally and compared with the checksums published by the server,
+    the size is compared with Content-Length and the structure of the archive is walked
+    without reading the finished file again.
+    """
+
+    def __init__(self, product_format=None, algorithms=None, walk_archive=None):
+        """
+        :param product_format:  file format name from config (defines the archive check)
+        :param algorithms:  hash algorithms (INTEGRITY_HASHES from config by default)
+        :param walk_archive:  check the structure of the archive (INTEGRITY_WALK_ARCHIVES from config by default)
+        """
+        if algorithms is None:
+            algorithms = downloader_config.INTEGRITY_HASHES
+        if walk_archive is None:
+            walk_archive = downloader_config.INTEGRITY_WALK_ARCHIVES
+
+        self.hashes = dict((algorithm, hashlib.new(algorithm)) for algorithm in algorithms)
+        self.walker = archive_walker(product_format) if walk_archive else None
+        self.size = 0
+        self.expected_size = None
+        self.checksums = {}
+
+    def start(self, response, size=None):
+        """
+        Take the expected size and the published checksums of the whole file from the response.
+        Content-MD5 of the partial response (206) is the checksum of the part, so it is ignored.
+        """
+        headers = response.headers
+        if response.status_code == 206:
+            headers = {'Digest': headers.get('Digest', '')}
+
+        self.expected_size = size
+        self.checksums = published_checksums(headers)
+
+    def update(self, chunk):
+        # hashlib takes memoryview of the buffer of the writer as it is
+        self.size += len(chunk)
+        for h in self.hashes.values():
+            h.update(chunk)
+        if self.walker is not None:
+            self.walker.update(chunk)
+
+    def update_from_file(self, filename, length):
+        """
+        Feed the first bytes of the file, e.g. the part downloaded before the resumed download.
+        """
+        if length <= 0:
+            return
+        with open(filename, 'rb') as f:
+            while length > 0:
+                chunk = f.read(min(length, downloader_config.DOWNLOAD_CHUNK_SIZE))
+                if not chunk:
+                    break
+                self.update(chunk)
+                length -= len(chunk)
+
+    def result(self):
+        """
+        Return dictionary with the size, the digests and the results of every check.
+        'valid' is False if any check fails.
+        """
+        result = {'size': self.size, 'errors': []}
+        for algorithm, h in self.hashes.items():
+            result[algorithm] = h.hexdigest()
+
+        if self.expected_size is not None and self.size != self.expected_size:
+            result['errors'].append('Size {0} differs from expected {1}'.format(self.size, self.expected_size))
+
+        for algorithm, checksum in self.checksums.items():
+            if algorithm in result and result[algorithm] != checksum:
+                result['errors'].append('{0} checksum differs from published one'.format(algorithm))
+
+        if self.walker is not None:
+            success, message = self.walker.result()
+            result['archive'] = message
+            if not success:
+                result['errors'].append(message)
+
+        result['valid'] = not result['errors']
+        return result
@@ -0,0 +1,167 @@
+__author__ = "NextGIS (info@nextgis.com)"
+__copyright__ = "Copyright (C) NextGIS"
+__license__ = "GPL v.2"
+
+import os
+import json
+import threading
+import time
+
+from scene import json_default
+import config as downloader_config
+
+
+SEARCHED = 'searched'
+ENRICHED = 'enriched'
+DOWNLOADING = 'downloading'
+VERIFIED = 'verified'
+FAILED = 'failed'
+
+_SEARCH_DONE = 'search_done'
+
+
+class JobManifest(object):
+    """
+    Append-only JSONL log of the download job.
+
+    The first line describes the job (product, format, identifiers). Every next line is
+    the new state of one scene: searched, enriched (metadata and download options are filled),
+    downloading (with the offset of the partial file), verified (with the file name) or
+    failed (with the reason). The scene dictionary is stored with the searched and enriched states,
+    so a restarted job takes the scenes from the manifest instead of the server.
+    The latest line of every scene wins, broken last line (the process died while writing it) is ignored.
+    """
+
+    def __init__(self, path, job=None, fsync=None):
+        """
+        :param path:    path to the manifest file (created if it doesn't exist)
+        :param job:     dictionary describing the job. If the manifest exists, it should describe the same job.
+        :param fsync:   flush every line to the disk (MANIFEST_FSYNC from config by default)
+        """
+        self.path = path
+        self.job = job
+        self.fsync = downloader_config.MANIFEST_FSYNC if fsync is None else fsync
+        self.search_done = False
+
+        self._lock = threading.Lock()
+        self._records = {}
+        self._order = []
+
+        exists = os.path.isfile(path)
+        if exists:
+            self._load()
+        self._file = open(path, 'a')
+        if not exists:
+            self._write({'job': job})
+
+    def _load(self):
+        with open(self.path) as f:
+            lines = f.readlines()
+
+        valid_size = 0
+        for i, line in enumerate(lines):
+            try:
+                if not line.endswith('\n'):
+                    raise ValueError('Line is not finished')
+                record = json.loads(line)
+            except ValueError:
+                if i == len(lines) - 1:
+                    # Next lines shouldn't be appended to the broken one
+                    with open(self.path, 'r+') as f:
+                        f.truncate(valid_size)
+                    break
+                raise ValueError('Manifest "{0}" is broken at line {1}'.format(self.path, i + 1))
+            valid_size += len(line)
+
+            if 'job' in record:
+                if self.job is not None and record['job'] is not None and record['job'] != self.job:
+                    raise ValueError('Manifest "{0}" belongs to another job'.format(self.path))
+                continue
+            if record.get('state') == _SEARCH_DONE:
+                self.search_done = True
+                continue
+            self._apply(record)
+
+    def _apply(self, record):
+        scene_id = record['id']
+        previous = self._records.get(scene_id)
+        if previous is None:
+            self._order.append(scene_id)
+        elif 'scene' not in record and 'scene' in previous:
+            record['scene'] = previous['scene']
+        self._records[scene_id] = record
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, default=json_default) + '\n')
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def record(self, scene_id, state, scene=None, **fields):
+        """
+        Append the new state of the scene.
+
+        :param scene:   scene dictionary stored with the state
+        :param fields:  additional data of the state (offset, file_name, reason...)
+        """
+        record = dict(fields)
+        record['id'] = scene_id
+        record['state'] = state
+        record['time'] = time.time()
+        if scene is not None:
+            record['scene'] = scene
+        with self._lock:
+            self._write(record)
+            self._apply(dict(record))
+
+    def finish_search(self):
+        with self._lock:
+            self._write({'state': _SEARCH_DONE, 'time': time.time()})
+            self.search_done = True
+
+    def get(self, scene_id):
+        """
+        Return the latest record of the scene or None.
+        """
+        with self._lock:
+            record = self._records.get(scene_id)
+            return dict(record) if record is not None else None
+
+    def state(self, scene_id):
+        record = self.get(scene_id)
+        return record['state'] if record is not None else None
+
+    def scenes(self, state=None):
+        """
+        Return the stored scene dictionaries in the order they were found.
+
+        :param state:   return only the scenes in this state
+        """
+        with self._lock:
+            return [self._records[scene_id]['scene'] for scene_id in self._order
+                    if 'scene' in self._records[scene_id] and
+                    (state is None or self._records[scene_id]['state'] == state)]
+
+    def compact(self):
+        """
+        Rewrite the manifest keeping only the latest record of every scene.
+        """
+        with self._lock:
+            tmp_path = self.path + '.tmp'
+            try:
+                with open(tmp_path, 'w') as f:
+                    f.write(json.dumps({'job': self.job}) + '\n')
+                    for scene_id in self._order:
+                        f.write(json.dumps(self._records[scene_id], default=json_default) + '\n')
+                    if self.search_done:
+                        f.write(json.dumps({'state': _SEARCH_DONE, 'time': time.time()}) + '\n')
+            except Exception:
+                os.remove(tmp_path)
+                raise
+            self._file.close()
+            os.rename(tmp_path, self.path)
+            self._file = open(self.path, 'a')
+
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,160 @@
+__author__ = "NextGIS (info@nextgis.com)"
+__copyright__ = "Copyright (C) NextGIS"
+__license__ = "GPL v.2"
+
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+
+PROMETHEUS_PREFIX = 'ee_downloader_'
+
+
+class Timing(object):
+    """
+    Summary of the durations of one stage.
+    """
+    __slots__ = ('count', 'sum', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def as_dict(self):
+        return {'count': self.count, 'sum': self.sum, 'min': self.min, 'max': self.max,
+                'avg': self.sum / self.count if self.count else None}
+
+
+class Metrics(object):
+    """
+    Timings of the stages of the download (login, search, metadata, download...) and counters.
+
+    Every observation is passed to the hooks as a dictionary with 'name', 'seconds' and the fields
+    given by the caller (e.g. bytes and time to first byte of the download). Accumulated values
+    are exported as JSON or in Prometheus text format.
+    """
+
+    def __init__(self):
+        self._timings = {}
+        self._counters = {}
+        self._hooks = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        """
+        :param hook:    function called with the dictionary of every observation
+        """
+        with self._lock:
+            self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        with self._lock:
+            self._hooks.remove(hook)
+
+    def observe(self, name, seconds, **fields):
+        """
+        Record the duration of the stage.
+        """
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = self._timings[name] = Timing()
+            timing.add(seconds)
+            hooks = list(self._hooks)
+
+        if hooks:
+            event = dict(fields)
+            event['name'] = name
+            event['seconds'] = seconds
+            for hook in hooks:
+                hook(event)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    @contextmanager
+    def timer(self, name, **fields):
+        """
+        Measure the duration of the block. The yielded dictionary of fields may be filled
+        inside the block. If the block raises an exception, '<name>_errors' counter is incremented instead.
+        """
+        start = time.time()
+        try:
+            yield fields
+        except Exception:
+            self.increment(name + '_errors')
+            raise
+        self.observe(name, time.time() - start, **fields)
+
+    def timing(self, name):
+        """
+        Return the summary of the stage as dictionary or None.
+        """
+        with self._lock:
+            timing = self._timings.get(name)
+            return timing.as_dict() if timing is not None else None
+
+    def counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def reset(self):
+        with self._lock:
+            self._timings.clear()
+            self._counters.clear()
+
+    def as_dict(self):
+        with self._lock:
+            return {'timings': dict((name, timing.as_dict()) for name, timing in self._timings.items()),
+                    'counters': dict(self._counters)}
+
+    def dump_json(self, f=None):
+        """
+        Return the metrics as JSON string or write them to the file object.
+        """
+        if f is None:
+            return json.dumps(self.as_dict(), indent=2, sort_keys=True)
+        json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+
+    def dump_prometheus(self):
+        """
+        Return the metrics in Prometheus text exposition format: timings are summaries
+        '<name>_seconds' (with _count and _sum), counters are '<name>_total'.
+        """
+        data = self.as_dict()
+        lines = []
+        for name, timing in sorted(data['timings'].items()):
+            metric = _prometheus_name(name) + '_seconds'
+            lines.append('# TYPE {0} summary'.format(metric))
+            lines.append('{0}_count {1}'.format(metric, timing['count']))
+            lines.append('{0}_sum {1!r}'.format(metric, timing['sum']))
+        for name, value in sorted(data['counters'].items()):
+            metric = _prometheus_name(name) + '_total'
+            lines.append('# TYPE {0} counter'.format(metric))
+            lines.append('{0} {1!r}'.format(metric, value))
+        return '\n'.join(lines) + '\n'
+
+
+def _prometheus_name(name):
+    return PROMETHEUS_PREFIX + re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+_default_metrics = Metrics()
+
+
+def default_metrics():
+    """
+    Return the metrics shared by all the downloads of the process.
+    """
+    return _default_metrics
@@ -0,0 +1,324 @@
+__author__ = "NextGIS (info@nextgis.com)"
+__copyright__ = "Copyright (C) NextGIS"
+__license__ = "GPL v.2"
+
+import collections
+import multiprocessing
+import os
+import struct
+import threading
+import time
+import zipfile
+import zlib
+
+import config as downloader_config
+
+
+# TIFF compression tag and the value of the uncompressed data
+_TIFF_COMPRESSION = 259
+_TIFF_UNCOMPRESSED = 1
+
+_DATA_DESCRIPTOR = 'PK\x07\x08'
+
+
+def tiff_compression(filename):
+    """
+    Return the value of Compression tag of the first image of TIFF or BigTIFF file
+    or None if the file isn't TIFF or the tag isn't found.
+    """
+    try:
+        with open(filename, 'rb') as f:
+            header = f.read(16)
+            byte_order = {'II': '<', 'MM': '>'}.get(header[:2])
+            if byte_order is None:
+                return None
+            magic = struct.unpack(byte_order + 'H', header[2:4])[0]
+            if magic == 42:
+                ifd_offset = struct.unpack(byte_order + 'I', header[4:8])[0]
+                count_format, entry_size, value_offset = 'H', 12, 8
+            elif magic == 43:
+                ifd_offset = struct.unpack(byte_order + 'Q', header[8:16])[0]
+                count_format, entry_size, value_offset = 'Q', 20, 12
+            else:
+                return None
+
+            f.seek(ifd_offset)
+            count_size = struct.calcsize(count_format)
+            count = struct.unpack(byte_order + count_format, f.read(count_size))[0]
+            entries = f.read(count * entry_size)
+    except (IOError, struct.error):
+        return None
+
+    for i in range(0, len(entries) - entry_size + 1, entry_size):
+        tag = struct.unpack(byte_order + 'H', entries[i:i + 2])[0]
+        if tag == _TIFF_COMPRESSION:
+            return struct.unpack(byte_order + 'H', entries[i + value_offset:i + value_offset + 2])[0]
+    return None
+
+
+def is_compressed(filename):
+    """
+    Check whether the file is compressed already (ZIP_STORED_EXTENSIONS from config or compressed TIFF),
+    so deflating it would only waste CPU.
+    """
+    name = filename.lower()
+    if name.endswith(tuple(downloader_config.ZIP_STORED_EXTENSIONS)):
+        return True
+    if name.endswith(('.tif', '.tiff')):
+        compression = tiff_compression(filename)
+        return compression is not None and compression != _TIFF_UNCOMPRESSED
+    return False
+
+
+def _gf2_times(matrix, vector):
+    result = 0
+    i = 0
+    while vector:
+        if vector & 1:
+            result ^= matrix[i]
+        vector >>= 1
+        i += 1
+    return result
+
+
+def _gf2_square(matrix):
+    return [_gf2_times(matrix, matrix[n]) for n in range(32)]
+
+
+def _crc32_shift(crc, length):
+    """
+    Return CRC-32 of the data followed by length zero bytes without the final xor (as crc32_combine of zlib).
+    """
+    odd = [0xedb88320] + [1 << n for n in range(31)]
+    even = _gf2_square(odd)
+    odd = _gf2_square(even)
+    while True:
+        even = _gf2_square(odd)
+        if length & 1:
+            crc = _gf2_times(even, crc)
+        length >>= 1
+        if not length:
+            return crc
+        odd = _gf2_square(even)
+        if length & 1:
+            crc = _gf2_times(odd, crc)
+        length >>= 1
+        if not length:
+            return crc
+
+
+_crc32_operators = {}
+_crc32_lock = threading.Lock()
+
+
+def crc32_combine(crc1, crc2, length2):
+    """
+    Return CRC-32 of two concatenated blocks from their CRC-32 values and the length of the second one.
+    """
+    if length2 == 0:
+        return crc1
+    with _crc32_lock:
+        operator = _crc32_operators.get(length2)
+        if operator is None:
+            # The shift is linear, so it is computed once for every length (most of the blocks are equal)
+            operator = [_crc32_shift(1 << n, length2) for n in range(32)]
+            if len(_crc32_operators) < 64:
+                _crc32_operators[length2] = operator
+    return _gf2_times(operator, crc1) ^ crc2
+
+
+def _read_block(filename, offset, length):
+    with open(filename, 'rb') as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+def _deflate_block(args):
+    """
+    Deflate the block of the file independently of the others. Every block but the last one ends
+    with the full flush, so the compressed blocks are concatenated to one raw deflate stream.
+    Return (CRC-32, length of the block, compressed data).
+    """
+    filename, offset, length, last, level = args
+    data = _read_block(filename, offset, length)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    compressed = compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_FULL_FLUSH)
+    return zlib.crc32(data) & 0xffffffff, len(data), compressed
+
+
+def _store_block(args):
+    filename, offset, length = args[:3]
+    data = _read_block(filename, offset, length)
+    return zlib.crc32(data) & 0xffffffff, len(data), data
+
+
+class _CountingSink(object):
+    """
+    Write-only file object counting the written bytes, so zipfile can write the central directory
+    to the sinks which can't tell their position (sockets, pipes, responses).
+    """
+
+    def __init__(self, sink):
+        self._sink = sink
+        self.position = 0
+
+    def write(self, data):
+        self._sink.write(data)
+        self.position += len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        if hasattr(self._sink, 'flush'):
+            self._sink.flush()
+
+
+class _Member(object):
+    def __init__(self, filename, name, size, compress_type):
+        self.filename = filename
+        self.name = name
+        self.size = size
+        self.compress_type = compress_type
+        self.blocks = 0
+
+
+def _blocks(members, block_size, level):
+    """
+    Yield (member, task) for every block of every member.
+    """
+    for member in members:
+        offsets = range(0, member.size, block_size) or [0]
+        member.blocks = len(offsets)
+        for i, offset in enumerate(offsets):
+            yield member, (member.filename, offset, block_size, i == len(offsets) - 1, level)
+
+
+def write_zip(filenames, sink, names=None, processes=None, level=None, block_size=None):
+    """
+    Write Zip64 compatible .zip archive of the files deflating them on a pool of processes.
+
+    Every file is split into blocks deflated independently (as pigz does) and written in order,
+    so the archive is written as a stream: sink needs only write(). Files compressed already
+    (see is_compressed) are stored as is. Sizes and CRC-32 of the members follow their data
+    in the data descriptors.
+
+    :param filenames:   list of the files
+    :param sink:    path to the archive or file object
+    :param names:   names of the members (the base names of the files by default)
+    :param processes:   count of processes deflating the blocks (ZIP_PROCESSES from config or count of CPUs
+                        by default, 1 deflates them in this process)
+    :param level:   compression level (ZIP_COMPRESSION_LEVEL from config by default)
+    :param block_size:  size of the blocks in bytes (ZIP_BLOCK_SIZE from config by default)
+    :return:    list of ZipInfo of the members
+    """
+    if names is None:
+        names = [os.path.basename(filename) for filename in filenames]
+    if len(names) != len(filenames):
+        raise ValueError('Count of names should be equal to count of files')
+    if processes is None:
+        processes = downloader_config.ZIP_PROCESSES or multiprocessing.cpu_count()
+    if level is None:
+        level = downloader_config.ZIP_COMPRESSION_LEVEL
+    block_size = block_size or downloader_config.ZIP_BLOCK_SIZE
+
+    members = [_Member(filename, name, os.path.getsize(filename),
+                       zipfile.ZIP_STORED if is_compressed(filename) else zipfile.ZIP_DEFLATED)
+               for filename, name in zip(filenames, names)]
+
+    if isinstance(sink, basestring):
+        with open(sink, 'wb') as f:
+            return write_zip(filenames, f, names, processes, level, block_size)
+
+    output = _CountingSink(sink)
+    archive = zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    try:
+        _write_members(archive, output, members, pool, processes, level, block_size)
+        archive.close()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    output.flush()
+    return archive.infolist()
+
+
+def _write_members(archive, output, members, pool, processes, level, block_size):
+    # Count of blocks deflated ahead of the writer bounds the memory used by the results
+    window = collections.deque()
+    blocks = _blocks(members, block_size, level)
+    current = {'member': None}
+
+    def submit():
+        try:
+            member, task = next(blocks)
+        except StopIteration:
+            return False
+        if member.compress_type == zipfile.ZIP_STORED:
+            # Stored blocks are read by the writer, sending them through the pool only costs a copy
+            window.append((member, None, task))
+        elif pool is None:
+            window.append((member, _deflate_block(task), None))
+        else:
+            window.append((member, pool.apply_async(_deflate_block, (task,)), None))
+        return True
+
+    for _ in range(processes * 2):
+        if not submit():
+            break
+
+    while window:
+        member, result, task = window.popleft()
+        submit()
+        if result is None:
+            crc, length, data = _store_block(task)
+        elif isinstance(result, tuple):
+            crc, length, data = result
+        else:
+            crc, length, data = result.get()
+
+        if current['member'] is not member:
+            current['member'] = member
+            current['info'], current['zip64'] = _start_member(output, member)
+            current['written'] = 0
+        info = current['info']
+        info.CRC = crc32_combine(info.CRC, crc, length) if current['written'] else crc
+        info.file_size += length
+        info.compress_size += len(data)
+        output.write(data)
+
+        current['written'] += 1
+        if current['written'] == member.blocks:
+            _finish_member(archive, output, info, current['zip64'])
+
+
+def _start_member(output, member):
+    info = zipfile.ZipInfo(member.name, time.localtime(os.path.getmtime(member.filename))[:6])
+    info.compress_type = member.compress_type
+    info.external_attr = (os.stat(member.filename).st_mode & 0xFFFF) << 16
+    # Sizes and CRC-32 are written after the data
+    info.flag_bits |= 0x08
+    info.header_offset = output.tell()
+    info.CRC = 0
+    info.file_size = 0
+    info.compress_size = 0
+
+    # Deflate may slightly expand incompressible data
+    zip64 = member.size * 1.05 > zipfile.ZIP64_LIMIT
+    if zip64:
+        info.extract_version = max(45, info.extract_version)
+        info.create_version = max(45, info.create_version)
+    output.write(info.FileHeader(zip64))
+    return info, zip64
+
+
+def _finish_member(archive, output, info, zip64):
+    if zip64:
+        output.write(struct.pack('<4sLQQ', _DATA_DESCRIPTOR, info.CRC, info.compress_size, info.file_size))
+    elif info.compress_size > zipfile.ZIP64_LIMIT or info.file_size > zipfile.ZIP64_LIMIT:
+        raise zipfile.LargeZipFile('File "{0}" has grown while it was archived'.format(info.filename))
+    else:
+        output.write(struct.pack('<4sLLL', _DATA_DESCRIPTOR, info.CRC, info.compress_size, info.file_size))
+    archive.filelist.append(info)
+    archive.NameToInfo[info.filename] = info
@@ -0,0 +1,114 @@
+__author__ = "NextGIS (info@nextgis.com)"
+__copyright__ = "Copyright (C) NextGIS"
+__license__ = "GPL v.2"
+
+import os
+import re
+import json
+
+from utils import silent_remove
+
+
+class PartialDownload(object):
+    """
+    Partially downloaded file and its journal.
+
+    The journal (<filename>.json) keeps the URL, the count of bytes written,
+    the ETag/Last-Modified validators and the full size of the file.
+    The download is resumed by the Range request only if the journal exists,
+    so a file without journal is always downloaded from the beginning.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.journal = filename + '.json'
+
+        self.url = None
+        self.offset = 0
+        self.etag = None
+        self.last_modified = None
+        self.size = None
+
+        self._load()
+
+    def _load(self):
+        if not (os.path.isfile(self.filename) and os.path.isfile(self.journal)):
+            return
+
+        try:
+            with open(self.journal) as f:
+                state = json.load(f)
+        except ValueError:
+            return
+
+        self.url = state.get('url')
+        self.etag = state.get('etag')
+        self.last_modified = state.get('last_modified')
+        self.size = state.get('size')
+        # Data are flushed before the journal, so the file may be only longer than the journal says
+        self.offset = min(state.get('offset', 0), os.path.getsize(self.filename))
+
+    @property
+    def validator(self):
+        return self.etag or self.last_modified
+
+    def is_complete(self):
+        return self.size is not None and self.offset == self.size
+
+    def is_complete_by(self, response):
+        """
+        Check the response 416 to the Range request: the file is complete only if the journal says so
+        and the size of the remote file (Content-Range: bytes */size) is the same.
+        """
+        match = re.match(r'bytes \*/(\d+)', response.headers.get('Content-Range', ''))
+        return self.is_complete() and (match is None or int(match.group(1)) == self.size)
+
+    def range_headers(self):
+        """
+        Headers of the request resuming the download. Without a validator
+        the server can't say if the file is changed, so nothing is resumed.
+        """
+        if not self.offset or not self.validator:
+            return {}
+        return {'Range': 'bytes={0}-'.format(self.offset), 'If-Range': self.validator}
+
+    def start(self, url, response):
+        """
+        Apply the response headers. Return mode for opening the file: 'r+b' if
+        the server continues the download from the offset and 'wb' if it sends the whole file.
+        The file may be preallocated, so the data should be written from the offset, not appended.
+        """
+        self.url = url
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+
+        content_range = response.headers.get('Content-Range', '')
+        match = re.match(r'bytes (\d+)-\d+/(\d+|\*)', content_range)
+        if response.status_code == 206 and match and int(match.group(1)) == self.offset:
+            self.size = int(match.group(2)) if match.group(2) != '*' else None
+            return 'r+b'
+
+        content_length = response.headers.get('Content-Length')
+        self.size = int(content_length) if content_length else None
+        self.offset = 0
+        return 'wb'
+
+    def save(self):
+        state = {
+            'url': self.url,
+            'offset': self.offset,
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'size': self.size
+        }
+        tmp_journal = self.journal + '.tmp'
+        with open(tmp_journal, 'w') as f:
+            json.dump(state, f)
+        os.rename(tmp_journal, self.journal)
+
+    def complete(self):
+        silent_remove(self.journal)
+
+    def discard(self):
+        silent_remove(self.filename)
+        silent_remove(self.journal)
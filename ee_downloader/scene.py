@@ -0,0 +1,259 @@
+__author__ = "NextGIS (info@nextgis.com)"
+__copyright__ = "Copyright (C) NextGIS"
+__license__ = "GPL v.2"
+
+import json
+import threading
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+import config as downloader_config
+
+
+_names = {}
+_lock = threading.Lock()
+
+
+def intern_name(name):
+    """
+    Return the shared instance of the field name, so the names of all the scenes are stored once.
+    """
+    shared = _names.get(name)
+    if shared is None:
+        if type(name) is str:
+            name = intern(name)
+        with _lock:
+            shared = _names.setdefault(name, name)
+    return shared
+
+
+class _Layout(object):
+    """
+    Names of the fields of the scenes in the order they were set, shared by all the scenes
+    which got the same fields in the same order (all the scenes of one product do).
+    Layouts are linked by the added field, so the next layout is found by one lookup.
+    """
+    __slots__ = ('names', 'positions', 'formats', '_next')
+
+    def __init__(self, names):
+        self.names = names
+        self.positions = dict((name, i) for i, name in enumerate(names))
+        # Download option of every format from config: the first field containing the name of the format
+        self.formats = {}
+        for name in names:
+            if not isinstance(name, basestring):
+                continue
+            for product_format in downloader_config.FORMATS:
+                if product_format in name and product_format not in self.formats:
+                    self.formats[product_format] = name
+        self._next = {}
+
+    def add(self, name):
+        layout = self._next.get(name)
+        if layout is None:
+            name = intern_name(name)
+            with _lock:
+                layout = self._next.get(name)
+                if layout is None:
+                    layout = self._next[name] = _Layout(self.names + (name,))
+        return layout
+
+
+_EMPTY = _Layout(())
+
+
+def _layout(names):
+    layout = _EMPTY
+    for name in names:
+        layout = layout.add(name)
+    return layout
+
+
+class Scene(object):
+    """
+    Record of the scene: id, preview and metadata URLs from the search, metadata fields
+    ('Landsat Product Identifier'...) and download options (name of the option: URL),
+    and the results of the download (file_name, integrity, error...).
+
+    Values are kept in a list, the names of the fields are kept once in the layout shared
+    by the scenes, and the download option of every format from config is found once per layout
+    (see download_option). The record behaves as a dictionary, as_dict() returns the plain one.
+    """
+    __slots__ = ('_layout', '_values')
+
+    def __init__(self, data=None, **fields):
+        self._layout = _EMPTY
+        self._values = []
+        self.update(data, **fields)
+
+    def __getitem__(self, name):
+        position = self._layout.positions.get(name)
+        if position is None:
+            raise KeyError(name)
+        return self._values[position]
+
+    def __setitem__(self, name, value):
+        position = self._layout.positions.get(name)
+        if position is None:
+            self._layout = self._layout.add(name)
+            self._values.append(value)
+        else:
+            self._values[position] = value
+
+    def __delitem__(self, name):
+        position = self._layout.positions.get(name)
+        if position is None:
+            raise KeyError(name)
+        names = self._layout.names
+        self._layout = _layout(names[:position] + names[position + 1:])
+        del self._values[position]
+
+    def __contains__(self, name):
+        return name in self._layout.positions
+
+    has_key = __contains__
+
+    def __iter__(self):
+        return iter(self._layout.names)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __eq__(self, other):
+        if isinstance(other, Scene):
+            other = other.as_dict()
+        return self.as_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Scene({0!r})'.format(self.as_dict())
+
+    def __getstate__(self):
+        return self.as_dict()
+
+    def __setstate__(self, state):
+        self._layout = _EMPTY
+        self._values = []
+        self.update(state)
+
+    def get(self, name, default=None):
+        position = self._layout.positions.get(name)
+        return default if position is None else self._values[position]
+
+    def setdefault(self, name, default=None):
+        position = self._layout.positions.get(name)
+        if position is None:
+            self[name] = default
+            return default
+        return self._values[position]
+
+    def pop(self, name, *default):
+        if name not in self._layout.positions:
+            if default:
+                return default[0]
+            raise KeyError(name)
+        value = self[name]
+        del self[name]
+        return value
+
+    def update(self, data=None, **fields):
+        if data is not None:
+            if hasattr(data, 'iteritems'):
+                items = data.iteritems()
+            elif hasattr(data, 'keys'):
+                items = ((name, data[name]) for name in data.keys())
+            else:
+                items = data
+            for name, value in items:
+                self[name] = value
+        for name, value in fields.iteritems():
+            self[name] = value
+
+    def keys(self):
+        return list(self._layout.names)
+
+    def values(self):
+        return list(self._values)
+
+    def items(self):
+        return zip(self._layout.names, self._values)
+
+    def iterkeys(self):
+        return iter(self._layout.names)
+
+    def itervalues(self):
+        return iter(self._values)
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def copy(self):
+        scene = Scene()
+        scene._layout = self._layout
+        scene._values = list(self._values)
+        return scene
+
+    def as_dict(self):
+        return dict(zip(self._layout.names, self._values))
+
+    def download_option(self, product_format):
+        """
+        Return the name of the download option of the format or None if the scene hasn't it.
+        """
+        if product_format in downloader_config.FORMATS:
+            return self._layout.formats.get(product_format)
+        # The format isn't in config, so it isn't indexed
+        for name in self._layout.names:
+            if product_format in name:
+                return name
+        return None
+
+    def to_json(self):
+        return json.dumps(self.as_dict())
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(json.loads(data))
+
+    def to_msgpack(self):
+        """
+        Return the scene packed by msgpack (the package should be installed).
+        """
+        if msgpack is None:
+            raise RuntimeError('msgpack isn\'t installed')
+        return msgpack.packb(self.as_dict(), use_bin_type=True)
+
+    @classmethod
+    def from_msgpack(cls, data):
+        if msgpack is None:
+            raise RuntimeError('msgpack isn\'t installed')
+        return cls(msgpack.unpackb(data, raw=False))
+
+
+def download_option(scene, product_format):
+    """
+    Return the name of the download option of the format of the scene (Scene or plain dictionary)
+    or None if the scene hasn't it.
+    """
+    if isinstance(scene, Scene):
+        return scene.download_option(product_format)
+    for name in scene.keys():
+        if product_format in name:
+            return name
+    return None
+
+
+def json_default(value):
+    """
+    Serialize the scenes as dictionaries (default of json.dumps).
+    """
+    if isinstance(value, Scene):
+        return value.as_dict()
+    raise TypeError('{0!r} is not JSON serializable'.format(value))
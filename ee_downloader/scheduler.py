@@ -0,0 +1,294 @@
+__author__ = "NextGIS (info@nextgis.com)"
+__copyright__ = "Copyright (C) NextGIS"
+__license__ = "GPL v.2"
+
+import email.utils
+import random
+import threading
+import time
+import urlparse
+
+import config as downloader_config
+
+
+# Statuses meaning the server is overloaded or temporarily unavailable
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+# Statuses meaning the server asks the clients to slow down
+PUSHBACK_STATUSES = frozenset([429, 503])
+
+
+class TokenBucket(object):
+    """
+    Token bucket limiting the rate of the requests shared by several threads.
+
+    The rate may be lowered and restored while the bucket is used (see slow_down and speed_up).
+    """
+
+    def __init__(self, rate, burst=None, min_rate=None):
+        """
+        :param rate:    count of requests per second
+        :param burst:   count of requests allowed to go without waiting (rate by default)
+        :param min_rate:    the rate isn't lowered below this value (rate / 16 by default)
+        """
+        if rate <= 0:
+            raise ValueError('Rate should be positive')
+
+        self.max_rate = float(rate)
+        self.rate = self.max_rate
+        self.min_rate = float(min_rate) if min_rate is not None else self.max_rate / 16
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self._tokens = self.burst
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def consume(self, tokens=1):
+        """
+        Take the tokens without waiting, the bucket may go into debt.
+        Return the delay in seconds until the debt is paid.
+        """
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= tokens
+            return -self._tokens / self.rate if self._tokens < 0 else 0
+
+    def wait(self, tokens=1):
+        """
+        Block until the next request (or the request costing the count of tokens) is allowed.
+        """
+        delay = self.consume(tokens)
+        if delay:
+            time.sleep(delay)
+
+    def slow_down(self):
+        """
+        Halve the rate.
+        """
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def speed_up(self):
+        """
+        Raise the rate back by a small step, up to the initial rate.
+        """
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * downloader_config.SCHEDULER_RECOVERY)
+
+
+def backoff_delay(attempt, delay=None, max_delay=None):
+    """
+    Return the delay before the repeat of the failed request: exponential with "full jitter",
+    i.e. random value up to delay * 2 ** attempt.
+
+    :param attempt: number of the failed attempt starting from 0
+    :param delay:   base delay in seconds (RETRY_DELAY from config by default)
+    :param max_delay:   upper bound of the delay (SCHEDULER_MAX_DELAY from config by default)
+    """
+    if delay is None:
+        delay = downloader_config.RETRY_DELAY
+    if max_delay is None:
+        max_delay = downloader_config.SCHEDULER_MAX_DELAY
+    return random.uniform(0, min(max_delay, delay * 2 ** attempt))
+
+
+def retry_after(response):
+    """
+    Return the delay in seconds from the Retry-After header of the response
+    (count of seconds or HTTP date) or None.
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(0.0, email.utils.mktime_tz(parsed) - time.time())
+
+
+class CircuitBreaker(object):
+    """
+    Pause all the requests together when the server pushes back.
+
+    Every failed request raises the count of consecutive failures. When it reaches the threshold
+    or the server asks for a pause (Retry-After), the breaker opens: every thread waits in wait()
+    until the pause is over. The pause is doubled every time the breaker opens again before
+    a request succeeds.
+    """
+
+    def __init__(self, threshold=None, pause=None, max_pause=None):
+        """
+        :param threshold:   count of consecutive failures opening the breaker (SCHEDULER_BREAKER_THRESHOLD
+                            from config by default)
+        :param pause:   first pause in seconds (SCHEDULER_BREAKER_PAUSE from config by default)
+        :param max_pause:   upper bound of the pause (SCHEDULER_MAX_DELAY from config by default)
+        """
+        self.threshold = threshold or downloader_config.SCHEDULER_BREAKER_THRESHOLD
+        self.pause = pause if pause is not None else downloader_config.SCHEDULER_BREAKER_PAUSE
+        self.max_pause = max_pause if max_pause is not None else downloader_config.SCHEDULER_MAX_DELAY
+
+        self.failures = 0
+        self.trips = 0
+        self._until = 0
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return time.time() < self._until
+
+    def wait(self):
+        """
+        Block while the breaker is open.
+        """
+        while True:
+            with self._lock:
+                delay = self._until - time.time()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.trips = 0
+
+    def failure(self, pause=None):
+        """
+        Count the failed request.
+
+        :param pause:   pause asked by the server. The breaker is opened for it at once.
+        """
+        with self._lock:
+            self.failures += 1
+            if pause is None:
+                if self.failures < self.threshold:
+                    return
+                pause = self.pause * 2 ** self.trips
+            self.trips += 1
+            self.failures = 0
+            self._until = max(self._until, time.time() + min(pause, self.max_pause))
+
+
+class RequestScheduler(object):
+    """
+    Central scheduler of the requests to EarthExplorer shared by all the sessions and workers.
+
+    Every request waits for the token bucket of its endpoint (host and the first part of the path,
+    with the rates from SCHEDULER_RATES) and for the circuit breaker. Connection errors and
+    the responses with RETRY_STATUSES are repeated after the exponential backoff with jitter
+    or after the delay asked by Retry-After. When the server pushes back (429 or 503),
+    the rate of the endpoint is halved and the breaker pauses all the requests;
+    the successful requests restore the rate step by step.
+    """
+
+    def __init__(self, retries=None, rates=None, default_rate=None, breaker=None):
+        """
+        :param retries: count of attempts for every request (REQUEST_RETRIES from config by default)
+        :param rates:   dictionary {endpoint: requests per second} (SCHEDULER_RATES from config by default),
+                        endpoint is 'host' or 'host/first part of the path'
+        :param default_rate:    requests per second of other endpoints (SCHEDULER_DEFAULT_RATE from config
+                                by default)
+        :param breaker: CircuitBreaker
+        """
+        self.retries = retries or downloader_config.REQUEST_RETRIES
+        # Rates from config are read when the bucket of the endpoint is created
+        self.rates = rates
+        self.default_rate = default_rate
+        self.breaker = breaker or CircuitBreaker()
+
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def endpoint(url):
+        parsed = urlparse.urlparse(url)
+        path = parsed.path.strip('/').split('/', 1)[0]
+        return parsed.netloc + '/' + path if path else parsed.netloc
+
+    def bucket(self, url):
+        """
+        Return the token bucket of the endpoint of the URL.
+        """
+        endpoint = self.endpoint(url)
+        with self._lock:
+            bucket = self._buckets.get(endpoint)
+            if bucket is None:
+                host = endpoint.split('/', 1)[0]
+                rates = self.rates if self.rates is not None else downloader_config.SCHEDULER_RATES
+                default_rate = self.default_rate or downloader_config.SCHEDULER_DEFAULT_RATE
+                rate = rates.get(endpoint, rates.get(host, default_rate))
+                bucket = self._buckets[endpoint] = TokenBucket(rate)
+            return bucket
+
+    def request(self, send, method, url, **kwargs):
+        """
+        Send the request through the scheduler.
+
+        :param send:    function sending the request: send(method, url, **kwargs) -> response
+        :return:    the response. The last one is returned even if its status is in RETRY_STATUSES.
+        """
+        bucket = self.bucket(url)
+        for attempt in range(self.retries):
+            last = attempt + 1 >= self.retries
+            self.breaker.wait()
+            bucket.wait()
+            try:
+                response = send(method, url, **kwargs)
+            except IOError:
+                self.breaker.failure()
+                if last:
+                    raise
+                time.sleep(backoff_delay(attempt))
+                continue
+
+            if response.status_code not in RETRY_STATUSES:
+                self.breaker.success()
+                bucket.speed_up()
+                return response
+
+            delay = retry_after(response)
+            if response.status_code in PUSHBACK_STATUSES:
+                bucket.slow_down()
+                self.breaker.failure(delay)
+            else:
+                self.breaker.failure()
+            if last:
+                return response
+            response.close()
+            time.sleep(backoff_delay(attempt) if delay is None else min(delay, self.breaker.max_pause))
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call the function and repeat the call after the backoff if it raises IOError
+        (requests errors included). The failures are counted by the circuit breaker.
+        """
+        for attempt in range(self.retries):
+            self.breaker.wait()
+            try:
+                result = func(*args, **kwargs)
+            except IOError:
+                self.breaker.failure()
+                if attempt + 1 >= self.retries:
+                    raise
+                time.sleep(backoff_delay(attempt))
+                continue
+            self.breaker.success()
+            return result
+
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+
+def default_scheduler():
+    """
+    Return the scheduler shared by all the sessions of the process.
+    """
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = RequestScheduler()
+        return _default_scheduler
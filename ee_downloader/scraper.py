@@ -0,0 +1,222 @@
+__author__ = "NextGIS (info@nextgis.com)"
+__copyright__ = "Copyright (C) NextGIS"
+__license__ = "GPL v.2"
+
+import re
+from HTMLParser import HTMLParser
+
+from scene import Scene
+import config as downloader_config
+
+
+# Comments, scripts and styles are skipped whole, so '<' inside them doesn't start a tag
+_TOKEN = re.compile(r'<!--.*?-->'
+                    r'|<(script|style)\b.*?</\1\s*>'
+                    r'|<(/?)([a-zA-Z][\w:-]*)((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>'
+                    r'|([^<]+)'
+                    r'|<',
+                    re.S | re.I)
+_ATTRIBUTE = re.compile(r'([a-zA-Z_:][\w:.-]*)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'>]+)))?')
+_VOID_TAGS = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param',
+                        'source', 'track', 'wbr'])
+# Size of the file in the name of the download option, e.g. "Level-1 GeoTIFF Data Product (966.4 MB)"
+_SIZE = re.compile(r'\(\s*([\d.,]+)\s*([KMGT]?B)\s*\)', re.I)
+_SIZE_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3, 'TB': 1024 ** 4}
+
+_unescape = HTMLParser().unescape
+
+START = 'start'
+END = 'end'
+TEXT = 'text'
+
+
+def tokens(html):
+    """
+    Split the HTML into a flat stream of tokens without building a tree.
+    Yield (START, tag, raw attributes), (END, tag, None) and (TEXT, None, unescaped text).
+    Void tags (img, input, br...) get no END token.
+    """
+    for match in _TOKEN.finditer(html):
+        tag = match.group(3)
+        if tag is not None:
+            tag = tag.lower()
+            if match.group(2):
+                yield END, tag, None
+            else:
+                yield START, tag, match.group(4)
+        elif match.group(5) is not None:
+            yield TEXT, None, _unescape(match.group(5))
+
+
+def attributes(raw):
+    """
+    Parse raw attributes of the tag into dictionary. Attributes without value get ''.
+    """
+    result = {}
+    for match in _ATTRIBUTE.finditer(raw or ''):
+        name = match.group(1).lower()
+        value = match.group(2)
+        if value is None:
+            value = match.group(3)
+        if value is None:
+            value = match.group(4)
+        result[name] = _unescape(value) if value else ''
+    return result
+
+
+def parse_result_index(html, product_id):
+    """
+    Extract the scenes from the /result/index page. Every <img> with class is a scene.
+
+    :return:    list of Scene which contain id, preview and metadata URLs
+    """
+    product_id = str(product_id)
+    scene_list = []
+    for kind, tag, raw in tokens(html):
+        if kind != START or tag != 'img':
+            continue
+        attrs = attributes(raw)
+        classes = attrs.get('class', '').split()
+        if not classes:
+            continue
+        scene = Scene()
+        scene['id'] = classes[0]
+        scene['preview'] = attrs.get('src', '').replace('/browse/thumbnails/', '/browse/')
+        scene['metadata'] = downloader_config.EE_URL + '/form/metadatalookup/?collection_id=' + \
+            product_id + '&entity_id=' + scene['id']
+        scene_list.append(scene)
+    return scene_list
+
+
+class _Node(object):
+    """
+    Direct children of the element: text strings and nested nodes.
+    """
+    __slots__ = ('tag', 'children')
+
+    def __init__(self, tag):
+        self.tag = tag
+        self.children = []
+
+    @property
+    def string(self):
+        """
+        Same as BeautifulSoup .string: the only text child (looked for through the only child element).
+        """
+        if len(self.children) != 1:
+            return None
+        child = self.children[0]
+        return child.string if isinstance(child, _Node) else child
+
+    def find(self, tag):
+        for child in self.children:
+            if isinstance(child, _Node):
+                if child.tag == tag:
+                    return child
+                found = child.find(tag)
+                if found is not None:
+                    return found
+        return None
+
+
+def _rows(html):
+    """
+    Yield the list of <td> nodes of every table row.
+    """
+    stack = []
+    cells = None
+    for kind, tag, data in tokens(html):
+        if kind == START and tag == 'tr':
+            cells = []
+            stack = []
+        elif cells is None:
+            continue
+        elif kind == START:
+            if tag in _VOID_TAGS:
+                if stack:
+                    stack[-1].children.append(_Node(tag))
+                continue
+            node = _Node(tag)
+            if stack:
+                stack[-1].children.append(node)
+            elif tag == 'td':
+                cells.append(node)
+            else:
+                continue
+            stack.append(node)
+        elif kind == END:
+            if tag == 'tr':
+                yield cells
+                cells = None
+                continue
+            while stack:
+                if stack.pop().tag == tag:
+                    break
+        elif stack:
+            stack[-1].children.append(data)
+
+    if cells is not None:
+        yield cells
+
+
+def parse_metadata(html):
+    """
+    Extract the metadata from the metadata lookup page: name of the field is the text of the link
+    in the first cell of the row, value is the text of the second cell.
+
+    :return:    dictionary {field name: value}
+    """
+    metadata = dict()
+    for cells in _rows(html):
+        if not cells:
+            continue
+        link = cells[0].find('a')
+        if link is None:
+            continue
+        metadata[link.string] = cells[1].string if len(cells) > 1 else None
+    return metadata
+
+
+def parse_download_options(html):
+    """
+    Extract the download options: every <input> keeps the download URL in onclick handler
+    and the name of the option is the text of the next <div>.
+
+    :return:    list of (name, URL, disabled)
+    """
+    options = []
+    pending = []
+    div_depth = 0
+    div_text = []
+    for kind, tag, data in tokens(html):
+        if kind == START and tag == 'input' and not div_depth:
+            attrs = attributes(data)
+            if 'onclick' not in attrs:
+                continue
+            onclick = attrs['onclick'].replace("'", "").replace("window.location=", "")
+            pending.append((onclick, 'disabled' in attrs))
+        elif kind == START and tag == 'div':
+            if pending or div_depth:
+                div_depth += 1
+        elif kind == END and tag == 'div' and div_depth:
+            div_depth -= 1
+            if not div_depth:
+                name = u''.join(div_text).strip()
+                options.extend((name, url, disabled) for url, disabled in pending)
+                pending = []
+                div_text = []
+        elif kind == TEXT and div_depth:
+            div_text.append(data)
+    return options
+
+
+def parse_size(name):
+    """
+    Extract the size of the file from the name of the download option.
+
+    :return:    size in bytes or None if the name doesn't show it
+    """
+    match = _SIZE.search(name or '')
+    if match is None:
+        return None
+    return int(float(match.group(1).replace(',', '')) * _SIZE_UNITS[match.group(2).upper()])
@@ -0,0 +1,219 @@
+__author__ = "NextGIS (info@nextgis.com)"
+__copyright__ = "Copyright (C) NextGIS"
+__license__ = "GPL v.2"
+
+import re
+import threading
+import time
+
+import requests
+
+from workers import retry
+import config as downloader_config
+
+
+def probe_ranges(session, url):
+    """
+    Ask the server for the first byte of the file. Return the response and the size of the file
+    if the server supports Range requests, otherwise (response, None).
+    """
+    r = session.get(url, stream=True, headers={'Range': 'bytes=0-0'})
+    r.close()
+    match = re.match(r'bytes 0-0/(\d+)', r.headers.get('Content-Range', ''))
+    if r.status_code != 206 or not match:
+        return r, None
+    return r, int(match.group(1))
+
+
+class Segment(object):
+    def __init__(self, position, end):
+        self.position = position
+        self.end = end
+
+    @property
+    def remaining(self):
+        return self.end - self.position
+
+
+class SegmentedDownload(object):
+    """
+    Download one file over several connections, every one fetching its own byte range.
+
+    The file is preallocated and every segment is written at its offset through its own file handle.
+    The download starts with one segment. While adding a segment raises the total speed
+    by more than SEGMENT_GAIN, the largest remaining segment is split in two, up to max_segments.
+    When a segment is done, the largest remaining one is split to keep the count of connections.
+    With HostThrottle a segment is added only if a connection to the host is free, the caller
+    holds the connection of the first segment.
+    """
+
+    def __init__(self, session, url, filename, size, max_segments=None, min_segment_size=None, bandwidth=None,
+                 priority=None, throttle=None):
+        """
+        :param session:    EESession shared by the segments
+        :param url:    URL of the file
+        :param filename:    name of the result file
+        :param size:    size of the file
+        :param max_segments:    max count of simultaneous connections (DOWNLOAD_SEGMENTS from config by default)
+        :param min_segment_size:    segments smaller than this aren't split (SEGMENT_MIN_SIZE from config by default)
+        :param bandwidth:   BandwidthLimiter accounting the bytes of all the segments
+        :param priority:    priority class of the download passed to the limiter
+        :param throttle:    HostThrottle limiting the connections of the added segments
+        """
+        self.session = session
+        self.url = url
+        self.filename = filename
+        self.size = size
+        self.max_segments = max_segments or downloader_config.DOWNLOAD_SEGMENTS
+        self.min_segment_size = min_segment_size or downloader_config.SEGMENT_MIN_SIZE
+        self.bandwidth = bandwidth
+        self.priority = priority
+        self.throttle = throttle
+
+        self.bytes = 0
+        # Time of the first response of the segments
+        self.first_byte = None
+        self.errors = []
+        self._segments = []
+        self._active = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+
+    @property
+    def segments(self):
+        return len(self._segments)
+
+    def _split(self):
+        """
+        Split the largest remaining segment and start a worker for its second half.
+        """
+        if self.throttle is not None and not self.throttle.try_acquire(self.url, self.priority):
+            return False
+        with self._lock:
+            segment = max(self._segments, key=lambda s: s.remaining)
+            new_segment = None
+            if self._active < self.max_segments and not self.errors and \
+                    segment.remaining >= 2 * self.min_segment_size:
+                middle = segment.position + segment.remaining // 2
+                new_segment = Segment(middle, segment.end)
+                segment.end = middle
+        if new_segment is None:
+            if self.throttle is not None:
+                self.throttle.release(self.url)
+            return False
+        self._start(new_segment, self.throttle is not None)
+        return True
+
+    def _start(self, segment, connection=False):
+        """
+        :param connection:  the connection to the host is taken for the segment and is released when it's done
+        """
+        with self._lock:
+            self._segments.append(segment)
+            self._active += 1
+        thread = threading.Thread(target=self._work, args=(segment, connection))
+        thread.daemon = True
+        thread.start()
+
+    def _work(self, segment, connection):
+        try:
+            retry(self._fetch, segment)
+        except Exception as e:
+            with self._lock:
+                self.errors.append(e)
+        finally:
+            if connection:
+                self.throttle.release(self.url)
+            with self._lock:
+                self._active -= 1
+            self._changed.set()
+
+    def _fetch(self, segment):
+        with self._lock:
+            if segment.remaining <= 0:
+                return
+            headers = {'Range': 'bytes={0}-{1}'.format(segment.position, segment.end - 1)}
+
+        r = self.session.get(self.url, stream=True, headers=headers)
+        try:
+            if r.status_code != 206:
+                raise requests.exceptions.HTTPError('Range request is rejected with status {0}'.format(r.status_code),
+                                                    response=r)
+            with self._lock:
+                if self.first_byte is None:
+                    self.first_byte = time.time()
+
+            buf = bytearray(downloader_config.DOWNLOAD_CHUNK_SIZE)
+            view = memoryview(buf)
+            with open(self.filename, 'r+b') as f:
+                f.seek(segment.position)
+                while True:
+                    with self._lock:
+                        # The end may be moved by the split, so the remaining size is checked for every chunk
+                        length = min(len(buf), segment.remaining)
+                    if length <= 0:
+                        break
+                    n = r.raw.readinto(view[:length])
+                    if not n:
+                        break
+                    f.write(view[:n])
+                    if self.bandwidth is not None:
+                        self.bandwidth.transfer(n, self.priority)
+                    with self._lock:
+                        segment.position += n
+                        self.bytes += n
+        finally:
+            r.close()
+
+        if segment.remaining > 0:
+            raise IOError('Segment {0}-{1} is incomplete'.format(segment.position, segment.end))
+
+    def run(self):
+        """
+        Download the file. Return the time spent in seconds.
+        """
+        with open(self.filename, 'wb') as f:
+            f.truncate(self.size)
+
+        start = time.time()
+        self._start(Segment(0, self.size))
+
+        target = 1
+        growing = True
+        last_time, last_bytes, last_speed = start, 0, 0.0
+        while True:
+            self._changed.wait(downloader_config.SEGMENT_PROBE_INTERVAL)
+            self._changed.clear()
+            with self._lock:
+                active = self._active
+                failed = bool(self.errors)
+            if not active or failed:
+                break
+
+            now = time.time()
+            if growing and now - last_time >= downloader_config.SEGMENT_PROBE_INTERVAL:
+                speed = (self.bytes - last_bytes) / (now - last_time)
+                last_time, last_bytes = now, self.bytes
+                growing = speed > last_speed * (1 + downloader_config.SEGMENT_GAIN) and self._split()
+                if growing:
+                    last_speed = speed
+                    target += 1
+                    active += 1
+
+            # Some segments are done, keep the connections busy
+            while active < target and self._split():
+                active += 1
+
+        while True:
+            with self._lock:
+                if not self._active:
+                    break
+            self._changed.wait(downloader_config.SEGMENT_PROBE_INTERVAL)
+            self._changed.clear()
+
+        if self.errors:
+            raise self.errors[0]
+        remaining = sum(max(segment.remaining, 0) for segment in self._segments)
+        if remaining:
+            raise IOError('Incomplete download of "{0}": {1} bytes are missing'.format(self.url, remaining))
+        return time.time() - start
@@ -0,0 +1,161 @@
+__author__ = "NextGIS (info@nextgis.com)"
+__copyright__ = "Copyright (C) NextGIS"
+__license__ = "GPL v.2"
+
+import re
+import threading
+import Queue
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import default_metrics
+from scheduler import default_scheduler
+import config as downloader_config
+
+
+def get_session_id(s, login, password):
+    response = s.get(downloader_config.AUTH_URL)
+    match = re.search(r'value="(.*?)" id="csrf_token"', response.content)
+    csrf_token = match.group(1)
+
+    payload = {'username': login, 'password': password, 'csrf_token': csrf_token}
+    response = s.post(downloader_config.AUTH_URL, data=payload, allow_redirects=False)
+
+    if response.status_code != 302:
+        raise RuntimeError('Authentication Failed')
+
+
+class EESession(object):
+    """
+    Authenticated EarthExplorer session shared by the search and the download workers.
+
+    The login is done once on the first request and repeated only when the server
+    redirects a request back to the login page. Re-login is serialized: when several
+    workers notice the expired session at once, only the first one logs in again
+    and the others just repeat their requests.
+
+    Every request goes through the RequestScheduler (rate limits, retries and the circuit breaker),
+    which is shared by all the sessions by default.
+    """
+
+    def __init__(self, login, password, pool_size=None, scheduler=None):
+        """
+        :param login:   login
+        :param password:    password
+        :param pool_size:   count of keep-alive connections kept for every host
+                            (SESSION_POOL_SIZE from config by default)
+        :param scheduler:   RequestScheduler (the one shared by the process by default)
+        """
+        if pool_size is None:
+            pool_size = downloader_config.SESSION_POOL_SIZE
+
+        self.login = login
+        self.password = password
+        self.pool_size = pool_size
+        self.scheduler = scheduler or default_scheduler()
+
+        self._session = requests.session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def clone(self):
+        """
+        Return a new session with the same credentials. It is logged in on its first request.
+        """
+        return EESession(self.login, self.password, self.pool_size, self.scheduler)
+
+    @property
+    def authenticated(self):
+        return self._generation > 0
+
+    def authenticate(self, generation=None):
+        """
+        Log in to EarthExplorer.
+
+        :param generation:  login generation the caller has seen expired. If somebody has already
+                            logged in again since then, nothing is done.
+        """
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            with default_metrics().timer('login'):
+                self.scheduler.call(get_session_id, self._session, self.login, self.password)
+            self._generation += 1
+
+    @staticmethod
+    def is_expired(response):
+        if response.status_code == 401:
+            return True
+        urls = [r.headers.get('Location', '') for r in response.history]
+        urls.append(response.url)
+        if response.is_redirect:
+            urls.append(response.headers.get('Location', ''))
+        return any(url.startswith(downloader_config.AUTH_URL) for url in urls)
+
+    def request(self, method, url, **kwargs):
+        if not self.authenticated:
+            self.authenticate(0)
+
+        generation = self._generation
+        response = self.scheduler.request(self._session.request, method, url, **kwargs)
+        if self.is_expired(response):
+            response.close()
+            self.authenticate(generation)
+            response = self.scheduler.request(self._session.request, method, url, **kwargs)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        self._session.close()
+
+
+class SessionPool(object):
+    """
+    Idle sessions logged in with the same credentials, e.g. for the searches keeping their criteria
+    in the server session. A new session is cloned only when all of them are busy, and it is kept
+    for the next calls.
+    """
+
+    def __init__(self, session):
+        """
+        :param session: EESession (it isn't closed by the pool)
+        """
+        self.session = session
+        self._idle = Queue.Queue()
+        self._idle.put(session)
+        self._clones = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Take an idle session, it should be given back by put().
+        """
+        try:
+            return self._idle.get_nowait()
+        except Queue.Empty:
+            clone = self.session.clone()
+            with self._lock:
+                self._clones.append(clone)
+            return clone
+
+    def put(self, session):
+        self._idle.put(session)
+
+    def close(self):
+        """
+        Close the sessions cloned by the pool.
+        """
+        with self._lock:
+            clones, self._clones = self._clones, []
+        for clone in clones:
+            clone.close()
@@ -0,0 +1,274 @@
+__author__ = "NextGIS (info@nextgis.com)"
+__copyright__ = "Copyright (C) NextGIS"
+__license__ = "GPL v.2"
+
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import config as downloader_config
+
+
+# ioctl cloning the file on copy-on-write file systems (btrfs, XFS)
+FICLONE = 0x40049409
+
+
+def _reflink(source, target):
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def _copy(source, target):
+    shutil.copyfile(source, target)
+
+
+_LINKERS = {
+    'reflink': _reflink,
+    'hardlink': os.link,
+    'copy': _copy
+}
+
+
+def link_file(source, target, methods=None):
+    """
+    Make the file available at the target path without copying its data if possible.
+    The target appears complete or doesn't appear at all. Return the name of the used method.
+
+    :param methods: methods tried in turn (STORE_LINK_METHODS from config by default): 'reflink'
+                    (copy-on-write clone, the store isn't changed through the target), 'hardlink' (the same file)
+                    or 'copy'
+    """
+    methods = methods or downloader_config.STORE_LINK_METHODS
+    tmp_target = target + '.linking'
+    errors = []
+    for method in methods:
+        if method not in _LINKERS:
+            raise ValueError('Unknown link method "{0}"'.format(method))
+        if os.path.lexists(tmp_target):
+            os.remove(tmp_target)
+        try:
+            _LINKERS[method](source, tmp_target)
+        except (IOError, OSError) as e:
+            errors.append('{0}: {1}'.format(method, e))
+            continue
+        os.rename(tmp_target, target)
+        return method
+
+    if os.path.lexists(tmp_target):
+        os.remove(tmp_target)
+    raise IOError('File "{0}" can\'t be linked to "{1}" ({2})'.format(source, target, '; '.join(errors)))
+
+
+class SceneStore(object):
+    """
+    Local store of the downloaded scene files shared by many result directories and processes.
+
+    Files are keyed by (product, scene identifier, format) and placed by the hash of the key.
+    They are handed out to the result directories by link_file, so every scene is downloaded
+    and kept once. When the total size exceeds max_size, the least recently used files are evicted
+    (the files linked to the result directories stay there).
+
+    The index is SQLite database in the root directory. Every key has its own lock file: lock()
+    holds flock on it, so the processes and threads asking for the same scene wait for the one
+    which downloads it. Locked files aren't evicted.
+    """
+
+    def __init__(self, root, max_size=None, link_methods=None):
+        """
+        :param root:    directory of the store (created if it doesn't exist)
+        :param max_size:    max total size of the files in bytes, None for unlimited
+                            (STORE_MAX_SIZE from config by default)
+        :param link_methods:    see link_file (STORE_LINK_METHODS from config by default)
+        """
+        self.root = root
+        self.max_size = max_size if max_size is not None else downloader_config.STORE_MAX_SIZE
+        self.link_methods = link_methods
+
+        for directory in (self._path('data'), self._path('locks')):
+            if not os.path.isdir(directory):
+                try:
+                    os.makedirs(directory)
+                except OSError as e:
+                    if e.errno != errno.EEXIST:
+                        raise
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self._path('index.sqlite'), timeout=60, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS files ('
+                'key TEXT PRIMARY KEY, product TEXT, scene_id TEXT, format TEXT, path TEXT, size INTEGER, '
+                'created REAL, accessed REAL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS files_accessed ON files (accessed)')
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    @staticmethod
+    def key(product, scene_id, product_format):
+        return hashlib.sha1(u'\n'.join([unicode(product), unicode(scene_id), unicode(product_format)])
+                            .encode('utf-8')).hexdigest()
+
+    def path(self, product, scene_id, product_format):
+        """
+        Return the path of the file of the scene in the store (the file may be absent).
+        """
+        key = self.key(product, scene_id, product_format)
+        extension = downloader_config.FORMATS.get(product_format, {}).get('extension', '')
+        return self._path('data', key[:2], key + extension)
+
+    @contextmanager
+    def lock(self, product, scene_id, product_format):
+        """
+        Hold the exclusive lock of the scene file shared by the processes.
+        """
+        with open(self._path('locks', self.key(product, scene_id, product_format) + '.lock'), 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def get(self, product, scene_id, product_format):
+        """
+        Return the path of the stored file of the scene or None.
+        """
+        key = self.key(product, scene_id, product_format)
+        path = self.path(product, scene_id, product_format)
+        with self._lock, self._connection:
+            row = self._connection.execute('SELECT path FROM files WHERE key = ?', (key,)).fetchone()
+            if not os.path.isfile(path):
+                if row is not None:
+                    self._connection.execute('DELETE FROM files WHERE key = ?', (key,))
+                return None
+            if row is None:
+                # The file was moved to the store, but the process died before it was indexed
+                self._insert(key, product, scene_id, product_format, path)
+            else:
+                self._connection.execute('UPDATE files SET accessed = ? WHERE key = ?', (time.time(), key))
+        return path
+
+    def _insert(self, key, product, scene_id, product_format, path):
+        now = time.time()
+        self._connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                 (key, unicode(product), scene_id, product_format, path, os.path.getsize(path),
+                                  now, now))
+
+    def put(self, product, scene_id, product_format, filename):
+        """
+        Move the complete file to the store. Return its path in the store.
+        The caller should hold the lock of the scene.
+        """
+        key = self.key(product, scene_id, product_format)
+        path = self.path(product, scene_id, product_format)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+        # The file appears in the store only complete
+        moving_path = path + '.moving'
+        shutil.move(filename, moving_path)
+        os.rename(moving_path, path)
+        with self._lock, self._connection:
+            self._insert(key, product, scene_id, product_format, path)
+        self.evict(keep=key)
+        return path
+
+    def link(self, path, target):
+        """
+        Hand out the stored file to the target path (see link_file).
+        """
+        return link_file(path, target, self.link_methods)
+
+    @property
+    def size(self):
+        with self._lock:
+            return self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM files').fetchone()[0]
+
+    def _try_lock(self, key):
+        f = open(self._path('locks', key + '.lock'), 'a')
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            f.close()
+            return None
+        return f
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used files while the total size exceeds max_size.
+        Files locked by other workers and the file with the key keep are skipped.
+        Return count of the removed files.
+        """
+        if self.max_size is None:
+            return 0
+
+        with self._lock:
+            total = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM files').fetchone()[0]
+            if total <= self.max_size:
+                return 0
+            rows = self._connection.execute('SELECT key, path, size, accessed FROM files ORDER BY accessed').fetchall()
+
+        removed = 0
+        for key, path, size, accessed in rows:
+            if total <= self.max_size:
+                break
+            if key == keep:
+                continue
+            lock_file = self._try_lock(key)
+            if lock_file is None:
+                continue
+            try:
+                with self._lock, self._connection:
+                    # The file could be used or stored again before it was locked
+                    if self._connection.execute('DELETE FROM files WHERE key = ? AND accessed = ?',
+                                                (key, accessed)).rowcount != 1:
+                        continue
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                lock_file.close()
+            total -= size
+            removed += 1
+        return removed
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def default_store():
+    """
+    Return the store at STORE_PATH from config or None if the path isn't set.
+    """
+    global _default_store
+
+    if not downloader_config.STORE_PATH:
+        return None
+
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = SceneStore(downloader_config.STORE_PATH)
+    return _default_store
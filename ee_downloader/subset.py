@@ -0,0 +1,201 @@
+__author__ = "NextGIS (info@nextgis.com)"
+__copyright__ = "Copyright (C) NextGIS"
+__license__ = "GPL v.2"
+
+import os
+import shutil
+import tempfile
+import time
+
+import requests
+
+from extract import extract_bands, extract_zip_members
+from metrics import default_metrics
+from segmented import probe_ranges
+from workers import retry
+import config as downloader_config
+
+
+class RangeFile(object):
+    """
+    Read-only seekable file object reading the remote file by Range requests.
+
+    Every request fetches at least block_size bytes, so the small reads of zipfile
+    (headers, central directory) don't become separate requests.
+    """
+
+    def __init__(self, session, url, size, block_size=None, bandwidth=None, priority=None):
+        """
+        :param session: EESession
+        :param url: URL of the file (the one the download URL redirects to saves a request every read)
+        :param size:    size of the file
+        :param block_size:  min size of every request (SUBSET_BLOCK_SIZE from config by default)
+        :param bandwidth:   BandwidthLimiter accounting the fetched bytes
+        :param priority:    priority class of the requests passed to the limiter
+        """
+        self.session = session
+        self.url = url
+        self.size = size
+        self.block_size = block_size or downloader_config.SUBSET_BLOCK_SIZE
+        self.bandwidth = bandwidth
+        self.priority = priority
+        self.bytes = 0
+        self.requests = 0
+
+        self._position = 0
+        self._block = ''
+        self._block_start = 0
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise IOError('Negative position in "{0}"'.format(self.url))
+        self._position = offset
+
+    def tell(self):
+        return self._position
+
+    def _fetch(self, start, end):
+        r = self.session.get(self.url, headers={'Range': 'bytes={0}-{1}'.format(start, end - 1)})
+        if r.status_code != 206:
+            raise requests.exceptions.HTTPError('Range request is rejected with status {0}'.format(r.status_code),
+                                                response=r)
+        if self.bandwidth is not None:
+            self.bandwidth.transfer(len(r.content), self.priority)
+        if len(r.content) != end - start:
+            raise IOError('Range request returned {0} of {1} bytes'.format(len(r.content), end - start))
+        return r.content
+
+    def read(self, size=-1):
+        end = self.size if size < 0 else min(self.size, self._position + size)
+        if end <= self._position:
+            return ''
+
+        parts = []
+        block_end = self._block_start + len(self._block)
+        if self._block_start <= self._position < block_end:
+            offset = self._position - self._block_start
+            parts.append(self._block[offset:offset + end - self._position])
+            self._position += len(parts[-1])
+
+        if self._position < end:
+            start = self._position
+            fetch_end = min(self.size, max(end, start + self.block_size))
+            self._block = retry(self._fetch, start, fetch_end)
+            self._block_start = start
+            self.bytes += fetch_end - start
+            self.requests += 1
+            parts.append(self._block[:end - start])
+            self._position = end
+        return ''.join(parts)
+
+    def close(self):
+        self._block = ''
+
+
+class _CountingFile(object):
+    def __init__(self, f, bandwidth=None, priority=None):
+        self._file = f
+        self._bandwidth = bandwidth
+        self._priority = priority
+        self.bytes = 0
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self.bytes += len(data)
+        if self._bandwidth is not None and data:
+            self._bandwidth.transfer(len(data), self._priority)
+        return data
+
+
+def _fetch_zip(session, url, extract_dir, bands, bandwidth, priority):
+    response, size = probe_ranges(session, url)
+    if size is None:
+        # No Range requests: the archive is downloaded to read its central directory
+        r = session.get(url, stream=True)
+        try:
+            r.raise_for_status()
+            source = _CountingFile(r.raw, bandwidth, priority)
+            with tempfile.TemporaryFile() as f:
+                shutil.copyfileobj(source, f, downloader_config.DOWNLOAD_CHUNK_SIZE)
+                f.seek(0)
+                return extract_zip_members(f, extract_dir, bands), source.bytes
+        finally:
+            r.close()
+
+    remote = RangeFile(session, response.url, size, bandwidth=bandwidth, priority=priority)
+    result = extract_zip_members(remote, extract_dir, bands)
+    default_metrics().increment('subset_requests', remote.requests)
+    return result, remote.bytes
+
+
+def _fetch_tar(session, url, extract_dir, bands, bandwidth, priority):
+    r = session.get(url, stream=True)
+    try:
+        r.raise_for_status()
+        source = _CountingFile(r.raw, bandwidth, priority)
+        # The connection is closed as soon as the requested members are extracted
+        return extract_bands(source, extract_dir, bands), source.bytes
+    finally:
+        r.close()
+
+
+def _moved(result, old_dir, new_dir):
+    def move(filename):
+        return os.path.join(new_dir, os.path.relpath(filename, old_dir))
+
+    return {'meta': move(result['meta']) if result['meta'] is not None else None,
+            'bands': dict((number, move(filename)) for number, filename in result['bands'].items()),
+            'files': [move(filename) for filename in result['files']]}
+
+
+def fetch_bands(session, url, extension, extract_dir, bands=None, bandwidth=None, priority=None):
+    """
+    Fetch only the requested bands and the metadata file of the remote archive instead of the whole archive.
+
+    .zip archives are read by Range requests: the central directory and the requested members only.
+    .tar.gz archives can't be read at random positions, so the archive is streamed and the connection
+    is closed as soon as the requested members are extracted.
+    The files appear in extract_dir only when all of them are fetched.
+
+    :param session: EESession
+    :param extension:   extension of the archive from FORMATS ('.zip' or '.tar.gz')
+    :param extract_dir: directory for the files (the same layout as the extraction of the whole archive)
+    :param bands:   list of band numbers (all the rasters by default)
+    :param bandwidth:   BandwidthLimiter every read of the remote archive is accounted in (see workers.default_bandwidth)
+    :param priority:    priority class of the fetch passed to the limiter (PRIORITY_BULK by default)
+    :return:    the same dictionary as extract.extract_bands returns
+    """
+    if extension == '.zip':
+        fetch = _fetch_zip
+    elif extension == '.tar.gz':
+        fetch = _fetch_tar
+    else:
+        raise ValueError('Bands can\'t be fetched from "{0}" files'.format(extension))
+
+    part_dir = extract_dir + '.part'
+    shutil.rmtree(part_dir, ignore_errors=True)
+    start = time.time()
+    try:
+        result, size = fetch(session, url, part_dir, bands, bandwidth, priority)
+    except Exception:
+        shutil.rmtree(part_dir, ignore_errors=True)
+        raise
+
+    if bands is not None:
+        missing = sorted(set(bands) - set(result['bands']))
+        if missing:
+            shutil.rmtree(part_dir, ignore_errors=True)
+            raise IOError('Bands {0} are not found in "{1}"'.format(missing, url))
+
+    shutil.rmtree(extract_dir, ignore_errors=True)
+    os.rename(part_dir, extract_dir)
+
+    metrics = default_metrics()
+    seconds = time.time() - start
+    metrics.observe('subset', seconds, url=url, bytes=size, speed=size / seconds if seconds else None)
+    metrics.increment('download_bytes', size)
+    return _moved(result, part_dir, extract_dir)
@@ -0,0 +1,87 @@
+__author__ = "NextGIS (info@nextgis.com)"
+__copyright__ = "Copyright (C) NextGIS"
+__license__ = "GPL v.2"
+
+import time
+
+import config as downloader_config
+
+
+class StreamWriter(object):
+    """
+    Copy the body of the streamed response to the file through one reused buffer.
+
+    Data are read by readinto() straight into the buffer and written from a memoryview
+    of it, so no new string is created for every chunk. After the copy the writer
+    keeps the count of bytes, the time spent and the achieved speed.
+    """
+
+    def __init__(self, chunk_size=None, preallocate=None):
+        """
+        :param chunk_size:  size of the buffer in bytes (DOWNLOAD_CHUNK_SIZE from config by default)
+        :param preallocate: extend the file to the expected size before writing
+                            (DOWNLOAD_PREALLOCATE from config by default)
+        """
+        if chunk_size is None:
+            chunk_size = downloader_config.DOWNLOAD_CHUNK_SIZE
+        if preallocate is None:
+            preallocate = downloader_config.DOWNLOAD_PREALLOCATE
+
+        self.chunk_size = chunk_size
+        self.preallocate = preallocate
+        self.bytes = 0
+        self.seconds = 0.0
+
+    @property
+    def speed(self):
+        """
+        Achieved speed in bytes per second.
+        """
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+    def write(self, response, f, size=None, callback=None):
+        """
+        Write the response body to the file from its current position.
+
+        :param response:    requests response opened with stream=True
+        :param f:   file opened for binary writing
+        :param size:    expected count of bytes from the current position (used for preallocation)
+        :param callback:    function called with every written chunk
+        :return:    count of written bytes
+        """
+        if self.preallocate and size:
+            position = f.tell()
+            f.truncate(position + size)
+            f.seek(position)
+
+        written = 0
+        start = time.time()
+        try:
+            for chunk in self._chunks(response):
+                f.write(chunk)
+                written += len(chunk)
+                if callback is not None:
+                    callback(chunk)
+        finally:
+            self.bytes += written
+            self.seconds += time.time() - start
+
+        return written
+
+    def _chunks(self, response):
+        headers = getattr(response, 'headers', {})
+        if headers.get('Content-Encoding', 'identity') != 'identity':
+            # Decoded data may be longer than the buffer, so compressed transfer goes the usual way
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                if chunk:  # filter out keep-alive new chunks
+                    yield chunk
+            return
+
+        buf = bytearray(self.chunk_size)
+        view = memoryview(buf)
+        raw = response.raw
+        while True:
+            n = raw.readinto(buf)
+            if not n:
+                break
+            yield view[:n]
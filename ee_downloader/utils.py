@@ -3,15 +3,27 @@ __author__ = "Dmitry Kolesov (kolesov.dm@gmail.com)"
 __copyright__ = "Copyright (C) NextGIS"
 __license__ = "GPL v.2"
 
+import collections
+import itertools
+import multiprocessing
 import os
+import threading
 import zipfile
 import tarfile
 
 import shapely
+import shapely.wkt
 from shapely.geometry import Polygon
 from shapely.geometry import mapping
 from shapely.geometry import box
+from shapely.prepared import prep
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from packing import write_zip
 import config as downloader_config
 
 
@@ -32,6 +44,9 @@ class CoordinateConverter():
         Changing the bbox (and therefore bbox_work) is only possible provided that
         bbox will be intersected by 180 Meridian and
         will not be intersected by 0 one/
+
+        If numpy is installed, the coordinates of the polygons are converted as arrays.
+        The *Batch methods convert the coordinates of all the polygons of the list in a single pass.
     """
     bbox = [[18, 40, 180, 82], [18, -180, -168, 82]]
     bbox_work = [18, 40, 192, 82]
@@ -40,13 +55,102 @@ class CoordinateConverter():
     def isAvailableFor(cls, shapely_multipolygon):
         bbox_polygon = box(*cls.bbox_work)
 
-        for shapely_polygon in shapely_multipolygon.geoms:
-            shapely_polygon = cls.toWorkProj(shapely_polygon)
+        for shapely_polygon in cls.toWorkProjBatch(shapely_multipolygon.geoms):
             if not shapely_polygon.within(bbox_polygon):
                 return False
 
         return True
 
+    @classmethod
+    def toWorkCoords(cls, coords):
+        """
+            Convert numpy array of points (one point per row) to working CS in place.
+        """
+        x = coords[:, 0]
+        x[x < 0] += 360
+        return coords
+
+    @classmethod
+    def toOrignCoords(cls, coords):
+        """
+            Convert numpy array of points (one point per row) to original CS in place.
+        """
+        x = coords[:, 0]
+        x[x > 180] -= 360
+        return coords
+
+    @classmethod
+    def intersectionWorkCoords(cls, coords):
+        """
+            Clamp numpy array of points (one point per row) in working CS to bbox_work in place.
+        """
+        (xmin, ymin, xmax, ymax) = cls.bbox_work
+        numpy.clip(coords[:, 0], xmin, xmax, out=coords[:, 0])
+        numpy.clip(coords[:, 1], ymin, ymax, out=coords[:, 1])
+        return coords
+
+    @classmethod
+    def _transformBatch(cls, shapely_polygons, transform):
+        """
+            Apply the transform to the coordinates of all the polygons at once and build the new polygons.
+        """
+        rings = []
+        counts = []
+        for shapely_polygon in shapely_polygons:
+            if shapely_polygon.is_empty:
+                counts.append(0)
+                continue
+            polygon_rings = [shapely_polygon.exterior] + list(shapely_polygon.interiors)
+            rings.extend(numpy.asarray(ring.coords, dtype=float) for ring in polygon_rings)
+            counts.append(len(polygon_rings))
+
+        if rings:
+            coords = transform(numpy.concatenate(rings))
+            rings = numpy.split(coords, numpy.cumsum([len(ring) for ring in rings])[:-1])
+
+        result = []
+        position = 0
+        for count in counts:
+            if count:
+                result.append(Polygon(rings[position], rings[position + 1:position + count]))
+            else:
+                result.append(Polygon())
+            position += count
+        return result
+
+    @classmethod
+    def toWorkProjBatch(cls, shapely_polygons):
+        """
+            Create list of shapely.geometry.Polygon with coordinates in working CS.
+
+            :param shapely_polygons: list of shapely.geometry.Polygon in original CS.
+        """
+        if numpy is None:
+            return [cls._toWorkProjPoints(shapely_polygon) for shapely_polygon in shapely_polygons]
+        return cls._transformBatch(shapely_polygons, cls.toWorkCoords)
+
+    @classmethod
+    def toOrignProjBatch(cls, shapely_polygons):
+        """
+            Create list of shapely.geometry.Polygon with coordinates in original CS.
+
+            :param shapely_polygons: list of shapely.geometry.Polygon in working CS.
+        """
+        if numpy is None:
+            return [cls._toOrignProjPoints(shapely_polygon) for shapely_polygon in shapely_polygons]
+        return cls._transformBatch(shapely_polygons, cls.toOrignCoords)
+
+    @classmethod
+    def intersectionWorkBatch(cls, shapely_polygons):
+        """
+            Create list of shapely.geometry.Polygon intersected with bbox_work.
+
+            :param shapely_polygons: list of shapely.geometry.Polygon in working CS.
+        """
+        if numpy is None:
+            return [cls._intersectionWorkPoints(shapely_polygon) for shapely_polygon in shapely_polygons]
+        return cls._transformBatch(shapely_polygons, cls.intersectionWorkCoords)
+
     @classmethod
     def toWorkProj(cls, shapely_polygon):
         """
@@ -54,6 +158,15 @@ class CoordinateConverter():
 
             :param shapely_polygon: shapely.geometry.Polygon in original CS.
         """
+        if numpy is None:
+            return cls._toWorkProjPoints(shapely_polygon)
+        return cls._transformBatch([shapely_polygon], cls.toWorkCoords)[0]
+
+    @classmethod
+    def _toWorkProjPoints(cls, shapely_polygon):
+        """
+            Point by point version of toWorkProj (used without numpy).
+        """
         geojson_def = mapping(shapely_polygon)
         new_geojson_def = geojson_def
 
@@ -78,6 +191,15 @@ class CoordinateConverter():
 
             :param shapely_polygon: shapely.geometry.Polygon in working CS.
         """
+        if numpy is None:
+            return cls._toOrignProjPoints(shapely_polygon)
+        return cls._transformBatch([shapely_polygon], cls.toOrignCoords)[0]
+
+    @classmethod
+    def _toOrignProjPoints(cls, shapely_polygon):
+        """
+            Point by point version of toOrignProj (used without numpy).
+        """
         geojson_def = mapping(shapely_polygon)
         new_geojson_def = geojson_def
 
@@ -101,6 +223,15 @@ class CoordinateConverter():
 
             :param shapely_polygon: shapely.geometry.Polygon in working CS.
         """
+        if numpy is None:
+            return cls._intersectionWorkPoints(shapely_polygon)
+        return cls._transformBatch([shapely_polygon], cls.intersectionWorkCoords)[0]
+
+    @classmethod
+    def _intersectionWorkPoints(cls, shapely_polygon):
+        """
+            Point by point version of intersectionWork (used without numpy).
+        """
         (xmin, ymin, xmax, ymax) = cls.bbox_work
 
         geojson_def = mapping(shapely_polygon)
@@ -131,15 +262,120 @@ class CoordinateConverter():
         return shapely.geometry.asShape(new_geojson_def)
 
 
-def simplify_geom(wkt, max_points=30):
+def _fits(candidate, original, max_points):
+    result = CoordinateConverter.intersectionWork(Polygon(candidate.exterior))
+    if len(result.exterior.coords) <= max_points and prep(result).contains(original):
+        return result
+    return None
+
+
+def _simplify_buffer(simplified_orign, max_points):
+    """
+    Simplification uses extending buffers:
+      create buffer, then simplify
+      if the result has more points then accepted, repeat with bigger buffer.
+    The buffer grows by 10% of the mean distance between the vertices on every iteration.
+    """
+    simplified = simplified_orign
+    multiplier = 1.0
+    for _ in range(downloader_config.SIMPLIFY_MAX_ITERATIONS):
+        result = _fits(simplified, simplified_orign, max_points)
+        if result is not None:
+            return result
+
+        exterior = simplified.exterior
+        mean_dist = exterior.length / len(exterior.coords)
+        dist = mean_dist * multiplier
+        multiplier += 0.1
+
+        buf = exterior.buffer(dist)
+        simplified = buf.simplify(dist)
+    return None
+
+
+# Relative precision (to the size of the geometry) of the buffer distance found by the binary search
+SIMPLIFY_PRECISION = 0.005
+
+
+def _simplify_bisect(simplified_orign, max_points):
+    """
+    Binary search of the smallest buffer distance giving at most max_points vertices.
+
+    The search runs on a cheap cover of the polygon: the polygon simplified with a small tolerance
+    and extended by the same distance. The buffer distance is doubled from that tolerance until
+    the buffer of the cover simplified with the same distance fits, then the interval between
+    the last failed and the fitting distance is halved down to the precision.
+    """
+    result = _fits(simplified_orign, simplified_orign, max_points)
+    if result is not None:
+        return result
+
+    minx, miny, maxx, maxy = simplified_orign.bounds
+    precision = max(maxx - minx, maxy - miny) * SIMPLIFY_PRECISION
+    # Vertices of the simplified polygon are within the tolerance from the original one,
+    # 5% are added for the buffer arcs approximated by the chords
+    cover = simplified_orign.simplify(precision).buffer(precision * 1.05)
+
+    low = 0.0
+    high = precision
+    best = None
+    for _ in range(downloader_config.SIMPLIFY_MAX_ITERATIONS):
+        dist = high if best is None else (low + high) / 2
+        result = _fits(cover.buffer(dist).simplify(dist), simplified_orign, max_points)
+        if result is not None:
+            best = result
+            high = dist
+        elif best is None:
+            low = high
+            high *= 2
+        else:
+            low = dist
+        if best is not None and high - low <= precision:
+            break
+    return best
+
+
+SIMPLIFY_METHODS = {
+    'buffer': _simplify_buffer,
+    'bisect': _simplify_bisect
+}
+
+_simplify_cache = collections.OrderedDict()
+_simplify_cache_lock = threading.Lock()
+
+
+def simplify_geom(wkt, max_points=30, method=None):
     """Simplify geometry. The result is polygon, it
     contains <= max_points vertices.
 
+    Count of iterations is limited by SIMPLIFY_MAX_ITERATIONS from config. If the simplification
+    doesn't converge, the envelope of the geometry is returned. Results are memoized
+    for the last SIMPLIFY_CACHE_SIZE geometries.
+
     :param max_points: Threshold for allowed count of points.
+    :param method:  'bisect' (binary search of the buffer distance) or 'buffer' (the buffer
+                    is extended step by step), SIMPLIFY_METHOD from config by default
     """
     if max_points <= 8:
         raise ValueError("Simplification can't be done (desired number of points is too small).")
+    if method is None:
+        method = downloader_config.SIMPLIFY_METHOD
+    if method not in SIMPLIFY_METHODS:
+        raise ValueError('Unknown simplification method "{0}"'.format(method))
 
+    key = (wkt, max_points, method)
+    with _simplify_cache_lock:
+        if key in _simplify_cache:
+            result = _simplify_cache.pop(key)
+            _simplify_cache[key] = result
+            return result
+
+    result = _simplify_geom(wkt, max_points, method)
+    _memoize_simplified(key, result)
+    return result
+
+
+def _simplify_geom(wkt, max_points, method):
     data = shapely.wkt.loads(wkt)
 
     # If data consists of several polygons,
@@ -151,29 +387,60 @@ def simplify_geom(wkt, max_points=30):
 
     simplified = CoordinateConverter.toWorkProj(simplified)
     simplified = CoordinateConverter.intersectionWork(simplified)
-    simplified_orign = simplified
 
-    # Simplification uses extending buffers:
-    #   create buffer, then simplify
-    #   if the result has more points then accepted, repeat with bigger buffer.
-    # This procedure should converge after a finite number of iterations
-    multiplier = 1.0
-    while True:
-        exterior = simplified.exterior
-        result = CoordinateConverter.intersectionWork(Polygon(exterior))
+    result = SIMPLIFY_METHODS[method](simplified, max_points)
+    if result is None:
+        result = simplified.envelope
 
-        n_points = len(result.exterior.coords)
-        if (n_points <= max_points) and (result.contains(simplified_orign)):
-            break
+    return CoordinateConverter.toOrignProj(result).wkt
 
-        mean_dist = exterior.length / len(exterior.coords)
-        dist = mean_dist * multiplier
-        multiplier += 0.1
 
-        buf = exterior.buffer(dist)
-        simplified = buf.simplify(dist)
+def _simplify_task(args):
+    return simplify_geom(*args)
 
-    return CoordinateConverter.toOrignProj(result).wkt
+
+def _memoize_simplified(key, result):
+    with _simplify_cache_lock:
+        _simplify_cache[key] = result
+        while len(_simplify_cache) > downloader_config.SIMPLIFY_CACHE_SIZE:
+            _simplify_cache.popitem(last=False)
+
+
+def simplify_geoms(wkts, max_points=30, method=None, processes=None):
+    """Simplify many geometries on a pool of processes.
+    Return list of the results in the order of the geometries.
+    Repeated and memoized geometries aren't simplified again.
+
+    :param processes: count of processes (count of CPUs by default). 1 simplifies in this process.
+    """
+    if method is None:
+        method = downloader_config.SIMPLIFY_METHOD
+
+    simplified = {}
+    with _simplify_cache_lock:
+        for wkt in wkts:
+            key = (wkt, max_points, method)
+            if key in _simplify_cache:
+                simplified[wkt] = _simplify_cache[key]
+    tasks = [(wkt, max_points, method) for wkt in collections.OrderedDict.fromkeys(wkts) if wkt not in simplified]
+
+    if processes == 1 or len(tasks) <= 1:
+        results = [_simplify_task(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_simplify_task, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+        # Results of the worker processes are memoized here too
+        for task, result in itertools.izip(tasks, results):
+            _memoize_simplified(task, result)
+
+    for task, result in itertools.izip(tasks, results):
+        simplified[task[0]] = result
+    return [simplified[wkt] for wkt in wkts]
 
 
 def silent_remove(filename):
@@ -181,11 +448,14 @@ def silent_remove(filename):
         os.remove(filename)
 
 
-def zip(filename_list, arch_name):
-    zf = zipfile.ZipFile(arch_name, mode='w', compression=zipfile.ZIP_DEFLATED, allowZip64=True)
-    for filename in filename_list:
-        zf.write(filename, os.path.basename(filename))
-    zf.close()
+def zip(filename_list, arch_name, processes=None):
+    """
+    Pack the files to .zip archive deflating them on a pool of processes (see packing.write_zip).
+
+    :param arch_name:   path to the archive or file object the archive is streamed to
+    :param processes:   count of processes (ZIP_PROCESSES from config or count of CPUs by default)
+    """
+    return write_zip(filename_list, arch_name, processes=processes)
 
 
 def check_archive_fast(datafile, product_format):
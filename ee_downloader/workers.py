@@ -0,0 +1,531 @@
+__author__ = "NextGIS (info@nextgis.com)"
+__copyright__ = "Copyright (C) NextGIS"
+__license__ = "GPL v.2"
+
+import itertools
+import sys
+import threading
+import time
+import urlparse
+import Queue
+from contextlib import contextmanager
+
+import requests
+
+from scene import download_option
+from scheduler import TokenBucket, backoff_delay
+from scraper import parse_size
+import config as downloader_config
+
+
+# Period in seconds of the checks whether the consumer of the pipeline has stopped
+_POLL_INTERVAL = 0.1
+# Failed requests repeated by RequestScheduler of the session already (connection errors and bad statuses)
+_SCHEDULED_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.HTTPError)
+
+
+class HostThrottle(object):
+    """
+    Limit the count of simultaneous connections to every host.
+
+    Connections are counted per host (netloc of the URL), so downloads from different mirrors
+    do not block each other. Downloads of all the priority classes share the limit, but `reserved`
+    connections of every host are left to the interactive ones (classes below PRIORITY_BULK),
+    and a waiting interactive download takes the next free connection before the bulk ones.
+    """
+
+    def __init__(self, max_per_host=None, reserved=None):
+        """
+        :param max_per_host:    count of connections to one host (MAX_CONNECTIONS_PER_HOST from config by default)
+        :param reserved:    count of the connections bulk downloads don't take (INTERACTIVE_CONNECTIONS_PER_HOST
+                            from config by default). At least one connection is left to the bulk downloads.
+        """
+        if max_per_host is None:
+            max_per_host = downloader_config.MAX_CONNECTIONS_PER_HOST
+        if max_per_host < 1:
+            raise ValueError('Count of connections per host should be positive')
+        if reserved is None:
+            reserved = downloader_config.INTERACTIVE_CONNECTIONS_PER_HOST
+
+        self.max_per_host = max_per_host
+        self.reserved = max(0, min(reserved, max_per_host - 1))
+        self._condition = threading.Condition()
+        self._active = {}
+        self._waiting = {}
+
+    @staticmethod
+    def _host(url):
+        return urlparse.urlparse(url).netloc
+
+    def _is_free(self, host, priority):
+        active = self._active.get(host, 0)
+        if priority is not None and priority < downloader_config.PRIORITY_BULK:
+            return active < self.max_per_host
+        return active < self.max_per_host - self.reserved and not self._waiting.get(host)
+
+    def try_acquire(self, url, priority=None):
+        """
+        Take a connection to the host of the URL if one is free, without waiting. Return True if it is taken,
+        the connection should be given back by release().
+
+        :param priority:    priority class of the download (PRIORITY_BULK by default)
+        """
+        host = self._host(url)
+        with self._condition:
+            if not self._is_free(host, priority):
+                return False
+            self._active[host] = self._active.get(host, 0) + 1
+            return True
+
+    def release(self, url):
+        host = self._host(url)
+        with self._condition:
+            active = self._active.get(host, 0)
+            if not active:
+                raise ValueError('Connection to "{0}" is released more times than taken'.format(host))
+            self._active[host] = active - 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def acquire(self, url, priority=None):
+        """
+        Wait for a connection to the host of the URL.
+
+        :param priority:    priority class of the download (PRIORITY_BULK by default)
+        """
+        host = self._host(url)
+        interactive = priority is not None and priority < downloader_config.PRIORITY_BULK
+        with self._condition:
+            if interactive:
+                self._waiting[host] = self._waiting.get(host, 0) + 1
+            try:
+                while not self._is_free(host, priority):
+                    self._condition.wait()
+            finally:
+                if interactive:
+                    self._waiting[host] -= 1
+            self._active[host] = self._active.get(host, 0) + 1
+        try:
+            yield
+        finally:
+            self.release(url)
+
+
+class DownloadResults(object):
+    """
+    Thread safe storage for the results of the download workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results = []
+
+    def add(self, scene, filename):
+        with self._lock:
+            self._results.append((scene, filename))
+
+    def succeeded(self):
+        with self._lock:
+            return [scene for scene, filename in self._results if filename is not None]
+
+    def failed(self):
+        with self._lock:
+            return [scene for scene, filename in self._results if filename is None]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._results)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._results))
+
+
+class WorkerPool(object):
+    """
+    Bounded pool of daemon threads executing the submitted tasks.
+
+    Tasks are queued in the order of submission, or in the order of their keys if they are
+    submitted by submit_ordered. Exceptions raised by a task are caught and stored in ``errors``
+    so one broken task can't stop the pool.
+    """
+
+    _STOP = object()
+
+    def __init__(self, workers=None):
+        if workers is None:
+            workers = downloader_config.DOWNLOAD_WORKERS
+        if workers < 1:
+            raise ValueError('Count of workers should be positive')
+
+        self.errors = []
+        self._errors_lock = threading.Lock()
+        self._tasks = Queue.PriorityQueue()
+        # Tasks with equal keys are taken in the order of submission
+        self._sequence = itertools.count()
+        self._threads = []
+        for _ in range(workers):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            task = self._tasks.get()[-1]
+            try:
+                if task is self._STOP:
+                    return
+                func, args, kwargs = task
+                func(*args, **kwargs)
+            except Exception as e:
+                with self._errors_lock:
+                    self.errors.append(e)
+            finally:
+                self._tasks.task_done()
+
+    def submit(self, func, *args, **kwargs):
+        self.submit_ordered(0, func, *args, **kwargs)
+
+    def submit_ordered(self, key, func, *args, **kwargs):
+        """
+        Queue the task before the waiting tasks with greater keys (submit uses key 0).
+        """
+        self._tasks.put((0, key, next(self._sequence), (func, args, kwargs)))
+
+    def join(self):
+        """
+        Wait until every submitted task is done and stop the workers.
+        """
+        for _ in self._threads:
+            # Stop goes after every task whatever its key is
+            self._tasks.put((1, None, next(self._sequence), self._STOP))
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.join()
+
+
+class DownloadScheduler(object):
+    """
+    Pools of workers for the priority classes of the downloads (PRIORITY_INTERACTIVE, PRIORITY_BULK...).
+
+    Every class has its own workers, so previews and quick-look images are downloaded at once
+    even while all the bulk workers are busy with the archives of several GB. Downloads of one class
+    go shortest job first: in the order of their expected sizes.
+    """
+
+    def __init__(self, workers=None, interactive_workers=None):
+        """
+        :param workers: count of workers of every class but the interactive one (DOWNLOAD_WORKERS
+                        from config by default)
+        :param interactive_workers: count of workers of the interactive class (INTERACTIVE_WORKERS
+                                    from config by default)
+        """
+        self.workers = workers or downloader_config.DOWNLOAD_WORKERS
+        self.interactive_workers = interactive_workers or downloader_config.INTERACTIVE_WORKERS
+        self._lock = threading.Lock()
+        self._pools = {}
+
+    def _pool(self, priority):
+        with self._lock:
+            pool = self._pools.get(priority)
+            if pool is None:
+                # Pools are started on demand, a job of one class doesn't keep idle threads of the others
+                workers = self.interactive_workers if priority == downloader_config.PRIORITY_INTERACTIVE \
+                    else self.workers
+                pool = self._pools[priority] = WorkerPool(workers)
+        return pool
+
+    def submit(self, priority, size, func, *args, **kwargs):
+        """
+        :param priority:    priority class of the task
+        :param size:    expected size of the download in bytes
+        """
+        self._pool(priority).submit_ordered(size or 0, func, *args, **kwargs)
+
+    @property
+    def errors(self):
+        with self._lock:
+            pools = list(self._pools.values())
+        return [error for pool in pools for error in pool.errors]
+
+    def join(self):
+        """
+        Wait until every submitted task is done and stop the workers.
+        """
+        with self._lock:
+            pools = [pool for _, pool in sorted(self._pools.items())]
+        for pool in pools:
+            pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.join()
+
+
+def download_priority(product_format, scene=None):
+    """
+    Return (priority class, expected size) of the download of the format. The size is taken
+    from the download option of the scene, the size of the format from config is used
+    if the scene isn't given or its option doesn't show the size.
+    """
+    options = downloader_config.FORMATS.get(product_format, {})
+    size = None
+    if scene is not None:
+        size = parse_size(download_option(scene, product_format))
+    if size is None:
+        size = options.get('size', 0)
+    return options.get('priority', downloader_config.PRIORITY_BULK), size
+
+
+class RateLimiter(TokenBucket):
+    """
+    Token bucket limiting the rate of the requests shared by several threads.
+    """
+
+    def __init__(self, rate=None, burst=None):
+        """
+        :param rate:    count of requests per second (SEARCH_RATE from config by default)
+        :param burst:   count of requests allowed to go without waiting (rate by default)
+        """
+        if rate is None:
+            rate = downloader_config.SEARCH_RATE
+        super(RateLimiter, self).__init__(rate, burst)
+
+
+def retry(func, *args, **kwargs):
+    """
+    Call the function and repeat the call if it raises IOError, e.g. when the connection breaks
+    while the data are read. Connection errors and HTTP errors of the requests aren't repeated:
+    the requests of EESession are repeated by RequestScheduler already.
+
+    Count of attempts is REQUEST_RETRIES from config, the delay between them grows exponentially
+    from RETRY_DELAY with random jitter (see scheduler.backoff_delay).
+    """
+    for attempt in range(downloader_config.REQUEST_RETRIES):
+        try:
+            return func(*args, **kwargs)
+        except _SCHEDULED_ERRORS:
+            raise
+        except IOError:
+            if attempt + 1 >= downloader_config.REQUEST_RETRIES:
+                raise
+        time.sleep(backoff_delay(attempt))
+
+
+def imap_unordered(func, items, workers=None):
+    """
+    Apply the function to every item on a bounded pool of threads.
+
+    Results are yielded as soon as they are ready, not in the order of the items.
+    Only a few items are taken from the iterable ahead of the consumer, so it
+    may be a generator. An exception raised by the function is re-raised here.
+
+    :param workers: count of threads (SEARCH_WORKERS from config by default)
+    """
+    if workers is None:
+        workers = downloader_config.SEARCH_WORKERS
+
+    done = Queue.Queue()
+
+    def call(item):
+        try:
+            done.put((True, func(item)))
+        except Exception:
+            done.put((False, sys.exc_info()))
+
+    items = iter(items)
+    pool = WorkerPool(workers)
+    try:
+        pending = 0
+        for item in itertools.islice(items, workers * 2):
+            pool.submit(call, item)
+            pending += 1
+
+        while pending:
+            success, value = done.get()
+            pending -= 1
+            for item in itertools.islice(items, 1):
+                pool.submit(call, item)
+                pending += 1
+
+            if not success:
+                raise value[0], value[1], value[2]
+            yield value
+    finally:
+        pool.join()
+
+
+def pipeline(source, func, workers=None, queue_size=None):
+    """
+    Apply the function to the items of the source on a pool of threads while the source is still
+    producing them. Results are yielded as soon as they are ready.
+
+    The source is read in its own thread and is linked to the workers by a bounded queue,
+    so a slow consumer stops the source instead of piling the items up in memory.
+    An exception raised by the source or by the function is re-raised here. When the consumer
+    stops early (the generator is closed or an exception is raised), the threads finish
+    their current items and exit, and the source is closed.
+
+    :param source:  iterable of items (e.g. generator of the scenes)
+    :param workers: count of threads (DOWNLOAD_WORKERS from config by default)
+    :param queue_size:  max count of items waiting in every queue (PIPELINE_QUEUE_SIZE from config by default)
+    """
+    if workers is None:
+        workers = downloader_config.DOWNLOAD_WORKERS
+    if queue_size is None:
+        queue_size = downloader_config.PIPELINE_QUEUE_SIZE
+
+    stop = object()
+    stopped = threading.Event()
+    items = Queue.Queue(queue_size)
+    done = Queue.Queue(queue_size)
+    source_errors = []
+
+    def put(queue, item):
+        # Threads blocked on the full queue give up when the consumer is gone
+        while not stopped.is_set():
+            try:
+                queue.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def get(queue):
+        while not stopped.is_set():
+            try:
+                return queue.get(timeout=_POLL_INTERVAL)
+            except Queue.Empty:
+                pass
+        return stop
+
+    def feed():
+        iterator = iter(source)
+        try:
+            for item in iterator:
+                if not put(items, item):
+                    break
+        except Exception:
+            source_errors.append(sys.exc_info())
+        finally:
+            if stopped.is_set() and hasattr(iterator, 'close'):
+                iterator.close()
+            for _ in range(workers):
+                put(items, stop)
+
+    def work():
+        while True:
+            item = get(items)
+            if item is stop:
+                put(done, stop)
+                return
+            try:
+                result = True, func(item)
+            except Exception:
+                result = False, sys.exc_info()
+            if not put(done, result):
+                return
+
+    threads = [threading.Thread(target=feed)] + [threading.Thread(target=work) for _ in range(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        running = workers
+        while running:
+            result = done.get()
+            if result is stop:
+                running -= 1
+                continue
+            success, value = result
+            if not success:
+                raise value[0], value[1], value[2]
+            yield value
+
+        if source_errors:
+            error = source_errors[0]
+            raise error[0], error[1], error[2]
+    finally:
+        stopped.set()
+        for thread in threads:
+            thread.join()
+
+
+class BandwidthLimiter(TokenBucket):
+    """
+    Token bucket of the downloaded bytes shared by all the downloads of the process.
+
+    Every chunk waits for its tokens, so the total speed of all the downloads stays within the rate.
+    Waiting chunks are served by their priority classes: a chunk of a lower class doesn't take
+    the tokens while a chunk of a higher class is waiting, so the interactive downloads go ahead
+    of the bulk ones without going beyond the rate.
+    """
+
+    def __init__(self, rate=None, burst=None):
+        """
+        :param rate:    count of bytes per second (DOWNLOAD_BANDWIDTH from config by default)
+        :param burst:   count of bytes allowed to go without waiting (rate by default)
+        """
+        if rate is None:
+            rate = downloader_config.DOWNLOAD_BANDWIDTH
+        if not rate:
+            raise ValueError('Bandwidth should be positive')
+        super(BandwidthLimiter, self).__init__(rate, burst, rate)
+        self._condition = threading.Condition(self._lock)
+        self._waiting = {}
+
+    def transfer(self, size, priority=None):
+        """
+        Wait for the tokens of the count of bytes downloaded with the priority class (PRIORITY_BULK by default).
+        The bytes are taken when the bucket holds them (or is full) and no chunk of a higher class is waiting.
+        """
+        if priority is None:
+            priority = downloader_config.PRIORITY_BULK
+        needed = min(size, self.burst)
+        with self._condition:
+            self._waiting[priority] = self._waiting.get(priority, 0) + 1
+            try:
+                while True:
+                    now = time.time()
+                    self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                    self._last = now
+                    ahead = any(count for waiting, count in self._waiting.items() if waiting < priority)
+                    if self._tokens >= needed and not ahead:
+                        break
+                    # Chunks of the higher classes notify when they are done
+                    self._condition.wait((needed - self._tokens) / self.rate if self._tokens < needed else None)
+                self._tokens -= size
+            finally:
+                self._waiting[priority] -= 1
+                self._condition.notify_all()
+
+
+_default_bandwidth = None
+_default_bandwidth_lock = threading.Lock()
+
+
+def default_bandwidth():
+    """
+    Return the limiter of the downloads of the process with the rate DOWNLOAD_BANDWIDTH from config
+    or None if the bandwidth isn't limited.
+    """
+    global _default_bandwidth
+
+    rate = downloader_config.DOWNLOAD_BANDWIDTH
+    if not rate:
+        return None
+
+    with _default_bandwidth_lock:
+        if _default_bandwidth is None or _default_bandwidth.max_rate != rate:
+            _default_bandwidth = BandwidthLimiter(rate)
+    return _default_bandwidth
@@ -29,5 +29,9 @@ setup(
     include_package_data=True,
     zip_safe=False,
     install_requires=requires,
+    extras_require={
+        'numpy': ['numpy'],
+        'msgpack': ['msgpack']
+    },
     entry_points=entry_points
 )
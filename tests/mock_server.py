@@ -0,0 +1,333 @@
+"""
+Local stand-in of EarthExplorer for the end-to-end tests and the benchmarks.
+
+It emulates the login with CSRF token, the search (/tabs/save, /result/count, /result/index),
+the metadata lookup, the download options and the file download with Range support.
+Latency of every response, bandwidth of every download connection, share of the failed
+(503) responses and count of the scenes are configurable.
+
+    with MockEarthExplorer(scene_count=100, latency=0.05) as server:
+        with server.patch_config():
+            download_scenes_by_ids(server.login, server.password, server.identifiers(), ...)
+"""
+import BaseHTTPServer
+import SocketServer
+import base64
+import cgi
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import tarfile
+import threading
+import time
+import urlparse
+import uuid
+import zipfile
+from contextlib import contextmanager
+
+from ee_downloader import config as downloader_config
+
+
+class MockEarthExplorer(object):
+    def __init__(self, scene_count=10, file_size=256 * 1024, bands=3, latency=0, bandwidth=None, error_rate=0,
+                 login='User', password='Sekret'):
+        """
+        :param scene_count: count of scenes in the catalog of every product
+        :param file_size:   approximate size of every downloaded file in bytes
+        :param bands:   count of band files in every archive
+        :param latency: delay of every response in seconds
+        :param bandwidth:   max speed of every download connection in bytes per second (unlimited by default)
+        :param error_rate:  share of the responses replaced by 503 with Retry-After
+        """
+        self.scene_count = scene_count
+        self.file_size = file_size
+        self.bands = bands
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.login = login
+        self.password = password
+
+        self.sessions = {}
+        self.requests = {}
+        self.files = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{0}'.format(self._server.server_address[1])
+
+    @property
+    def auth_url(self):
+        return self.url + '/login/'
+
+    def start(self):
+        self._server = _ThreadingServer(('127.0.0.1', 0), _Handler)
+        self._server.mock = self
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @contextmanager
+    def patch_config(self):
+        """
+        Point the downloader to the server.
+        """
+        saved = downloader_config.EE_URL, downloader_config.AUTH_URL
+        downloader_config.EE_URL, downloader_config.AUTH_URL = self.url, self.auth_url
+        try:
+            yield self
+        finally:
+            downloader_config.EE_URL, downloader_config.AUTH_URL = saved
+
+    def count(self, path):
+        self.requests[path] = self.requests.get(path, 0) + 1
+
+    # Catalog
+
+    @staticmethod
+    def entity_id(product_id, i):
+        if product_id == downloader_config.PRODUCTS['Sentinel-2']['id']:
+            return 'S2A_OPER_MSI_L1C_TL_MOCK_{0:06d}_N02_04_01'.format(i)
+        return 'LC8{0:013d}LGN00'.format(i)
+
+    @staticmethod
+    def product_identifier(product_id, i):
+        if product_id == downloader_config.PRODUCTS['Sentinel-2']['id']:
+            return MockEarthExplorer.entity_id(product_id, i)
+        return 'LC08_L1TP_{0:06d}_20170406_20170414_01_T1'.format(i)
+
+    def identifiers(self, product_name='Landsat 8 OLI/TIRS C1 Level-1', count=None):
+        product_id = downloader_config.PRODUCTS[product_name]['id']
+        return [self.product_identifier(product_id, i) for i in range(count or self.scene_count)]
+
+    def search(self, product_id, identifiers):
+        found = []
+        for i in range(self.scene_count):
+            names = self.entity_id(product_id, i), self.product_identifier(product_id, i)
+            if not identifiers or any(identifier in name for identifier in identifiers for name in names):
+                found.append(i)
+        return found
+
+    def file(self, extension):
+        """
+        Return the content of the downloaded file of the format: valid archive with the bands
+        and the metadata file or the image with the correct signature.
+        """
+        with self._lock:
+            if extension not in self.files:
+                self.files[extension] = self._make_file(extension)
+            return self.files[extension]
+
+    def _make_file(self, extension):
+        band_size = max(1, self.file_size // max(self.bands, 1))
+        members = [('LC08_L1TP_MOCK_B{0}.TIF'.format(band), os.urandom(band_size))
+                   for band in range(1, self.bands + 1)]
+        members.append(('LC08_L1TP_MOCK_MTL.txt', 'GROUP = L1_METADATA_FILE\nEND_GROUP = L1_METADATA_FILE\nEND\n'))
+
+        data = io.BytesIO()
+        if extension == '.tar.gz':
+            with tarfile.open(fileobj=data, mode='w:gz') as archive:
+                for name, content in members:
+                    info = tarfile.TarInfo(name)
+                    info.size = len(content)
+                    info.mtime = time.time()
+                    archive.addfile(info, io.BytesIO(content))
+        elif extension == '.zip':
+            with zipfile.ZipFile(data, 'w', zipfile.ZIP_STORED) as archive:
+                for name, content in members:
+                    archive.writestr(name.replace('.TIF', '.jp2'), content)
+        elif extension == '.jpg':
+            data.write('\xff\xd8' + os.urandom(self.file_size) + '\xff\xd9')
+        else:
+            data.write('II*\0' + os.urandom(self.file_size))
+        return data.getvalue()
+
+
+class _ThreadingServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, client_address):
+        # Clients close the connections in the middle of the downloads (e.g. the segmented ones)
+        pass
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def mock(self):
+        return self.server.mock
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def handle_request(self, method):
+        url = urlparse.urlparse(self.path)
+        self.query = dict(urlparse.parse_qsl(url.query))
+        self.body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.mock.count(url.path)
+
+        if self.mock.latency:
+            time.sleep(self.mock.latency)
+
+        if url.path == '/login/':
+            return self.login(method)
+
+        state = self.mock.sessions.get(self.cookie())
+        if state is None:
+            return self.respond(302, headers={'Location': self.mock.auth_url})
+        if self.mock.error_rate and random.random() < self.mock.error_rate:
+            return self.respond(503, 'Service Unavailable', headers={'Retry-After': '0'})
+
+        if url.path == '/tabs/save' and method == 'POST':
+            return self.save_tab(state)
+        if url.path == '/result/count':
+            found = self.mock.search(state.get('dataset'), state.get('identifiers'))
+            return self.respond(200, json.dumps({'collectionCount': str(len(found))}),
+                                content_type='application/json')
+        if url.path == '/result/index' and method == 'POST':
+            return self.result_index(state)
+        if url.path == '/form/metadatalookup/':
+            return self.metadata()
+        match = re.match(r'/download/options/(\d+)/([^/]+)$', url.path)
+        if match:
+            return self.download_options(int(match.group(1)), match.group(2))
+        match = re.match(r'/download/(\d+)/([^/]+)/(\d+)/EE$', url.path)
+        if match:
+            return self.download(int(match.group(3)))
+        if url.path.startswith('/browse/'):
+            return self.respond(200, self.mock.file('.jpg'), content_type='image/jpeg')
+        self.respond(404, 'Not Found')
+
+    def cookie(self):
+        match = re.search(r'EESESSION=(\w+)', self.headers.get('Cookie', ''))
+        return match.group(1) if match else None
+
+    def respond(self, status, body='', content_type='text/html', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def login(self, method):
+        if method == 'GET':
+            return self.respond(200, '<form><input type="hidden" name="csrf_token" value="mock-csrf" id="csrf_token">'
+                                     '</form>')
+        form = dict(urlparse.parse_qsl(self.body))
+        if form.get('csrf_token') != 'mock-csrf' or \
+                (form.get('username'), form.get('password')) != (self.mock.login, self.mock.password):
+            return self.respond(200, 'Invalid username/password')
+        session_id = uuid.uuid4().hex
+        self.mock.sessions[session_id] = {}
+        self.respond(302, headers={'Location': self.mock.url + '/',
+                                   'Set-Cookie': 'EESESSION={0}; Path=/'.format(session_id)})
+
+    def save_tab(self, state):
+        data = json.loads(dict(urlparse.parse_qsl(self.body))['data'])
+        if data['tab'] == 1:
+            state.clear()
+        elif data['tab'] == 2:
+            state['dataset'] = int(data['selected'])
+        elif data['tab'] == 3:
+            criteria = data['criteria'][str(data['selected'])]
+            state['identifiers'] = [value for key, value in criteria.items() if key.startswith('text_') and value]
+        self.respond(200, '1')
+
+    def result_index(self, state):
+        product_id = state.get('dataset')
+        rows = []
+        for i in self.mock.search(product_id, state.get('identifiers')):
+            rows.append('<tr><td class="resultRowBrowse"><a class="displayBrowse" href="#">'
+                        '<img class="{0}" src="{1}/browse/thumbnails/{0}.jpg" alt="Browse" /></a></td>'
+                        '<td><ul><li><strong>Entity ID:</strong> {0}</li></ul></td></tr>'
+                        .format(self.mock.entity_id(product_id, i), self.mock.url))
+        self.respond(200, '<div id="resultsTab"><table class="resultPageTable">{0}</table></div>'.format(''.join(rows)))
+
+    def metadata(self):
+        product_id = int(self.query['collection_id'])
+        entity_id = self.query['entity_id']
+        match = re.search(r'(\d{13})LGN00|MOCK_(\d+)', entity_id)
+        i = int(match.group(1) or match.group(2))
+        fields = [('Entity ID', entity_id),
+                  ('Landsat Product Identifier', self.mock.product_identifier(product_id, i)),
+                  ('Acquisition Date', '2017/04/06'),
+                  ('Scene Cloud Cover', '12.34')]
+        rows = ''.join('<tr><td><a href="#">{0}</a></td><td>{1}</td></tr>'.format(cgi.escape(name), cgi.escape(value))
+                       for name, value in fields)
+        self.respond(200, '<div class="metadataContainer"><table><tr><th>Data Set Attribute</th>'
+                          '<th>Attribute Value</th></tr>{0}</table></div>'.format(rows))
+
+    def download_options(self, product_id, entity_id):
+        options = []
+        for i, name in enumerate(sorted(downloader_config.FORMATS)):
+            options.append('<div class="downloadButtons"><input type="button" class="button" '
+                           'onclick="window.location=\'{url}/download/{product_id}/{entity_id}/{i}/EE\'" '
+                           'title="Download" value="Download" /><div class="name">{name}</div></div>'
+                           .format(url=self.mock.url, product_id=product_id, entity_id=entity_id, i=i,
+                                   name=cgi.escape(name)))
+        self.respond(200, '<div id="optionsPage">{0}</div>'.format(''.join(options)))
+
+    def download(self, format_index):
+        name = sorted(downloader_config.FORMATS)[format_index]
+        data = self.mock.file(downloader_config.FORMATS[name]['extension'])
+        etag = '"{0}"'.format(hashlib.md5(data).hexdigest())
+
+        status, start, end = 200, 0, len(data)
+        headers = {'ETag': etag, 'Accept-Ranges': 'bytes'}
+        match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+        if_range = self.headers.get('If-Range')
+        if match and (if_range is None or if_range == etag):
+            start = int(match.group(1))
+            end = min(int(match.group(2)) + 1 if match.group(2) else len(data), len(data))
+            if start >= len(data):
+                return self.respond(416, headers={'Content-Range': 'bytes */{0}'.format(len(data))})
+            status = 206
+            headers['Content-Range'] = 'bytes {0}-{1}/{2}'.format(start, end - 1, len(data))
+        else:
+            headers['Content-MD5'] = base64.b64encode(hashlib.md5(data).digest())
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(end - start))
+        for header, value in headers.items():
+            self.send_header(header, value)
+        self.end_headers()
+
+        chunk_size = 64 * 1024
+        started = time.time()
+        sent = 0
+        for position in range(start, end, chunk_size):
+            self.wfile.write(data[position:min(position + chunk_size, end)])
+            sent += min(chunk_size, end - position)
+            if self.mock.bandwidth:
+                delay = started + float(sent) / self.mock.bandwidth - time.time()
+                if delay > 0:
+                    time.sleep(delay)
@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ee_downloader.cache import MetadataCache, METADATA, DOWNLOAD_OPTIONS
+
+
+class MetadataCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = MetadataCache(':memory:', metadata_ttl=None, options_ttl=3600, max_entries=3)
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_should_return_stored_data(self):
+        metadata = {u'Landsat Product Identifier': u'LC08_L1TP_137017_20170406_20170414_01_T1'}
+        self.cache.put(12864, 'LC81370172017096LGN00', METADATA, metadata)
+
+        self.assertEqual(metadata, self.cache.get(12864, 'LC81370172017096LGN00', METADATA))
+        self.assertIsNone(self.cache.get(12864, 'LC81370172017096LGN00', DOWNLOAD_OPTIONS))
+        self.assertIsNone(self.cache.get(10880, 'LC81370172017096LGN00', METADATA))
+
+    def test_should_expire_data(self):
+        self.cache.ttl[DOWNLOAD_OPTIONS] = -1
+        self.cache.put(12864, 'LC81370172017096LGN00', DOWNLOAD_OPTIONS, {u'LandsatLook Quality Image': u'url'})
+
+        self.assertIsNone(self.cache.get(12864, 'LC81370172017096LGN00', DOWNLOAD_OPTIONS))
+        self.assertEqual(0, len(self.cache))
+
+    def test_should_evict_least_recently_used(self):
+        for i in range(3):
+            self.cache.put(12864, 'scene_%d' % i, METADATA, {'n': i})
+        self.cache.get(12864, 'scene_0', METADATA)
+        self.cache.put(12864, 'scene_3', METADATA, {'n': 3})
+
+        self.assertEqual(3, len(self.cache))
+        self.assertIsNotNone(self.cache.get(12864, 'scene_0', METADATA))
+        self.assertIsNone(self.cache.get(12864, 'scene_1', METADATA))
+
+    def test_should_count_replaced_records_once(self):
+        for _ in range(3):
+            self.cache.put(12864, 'scene_0', METADATA, {'n': 0})
+        self.cache.put(12864, 'scene_1', METADATA, {'n': 1})
+        self.cache.put(12864, 'scene_2', METADATA, {'n': 2})
+
+        self.assertEqual(3, len(self.cache))
+        self.assertEqual({'n': 0}, self.cache.get(12864, 'scene_0', METADATA))
+
+    def test_should_keep_count_of_existing_database(self):
+        path = os.path.join(self.temp_dir, 'cache.sqlite')
+        cache = MetadataCache(path, max_entries=3)
+        for i in range(3):
+            cache.put(12864, 'scene_%d' % i, METADATA, {'n': i})
+        cache.close()
+
+        cache = MetadataCache(path, max_entries=3)
+        try:
+            self.assertEqual(3, len(cache))
+            cache.put(12864, 'scene_3', METADATA, {'n': 3})
+            self.assertEqual(3, len(cache))
+            self.assertIsNone(cache.get(12864, 'scene_0', METADATA))
+        finally:
+            cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from ee_downloader import config as downloader_config
+from ee_downloader.client import EEClient, Future, TimeoutError, as_completed
+from ee_downloader import workers
+from ee_downloader.workers import BandwidthLimiter
+from mock_server import MockEarthExplorer
+from test_end_to_end import CONFIG, LANDSAT, LANDSAT_FORMAT, SENTINEL
+
+
+class FutureTest(unittest.TestCase):
+    def test_should_return_result_and_call_callbacks(self):
+        future = Future()
+        done = []
+        future.add_done_callback(done.append)
+        self.assertRaises(TimeoutError, future.result, 0.01)
+
+        future.set_result(42)
+        self.assertEqual(42, future.result())
+        self.assertIsNone(future.exception())
+        self.assertEqual([future], done)
+        future.add_done_callback(done.append)
+        self.assertEqual(2, len(done))
+
+    def test_should_reraise_exception(self):
+        client = EEClient('User', 'Sekret', workers=2)
+        try:
+            future = client.submit(int, 'not a number')
+            self.assertRaises(ValueError, future.result, 5)
+            self.assertIsInstance(future.exception(), ValueError)
+        finally:
+            client.close()
+
+    def test_should_wait_for_pending_calls(self):
+        client = EEClient('User', 'Sekret', workers=2, max_pending=2)
+        release = threading.Event()
+        try:
+            futures = [client.submit(release.wait, 5) for _ in range(2)]
+            submitted = []
+            thread = threading.Thread(target=lambda: submitted.append(client.submit(lambda: 'third')))
+            thread.start()
+            time.sleep(0.1)
+            self.assertEqual([], submitted)
+
+            release.set()
+            thread.join(5)
+            self.assertEqual('third', submitted[0].result(5))
+            self.assertEqual(3, len(list(as_completed(futures + submitted, 5))))
+        finally:
+            client.close()
+
+
+class EEClientTest(unittest.TestCase):
+    def setUp(self):
+        self.saved_config = dict((name, getattr(downloader_config, name)) for name in CONFIG)
+        for name, value in CONFIG.items():
+            setattr(downloader_config, name, value)
+        self.temp_dir = tempfile.mkdtemp()
+        self.server = MockEarthExplorer(scene_count=5).start()
+        self.patch = self.server.patch_config()
+        self.patch.__enter__()
+
+    def tearDown(self):
+        self.patch.__exit__(None, None, None)
+        self.server.stop()
+        shutil.rmtree(self.temp_dir)
+        for name, value in self.saved_config.items():
+            setattr(downloader_config, name, value)
+
+    def test_should_search_and_download(self):
+        with EEClient(self.server.login, self.server.password, workers=3) as client:
+            scenes = client.get_scenes(self.server.identifiers(LANDSAT), LANDSAT).result(30)
+            self.assertEqual(5, len(scenes))
+            logins = self.server.requests['/login/']
+            futures = client.download_scenes(scenes, self.temp_dir, self.temp_dir, LANDSAT, LANDSAT_FORMAT)
+            filenames = [future.result() for future in as_completed(futures, 30)]
+
+        self.assertEqual(5, len(filenames))
+        self.assertTrue(all(filename and os.path.isfile(filename) for filename in filenames))
+        # Downloads use the session logged in by the search
+        self.assertEqual(logins, self.server.requests['/login/'])
+
+    def test_should_not_mix_simultaneous_searches(self):
+        # Requests are slowed down, so the searches overlap
+        self.server.latency = 0.02
+        with EEClient(self.server.login, self.server.password) as client:
+            landsat = client.search_scenes(self.server.identifiers(LANDSAT), LANDSAT)
+            sentinel = client.search_scenes(self.server.identifiers(SENTINEL), SENTINEL)
+            landsat_ids = [scene['id'] for scene in landsat.result(30)]
+            sentinel_ids = [scene['id'] for scene in sentinel.result(30)]
+
+        self.assertEqual(5, len(landsat_ids))
+        self.assertTrue(all(scene_id.startswith('LC8') for scene_id in landsat_ids))
+        self.assertEqual(5, len(sentinel_ids))
+        self.assertTrue(all(scene_id.startswith('S2A') for scene_id in sentinel_ids))
+
+    def test_should_download_previews_while_bulk_downloads_wait(self):
+        # The archive takes many chunks of the bandwidth, the previews take one
+        self.server.file_size = 48 * 1024
+        self.server.files['.jpg'] = '\xff\xd8' + os.urandom(1024) + '\xff\xd9'
+        chunk_size = downloader_config.DOWNLOAD_CHUNK_SIZE
+        downloader_config.DOWNLOAD_CHUNK_SIZE = 4 * 1024
+        downloader_config.DOWNLOAD_BANDWIDTH = 128 * 1024
+        # The burst of the default limiter would let the whole archive go without waiting
+        workers._default_bandwidth = BandwidthLimiter(downloader_config.DOWNLOAD_BANDWIDTH, 4 * 1024)
+        try:
+            with EEClient(self.server.login, self.server.password, workers=1) as client:
+                scenes = client.get_scenes(self.server.identifiers(LANDSAT), LANDSAT).result(30)
+                done = []
+                archive = client.download_scene(scenes[0], self.temp_dir, self.temp_dir, LANDSAT, LANDSAT_FORMAT)
+                previews = [client.download_preview(scene, self.temp_dir) for scene in scenes]
+                for future in [archive] + previews:
+                    future.add_done_callback(done.append)
+                filenames = [future.result(30) for future in previews]
+                self.assertTrue(archive.result(30))
+        finally:
+            downloader_config.DOWNLOAD_BANDWIDTH = None
+            downloader_config.DOWNLOAD_CHUNK_SIZE = chunk_size
+            workers._default_bandwidth = None
+
+        # Every preview is done before the archive
+        self.assertIs(archive, done[-1])
+        self.assertEqual(len(previews) + 1, len(done))
+        self.assertTrue(all(filename and filename.endswith('.jpg') and os.path.isfile(filename)
+                            for filename in filenames))
+        self.assertEqual(filenames, [scene['preview_file'] for scene in scenes])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import random
+import unittest
+
+import shapely.wkt
+from shapely.geometry import Polygon, MultiPolygon
+
+from ee_downloader.utils import CoordinateConverter, numpy, simplify_geom
+
+
+def random_polygon(rnd, points=50, hole=True):
+    xs = [rnd.uniform(-200, 200) for _ in range(points)]
+    ys = [rnd.uniform(-100, 100) for _ in range(points)]
+    shell = zip(xs, ys)
+    holes = [[(170, 60), (172, 60), (172, 62), (170, 62)]] if hole else []
+    return Polygon(shell, holes)
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class CoordinateConverterTest(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(1)
+        self.polygons = [random_polygon(rnd, hole=i % 2 == 0) for i in range(20)]
+
+    def assertSamePolygons(self, expected, actual):
+        self.assertEqual(len(expected), len(actual))
+        for expected_polygon, actual_polygon in zip(expected, actual):
+            self.assertEqual(list(expected_polygon.exterior.coords), list(actual_polygon.exterior.coords))
+            self.assertEqual([list(r.coords) for r in expected_polygon.interiors],
+                             [list(r.coords) for r in actual_polygon.interiors])
+
+    def test_should_convert_as_point_by_point(self):
+        for method in ('toWorkProj', 'toOrignProj', 'intersectionWork'):
+            points = getattr(CoordinateConverter, '_{0}Points'.format(method))
+            expected = [points(polygon) for polygon in self.polygons]
+            self.assertSamePolygons(expected, [getattr(CoordinateConverter, method)(p) for p in self.polygons])
+            self.assertSamePolygons(expected, getattr(CoordinateConverter, method + 'Batch')(self.polygons))
+
+    def test_should_keep_empty_polygons(self):
+        result = CoordinateConverter.toWorkProjBatch([Polygon(), self.polygons[0]])
+        self.assertTrue(result[0].is_empty)
+        self.assertFalse(result[1].is_empty)
+
+    def test_should_check_availability(self):
+        inside = Polygon([(170, 50), (-175, 50), (-175, 60), (170, 60)])
+        outside = Polygon([(10, 50), (20, 50), (20, 60), (10, 60)])
+        self.assertTrue(CoordinateConverter.isAvailableFor(MultiPolygon([inside])))
+        self.assertFalse(CoordinateConverter.isAvailableFor(MultiPolygon([inside, outside])))
+
+    def test_should_simplify_geometry(self):
+        wkt = MultiPolygon([Polygon([(170 + i * 0.1, 50 + (i % 2) * 0.05) for i in range(100)] +
+                                    [(180, 55), (170, 55)])]).wkt
+        simplified = simplify_geom(wkt)
+        self.assertLessEqual(len(shapely.wkt.loads(simplified).exterior.coords), 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,321 @@
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+from ee_downloader import config as downloader_config
+from ee_downloader.downloader import download_orders, download_scenes_by_ids, fill_scene, search_scenes
+from ee_downloader.metrics import default_metrics
+from ee_downloader.scheduler import RequestScheduler
+from ee_downloader.session import EESession, SessionPool
+from ee_downloader.store import SceneStore
+from ee_downloader.workers import DownloadResults
+from mock_server import MockEarthExplorer
+
+
+LANDSAT = 'Landsat 8 OLI/TIRS C1 Level-1'
+LANDSAT_FORMAT = 'Level-1 GeoTIFF Data Product'
+SENTINEL = 'Sentinel-2'
+SENTINEL_FORMAT = 'L1C Tile in JPEG2000 format'
+
+CONFIG = {
+    'SCHEDULER_DEFAULT_RATE': 1000,
+    'SEARCH_RATE': 1000,
+    'RETRY_DELAY': 0.01,
+    'REQUEST_RETRIES': 6,
+    'SEGMENT_MIN_SIZE': 64 * 1024,
+    'SEGMENT_PROBE_INTERVAL': 0.05,
+}
+
+
+class EndToEndTest(unittest.TestCase):
+    server_options = {}
+
+    def setUp(self):
+        self.saved_config = dict((name, getattr(downloader_config, name)) for name in CONFIG)
+        for name, value in CONFIG.items():
+            setattr(downloader_config, name, value)
+        self.temp_dir = tempfile.mkdtemp()
+        self.server = MockEarthExplorer(**self.server_options).start()
+        self.patch = self.server.patch_config()
+        self.patch.__enter__()
+
+    def tearDown(self):
+        self.patch.__exit__(None, None, None)
+        self.server.stop()
+        shutil.rmtree(self.temp_dir)
+        for name, value in self.saved_config.items():
+            setattr(downloader_config, name, value)
+
+    def download(self, product_name=LANDSAT, product_format=LANDSAT_FORMAT, **kwargs):
+        return download_scenes_by_ids(self.server.login, self.server.password, self.server.identifiers(product_name),
+                                      self.temp_dir, product_name, product_format, **kwargs)
+
+    def assertDownloaded(self, scenes, count):
+        self.assertEqual(count, len(scenes))
+        for scene in scenes:
+            self.assertTrue(scene['file_name'] and os.path.isfile(scene['file_name']), scene.get('error'))
+            self.assertTrue(scene['integrity']['valid'])
+
+
+class DownloadTest(EndToEndTest):
+    server_options = {'scene_count': 6}
+
+    def test_should_download_landsat_archives(self):
+        scenes = self.download()
+        self.assertDownloaded(scenes, 6)
+        with tarfile.open(scenes[0]['file_name']) as archive:
+            self.assertIn('LC08_L1TP_MOCK_MTL.txt', archive.getnames())
+
+    def test_should_raise_download_errors(self):
+        results = DownloadResults()
+        with self.assertRaises(IOError):
+            self.download(result_dir=os.path.join(self.temp_dir, 'missing'), results=results)
+
+        self.assertEqual(6, len(results.failed()))
+        self.assertTrue(all(scene['error'].startswith('Failed download') for scene in results.failed()))
+
+    def test_should_restart_download_with_stale_journal(self):
+        data = self.server.file('.tar.gz')
+        product_id = downloader_config.PRODUCTS[LANDSAT]['id']
+        # The first journal says the file is complete, but the remote file is smaller now.
+        # The offset of the second one is beyond the end of the remote file.
+        for i, size in ((0, len(data) + 1024), (1, None)):
+            tmp_filename = os.path.join(self.temp_dir, self.server.product_identifier(product_id, i) + '.tar.gz.part')
+            with open(tmp_filename, 'wb') as f:
+                f.write(os.urandom(len(data) + 1024))
+            with open(tmp_filename + '.json', 'w') as f:
+                json.dump({'url': None, 'offset': len(data) + 1024, 'size': size,
+                           'etag': '"{0}"'.format(hashlib.md5(data).hexdigest()), 'last_modified': None}, f)
+
+        self.assertDownloaded(self.download(), 6)
+        for i in (0, 1):
+            tmp_filename = os.path.join(self.temp_dir, self.server.product_identifier(product_id, i) + '.tar.gz.part')
+            self.assertFalse(os.path.exists(tmp_filename + '.json'))
+
+    def test_should_time_every_stage(self):
+        events = []
+        metrics = default_metrics()
+        metrics.add_hook(events.append)
+        try:
+            self.download()
+        finally:
+            metrics.remove_hook(events.append)
+
+        names = set(event['name'] for event in events)
+        for name in ('login', 'search_filter', 'search_count', 'result_index', 'result_index_parse', 'metadata',
+                     'download_options', 'download', 'download_ttfb', 'verify'):
+            self.assertIn(name, names)
+        downloads = [event for event in events if event['name'] == 'download']
+        self.assertEqual(6, len(downloads))
+        self.assertTrue(all(event['bytes'] > 0 for event in downloads))
+
+    def test_should_extract_bands_while_downloading(self):
+        scenes = self.download(bands=[2])
+        self.assertDownloaded(scenes, 6)
+        for scene in scenes:
+            self.assertEqual([2], list(scene['extracted']['bands']))
+            self.assertTrue(os.path.isfile(scene['extracted']['meta']))
+
+    def test_should_share_archives_through_store(self):
+        store = SceneStore(os.path.join(self.temp_dir, 'store'))
+        for name in ('first', 'second'):
+            os.mkdir(os.path.join(self.temp_dir, name))
+        first = self.download(result_dir=os.path.join(self.temp_dir, 'first'), store=store)
+        self.assertDownloaded(first, 6)
+        downloads = dict((path, count) for path, count in self.server.requests.items() if path.endswith('/EE'))
+
+        second = self.download(result_dir=os.path.join(self.temp_dir, 'second'), store=store)
+        self.assertEqual(6, len(second))
+        for scene in second:
+            self.assertTrue(os.path.isfile(scene['file_name']))
+            self.assertTrue(scene['file_name'].startswith(os.path.join(self.temp_dir, 'second')))
+        self.assertEqual(downloads, dict((path, count) for path, count in self.server.requests.items()
+                                         if path.endswith('/EE')))
+        self.assertEqual(6, len(store))
+
+    def test_should_stream_sentinel_archives(self):
+        scenes = self.download(SENTINEL, SENTINEL_FORMAT, streaming=True)
+        self.assertDownloaded(scenes, 6)
+        self.assertIsNone(zipfile.ZipFile(scenes[0]['file_name']).testzip())
+
+    def test_should_not_download_again_with_manifest(self):
+        manifest = os.path.join(self.temp_dir, 'job.jsonl')
+        self.assertDownloaded(self.download(manifest=manifest), 6)
+        requests = dict(self.server.requests)
+
+        self.assertDownloaded(self.download(manifest=manifest), 6)
+        self.assertEqual(requests, self.server.requests)
+
+
+class BandsOnlyTest(EndToEndTest):
+    server_options = {'scene_count': 2, 'file_size': 1024 * 1024, 'bands': 8}
+
+    def assertFetched(self, scenes, bands):
+        self.assertEqual(2, len(scenes))
+        for scene in scenes:
+            self.assertTrue(scene['file_name'] and os.path.isdir(scene['file_name']), scene.get('error'))
+            self.assertEqual(bands, sorted(scene['extracted']['bands']))
+            self.assertTrue(os.path.isfile(scene['extracted']['meta']))
+
+    def test_should_read_only_bands_of_zip(self):
+        bytes_before = default_metrics().counter('download_bytes')
+        scenes = self.download(SENTINEL, SENTINEL_FORMAT, bands=[3], bands_only=True)
+        self.assertFetched(scenes, [3])
+        self.assertLess(default_metrics().counter('download_bytes') - bytes_before, 1024 * 1024 / 2)
+
+    def test_should_stream_bands_of_tar(self):
+        scenes = self.download(bands=[1, 2], bands_only=True)
+        self.assertFetched(scenes, [1, 2])
+        self.assertFalse(os.path.exists(scenes[0]['file_name'] + '.tar.gz'))
+
+        # Bands fetched before aren't downloaded again
+        downloads = dict((path, count) for path, count in self.server.requests.items() if path.endswith('/EE'))
+        self.assertFetched(self.download(bands=[1, 2], bands_only=True), [1, 2])
+        self.assertEqual(downloads, dict((path, count) for path, count in self.server.requests.items()
+                                         if path.endswith('/EE')))
+
+
+class DownloadOrdersTest(EndToEndTest):
+    server_options = {'scene_count': 4}
+
+    def test_should_share_scenes_between_jobs(self):
+        landsat = self.server.identifiers(LANDSAT)
+        jobs = [(LANDSAT, LANDSAT_FORMAT, landsat[:3]),
+                (LANDSAT, 'LandsatLook Quality Image', landsat[1:]),
+                (LANDSAT, LANDSAT_FORMAT, landsat[2:]),
+                (SENTINEL, SENTINEL_FORMAT, self.server.identifiers(SENTINEL, 2))]
+        orders = download_orders(self.server.login, self.server.password, jobs, self.temp_dir)
+
+        self.assertEqual([3, 3, 2, 2], [len(scenes) for scenes in orders])
+        for scenes in orders:
+            self.assertDownloaded(scenes, len(scenes))
+        # Scene info of the scene requested by the first and the third jobs is shared
+        self.assertEqual(1, len([scene for scene in orders[2] if any(scene is other for other in orders[0])]))
+        self.assertTrue(orders[1][0]['file_name'].endswith('.jpg'))
+
+        # One login (the form and the credentials), one metadata request for every scene
+        # and one download for every scene and format
+        self.assertEqual(2, self.server.requests['/login/'])
+        self.assertEqual(6, self.server.requests['/form/metadatalookup/'])
+        self.assertEqual(4 + 3 + 2, sum(count for path, count in self.server.requests.items()
+                                        if path.endswith('/EE')))
+
+
+    def test_should_raise_download_errors(self):
+        results = DownloadResults()
+        jobs = [(LANDSAT, LANDSAT_FORMAT, self.server.identifiers(LANDSAT, 2)),
+                (LANDSAT, 'LandsatLook Quality Image', self.server.identifiers(LANDSAT, 2))]
+        with self.assertRaises(IOError):
+            download_orders(self.server.login, self.server.password, jobs, self.temp_dir,
+                            os.path.join(self.temp_dir, 'missing'), results=results)
+
+        self.assertEqual(4, len(results.failed()))
+        self.assertTrue(all(scene['error'].startswith('Failed download') for scene in results.failed()))
+
+
+class SearchTest(EndToEndTest):
+    server_options = {'scene_count': 10}
+
+    def setUp(self):
+        super(SearchTest, self).setUp()
+        self.saved_max_scene_count = downloader_config.MAX_SCENE_COUNT
+        downloader_config.MAX_SCENE_COUNT = 2
+        self.session = EESession(self.server.login, self.server.password, scheduler=RequestScheduler())
+
+    def tearDown(self):
+        self.session.close()
+        downloader_config.MAX_SCENE_COUNT = self.saved_max_scene_count
+        super(SearchTest, self).tearDown()
+
+    def search(self, identifiers):
+        return [scene['id'] for scene in search_scenes(self.session, identifiers, LANDSAT)]
+
+    def test_should_split_identifiers_of_too_many_scenes(self):
+        identifiers = self.server.identifiers(LANDSAT, 8)
+        product_id = downloader_config.PRODUCTS[LANDSAT]['id']
+
+        self.assertEqual(sorted(self.server.entity_id(product_id, i) for i in range(8)),
+                         sorted(self.search(identifiers)))
+        # Two queries of 4 identifiers and then four queries of 2 identifiers
+        self.assertEqual(6, self.server.requests['/result/count'])
+
+    def test_should_fail_when_identifier_has_too_many_scenes(self):
+        # The identifier is a part of the identifiers of all the scenes
+        with self.assertRaises(RuntimeError):
+            self.search(['LC08_L1TP_00000'])
+
+    def test_should_yield_scenes_of_several_partitions_once(self):
+        identifiers = self.server.identifiers(LANDSAT, 6)
+        product_id = downloader_config.PRODUCTS[LANDSAT]['id']
+
+        # The 4th scene is searched by both partitions
+        found = self.search(identifiers[:4] + identifiers[3:])
+        self.assertEqual(sorted(self.server.entity_id(product_id, i) for i in range(6)), sorted(found))
+
+    def test_should_close_cloned_sessions(self):
+        clones = []
+        closed = []
+        clone = self.session.clone
+
+        def cloned():
+            session = clone()
+            close = session.close
+            session.close = lambda: (closed.append(session), close())
+            clones.append(session)
+            return session
+
+        self.session.clone = cloned
+        # Requests are slowed down, so the sub-queries overlap
+        self.server.latency = 0.02
+        self.assertEqual(8, len(self.search(self.server.identifiers(LANDSAT, 8))))
+        self.assertTrue(clones)
+        self.assertEqual(clones, closed)
+
+    def test_should_reuse_sessions_of_pool(self):
+        identifiers = self.server.identifiers(LANDSAT, 8)
+        sessions = SessionPool(self.session)
+        try:
+            self.assertEqual(8, len(list(search_scenes(self.session, identifiers, LANDSAT, sessions=sessions))))
+            logins = self.server.requests['/login/']
+            self.assertEqual(8, len(list(search_scenes(self.session, identifiers, LANDSAT, sessions=sessions))))
+            self.assertEqual(logins, self.server.requests['/login/'])
+        finally:
+            sessions.close()
+
+
+class UnavailableServerTest(EndToEndTest):
+    server_options = {'scene_count': 1, 'error_rate': 1}
+
+    def test_should_repeat_request_in_scheduler_only(self):
+        session = EESession(self.server.login, self.server.password, scheduler=RequestScheduler())
+        product_id = downloader_config.PRODUCTS[LANDSAT]['id']
+        entity_id = self.server.entity_id(product_id, 0)
+        scene = {'id': entity_id, 'metadata': '{0}/form/metadatalookup/?collection_id={1}&entity_id={2}'
+                 .format(self.server.url, product_id, entity_id)}
+
+        with self.assertRaises(IOError):
+            fill_scene(session, scene, LANDSAT)
+        self.assertEqual(downloader_config.REQUEST_RETRIES, self.server.requests['/form/metadatalookup/'])
+
+
+class UnreliableServerTest(EndToEndTest):
+    server_options = {'scene_count': 6, 'error_rate': 0.1}
+
+    def test_should_repeat_failed_requests(self):
+        self.assertDownloaded(self.download(), 6)
+
+
+class SegmentedDownloadTest(EndToEndTest):
+    server_options = {'scene_count': 2, 'file_size': 1024 * 1024, 'bandwidth': 4 * 1024 * 1024}
+
+    def test_should_download_by_segments(self):
+        self.assertDownloaded(self.download(segments=4), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from ee_downloader import config as downloader_config
+from ee_downloader.extract import StreamExtractor, archive_extract_dir, extract_archives, extract_bands
+
+
+NAME = 'LC08_L1TP_TEST'
+
+
+def make_archive(path, bands=5, size=64 * 1024):
+    members = [(NAME + '_B{0}.TIF'.format(band), os.urandom(size)) for band in range(1, bands + 1)]
+    members += [(NAME + '_BQA.TIF', os.urandom(size)), (NAME + '_MTL.txt', 'GROUP = L1_METADATA_FILE\n')]
+    with tarfile.open(path, 'w:gz') as archive:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return dict(members)
+
+
+class ExtractBandsTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.archive = os.path.join(self.temp_dir, NAME + '.tar.gz')
+        self.members = make_archive(self.archive)
+        self.extract_dir = archive_extract_dir(self.archive)
+        self.saved_command = downloader_config.EXTRACT_GZIP_COMMAND
+
+    def tearDown(self):
+        downloader_config.EXTRACT_GZIP_COMMAND = self.saved_command
+        shutil.rmtree(self.temp_dir)
+
+    def assertExtracted(self, result, bands):
+        self.assertEqual(sorted(bands), sorted(result['bands']))
+        for number, filename in result['bands'].items():
+            with open(filename, 'rb') as f:
+                self.assertEqual(self.members[NAME + '_B{0}.TIF'.format(number)], f.read())
+        self.assertTrue(os.path.isfile(result['meta']))
+
+    def test_should_name_directory_as_archive(self):
+        self.assertEqual(os.path.join(self.temp_dir, NAME), self.extract_dir)
+        self.assertEqual('/data/' + NAME, archive_extract_dir(self.archive, '/data'))
+
+    def test_should_extract_requested_bands_with_zlib(self):
+        downloader_config.EXTRACT_GZIP_COMMAND = []
+        result = extract_bands(self.archive, self.extract_dir, [2, 4])
+        self.assertExtracted(result, [2, 4])
+        self.assertEqual(3, len(os.listdir(self.extract_dir)))
+
+    def test_should_extract_with_external_decoder(self):
+        downloader_config.EXTRACT_GZIP_COMMAND = ['gzip', '-d', '-c']
+        result = extract_bands(self.archive, self.extract_dir, [1])
+        self.assertExtracted(result, [1])
+
+    def test_should_extract_all_rasters_by_default(self):
+        result = extract_bands(self.archive, self.extract_dir, decoder=[])
+        self.assertExtracted(result, [1, 2, 3, 4, 5])
+        self.assertIn(os.path.join(self.extract_dir, NAME + '_BQA.TIF'), result['files'])
+
+    def test_should_extract_stream_fed_by_chunks(self):
+        extractor = StreamExtractor(self.extract_dir, [3])
+        # The buffer is reused for every chunk as StreamWriter does
+        buf = bytearray(1000)
+        view = memoryview(buf)
+        with open(self.archive, 'rb') as f:
+            for n in iter(lambda: f.readinto(buf), 0):
+                extractor.update(view[:n])
+        self.assertExtracted(extractor.close(), [3])
+
+    def test_should_raise_error_of_broken_stream(self):
+        extractor = StreamExtractor(self.extract_dir, [3])
+        extractor.update('not a gzip stream')
+        self.assertRaises(Exception, extractor.close)
+
+    def test_should_extract_archives_on_processes(self):
+        other = os.path.join(self.temp_dir, 'other', NAME + '.tar.gz')
+        os.makedirs(os.path.dirname(other))
+        shutil.copy(self.archive, other)
+        results = extract_archives([self.archive, other], bands=[5], processes=2)
+        self.assertEqual(2, len(results))
+        for result in results:
+            self.assertExtracted(result, [5])
+        self.assertTrue(results[1]['meta'].startswith(os.path.dirname(other)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import base64
+import hashlib
+import io
+import tarfile
+import unittest
+import zipfile
+
+from ee_downloader.integrity import StreamVerifier, published_checksums
+
+
+class FakeResponse(object):
+    def __init__(self, headers, status_code=200):
+        self.headers = headers
+        self.status_code = status_code
+
+
+def make_tar_gz():
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode='w:gz') as tar:
+        for name in ['LC08_B1.TIF', 'LC08_B2.TIF', 'LC08_MTL.txt']:
+            content = name * 300
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return data.getvalue()
+
+
+def make_zip():
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('T39UWB_B04.jp2', 'jp2' * 1000)
+    return data.getvalue()
+
+
+def verify(data, product_format, headers=None, chunk_size=100):
+    verifier = StreamVerifier(product_format)
+    verifier.start(FakeResponse(headers or {}), len(data))
+    for i in range(0, len(data), chunk_size):
+        verifier.update(memoryview(data)[i:i + chunk_size])
+    return verifier.result()
+
+
+class StreamVerifierTest(unittest.TestCase):
+    def test_should_accept_tar_gz(self):
+        data = make_tar_gz()
+        result = verify(data, 'Level-1 GeoTIFF Data Product')
+
+        self.assertTrue(result['valid'])
+        self.assertEqual('3 members', result['archive'])
+        self.assertEqual(hashlib.md5(data).hexdigest(), result['md5'])
+        self.assertEqual(hashlib.sha256(data).hexdigest(), result['sha256'])
+
+    def test_should_reject_truncated_tar_gz(self):
+        data = make_tar_gz()
+        verifier = StreamVerifier('Level-1 GeoTIFF Data Product')
+        verifier.start(FakeResponse({}), len(data))
+        verifier.update(data[:len(data) // 2])
+
+        result = verifier.result()
+        self.assertFalse(result['valid'])
+        self.assertEqual(2, len(result['errors']))
+
+    def test_should_accept_zip(self):
+        self.assertTrue(verify(make_zip(), 'L1C Tile in JPEG2000 format')['valid'])
+
+    def test_should_reject_broken_zip(self):
+        data = make_zip()
+        self.assertFalse(verify(data[:-30], 'L1C Tile in JPEG2000 format', chunk_size=len(data))['valid'])
+
+    def test_should_compare_published_checksum(self):
+        data = make_zip()
+        good = {'Content-MD5': base64.b64encode(hashlib.md5(data).digest())}
+        bad = {'Digest': 'SHA-256=' + base64.b64encode(hashlib.sha256('other').digest())}
+
+        self.assertTrue(verify(data, 'L1C Tile in JPEG2000 format', good)['valid'])
+        self.assertFalse(verify(data, 'L1C Tile in JPEG2000 format', bad)['valid'])
+
+    def test_should_parse_published_checksums(self):
+        checksums = published_checksums({'Digest': 'MD5=' + base64.b64encode(hashlib.md5('a').digest())})
+        self.assertEqual({'md5': hashlib.md5('a').hexdigest()}, checksums)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ee_downloader.manifest import JobManifest, SEARCHED, ENRICHED, DOWNLOADING, VERIFIED, FAILED
+from ee_downloader.scene import Scene
+
+
+JOB = {'product_name': 'LANDSAT_8_C1', 'product_format': 'STANDARD', 'identifiers': ['LC08_L1TP_test']}
+
+
+class JobManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'job.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_should_restore_latest_states(self):
+        manifest = JobManifest(self.path, JOB, fsync=False)
+        manifest.record('a', SEARCHED, {'id': 'a'})
+        manifest.record('b', SEARCHED, {'id': 'b'})
+        manifest.finish_search()
+        manifest.record('a', ENRICHED, {'id': 'a', 'metadata_fields': {'x': '1'}})
+        manifest.record('a', DOWNLOADING, offset=10)
+        manifest.record('a', VERIFIED, file_name='/tmp/a.tar.gz')
+        manifest.record('b', FAILED, reason='No download URL')
+        manifest.close()
+
+        manifest = JobManifest(self.path, JOB, fsync=False)
+        self.assertTrue(manifest.search_done)
+        self.assertEqual(VERIFIED, manifest.state('a'))
+        self.assertEqual('/tmp/a.tar.gz', manifest.get('a')['file_name'])
+        self.assertEqual({'x': '1'}, manifest.get('a')['scene']['metadata_fields'])
+        self.assertEqual('No download URL', manifest.get('b')['reason'])
+        self.assertEqual(['a', 'b'], [scene['id'] for scene in manifest.scenes()])
+        self.assertEqual(['b'], [scene['id'] for scene in manifest.scenes(FAILED)])
+        manifest.close()
+
+    def test_should_drop_broken_last_line(self):
+        manifest = JobManifest(self.path, JOB, fsync=False)
+        manifest.record('a', SEARCHED, {'id': 'a'})
+        manifest.close()
+        with open(self.path, 'a') as f:
+            f.write('{"id": "a", "state": "veri')
+
+        manifest = JobManifest(self.path, JOB, fsync=False)
+        self.assertEqual(SEARCHED, manifest.state('a'))
+        manifest.record('a', ENRICHED)
+        manifest.close()
+
+        self.assertEqual(ENRICHED, JobManifest(self.path, JOB, fsync=False).state('a'))
+
+    def test_should_compact_to_latest_records(self):
+        manifest = JobManifest(self.path, JOB, fsync=False)
+        for state in (SEARCHED, ENRICHED, DOWNLOADING, VERIFIED):
+            manifest.record('a', state, {'id': 'a'})
+        for state in (SEARCHED, ENRICHED):
+            manifest.record('b', state, Scene(id='b', preview='p'))
+        manifest.compact()
+        manifest.close()
+
+        with open(self.path) as f:
+            self.assertEqual(3, len(f.readlines()))
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+        manifest = JobManifest(self.path, JOB, fsync=False)
+        self.assertEqual(VERIFIED, manifest.state('a'))
+        self.assertEqual({'id': 'b', 'preview': 'p'}, manifest.get('b')['scene'])
+
+    def test_should_reject_another_job(self):
+        JobManifest(self.path, JOB, fsync=False).close()
+        other = dict(JOB, product_format='FR_BUND')
+        self.assertRaises(ValueError, JobManifest, self.path, other)
+
+
+if __name__ == '__main__':
+    unittest.main()
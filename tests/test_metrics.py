@@ -0,0 +1,59 @@
+import json
+import unittest
+
+from ee_downloader.metrics import Metrics
+
+
+class MetricsTest(unittest.TestCase):
+    def test_should_summarize_timings(self):
+        metrics = Metrics()
+        metrics.observe('download', 2.0)
+        metrics.observe('download', 4.0)
+
+        timing = metrics.timing('download')
+        self.assertEqual(2, timing['count'])
+        self.assertEqual(6.0, timing['sum'])
+        self.assertEqual(2.0, timing['min'])
+        self.assertEqual(4.0, timing['max'])
+        self.assertEqual(3.0, timing['avg'])
+
+    def test_should_pass_observations_to_hooks(self):
+        metrics = Metrics()
+        events = []
+        metrics.add_hook(events.append)
+        with metrics.timer('download', url='http://host/file') as fields:
+            fields['bytes'] = 10
+
+        self.assertEqual(1, len(events))
+        self.assertEqual('download', events[0]['name'])
+        self.assertEqual(10, events[0]['bytes'])
+        self.assertEqual('http://host/file', events[0]['url'])
+        self.assertGreaterEqual(events[0]['seconds'], 0)
+
+    def test_should_count_errors_of_timed_block(self):
+        metrics = Metrics()
+        with self.assertRaises(IOError):
+            with metrics.timer('metadata'):
+                raise IOError('Service Unavailable')
+
+        self.assertIsNone(metrics.timing('metadata'))
+        self.assertEqual(1, metrics.counter('metadata_errors'))
+
+    def test_should_dump_prometheus_and_json(self):
+        metrics = Metrics()
+        metrics.observe('result_index', 0.5)
+        metrics.increment('download_bytes', 1024)
+
+        text = metrics.dump_prometheus()
+        self.assertIn('# TYPE ee_downloader_result_index_seconds summary', text)
+        self.assertIn('ee_downloader_result_index_seconds_count 1', text)
+        self.assertIn('ee_downloader_result_index_seconds_sum 0.5', text)
+        self.assertIn('ee_downloader_download_bytes_total 1024', text)
+
+        data = json.loads(metrics.dump_json())
+        self.assertEqual(1, data['timings']['result_index']['count'])
+        self.assertEqual(1024, data['counters']['download_bytes'])
+
+
+if __name__ == '__main__':
+    unittest.main()
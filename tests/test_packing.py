@@ -0,0 +1,102 @@
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import zipfile
+import zlib
+
+from ee_downloader.packing import crc32_combine, is_compressed, tiff_compression, write_zip
+from ee_downloader.utils import zip as zip_files
+
+
+def tiff(compression, byte_order='<'):
+    """
+    Minimal TIFF with the first IFD of one Compression entry.
+    """
+    magic = 'II' if byte_order == '<' else 'MM'
+    return magic + struct.pack(byte_order + 'HI', 42, 8) + struct.pack(byte_order + 'HHHIHH', 1, 259, 3, 1,
+                                                                         compression, 0) + '\0' * 4
+
+
+class NonSeekableSink(object):
+    def __init__(self):
+        self.data = io.BytesIO()
+
+    def write(self, data):
+        self.data.write(data)
+
+
+class WriteZipTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.files = {}
+        self.add('text_B1.TIF', tiff(1) + 'raster ' * 50000)
+        self.add('random.bin', os.urandom(300 * 1024))
+        self.add('band_B2.jp2', os.urandom(1000))
+        self.add('lzw_B3.TIF', tiff(5, '>') + os.urandom(1000))
+        self.add('empty.txt', '')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def add(self, name, data):
+        filename = os.path.join(self.temp_dir, name)
+        with open(filename, 'wb') as f:
+            f.write(data)
+        self.files[filename] = data
+
+    def assertArchive(self, archive):
+        with zipfile.ZipFile(archive) as zf:
+            self.assertIsNone(zf.testzip())
+            for filename, data in self.files.items():
+                self.assertEqual(data, zf.read(os.path.basename(filename)))
+            return dict((info.filename, info.compress_type) for info in zf.infolist())
+
+    def test_should_combine_crc(self):
+        first, second = os.urandom(1000), os.urandom(3000)
+        self.assertEqual(zlib.crc32(first + second) & 0xffffffff,
+                         crc32_combine(zlib.crc32(first) & 0xffffffff, zlib.crc32(second) & 0xffffffff, 3000))
+
+    def test_should_find_compressed_files(self):
+        names = dict((os.path.basename(filename), filename) for filename in self.files)
+        self.assertEqual(1, tiff_compression(names['text_B1.TIF']))
+        self.assertEqual(5, tiff_compression(names['lzw_B3.TIF']))
+        self.assertFalse(is_compressed(names['text_B1.TIF']))
+        self.assertTrue(is_compressed(names['lzw_B3.TIF']))
+        self.assertTrue(is_compressed(names['band_B2.jp2']))
+        self.assertFalse(is_compressed(names['random.bin']))
+
+    def test_should_deflate_blocks_on_processes(self):
+        archive = os.path.join(self.temp_dir, 'result.zip')
+        write_zip(sorted(self.files), archive, processes=2, block_size=64 * 1024)
+        types = self.assertArchive(archive)
+        self.assertEqual(zipfile.ZIP_DEFLATED, types['text_B1.TIF'])
+        self.assertEqual(zipfile.ZIP_STORED, types['band_B2.jp2'])
+        self.assertEqual(zipfile.ZIP_STORED, types['lzw_B3.TIF'])
+        self.assertLess(os.path.getsize(archive), sum(len(data) for data in self.files.values()))
+
+    def test_should_stream_to_sink(self):
+        sink = NonSeekableSink()
+        write_zip(sorted(self.files), sink, processes=1, block_size=100 * 1024)
+        self.assertArchive(io.BytesIO(sink.data.getvalue()))
+
+    def test_should_write_zip64_records(self):
+        archive = os.path.join(self.temp_dir, 'result.zip')
+        saved_limit = zipfile.ZIP64_LIMIT
+        zipfile.ZIP64_LIMIT = 1000
+        try:
+            write_zip(sorted(self.files), archive, processes=1)
+        finally:
+            zipfile.ZIP64_LIMIT = saved_limit
+        self.assertArchive(archive)
+
+    def test_should_keep_utils_zip(self):
+        archive = os.path.join(self.temp_dir, 'result.zip')
+        zip_files(sorted(self.files), archive, processes=1)
+        self.assertArchive(archive)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ee_downloader.partial import PartialDownload
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, headers):
+        self.status_code = status_code
+        self.headers = headers
+
+
+class PartialDownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.temp_dir, 'LC08_L1TP_test.tar.gz.part')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_partial(self, data, etag='"abc"', size=10):
+        with open(self.filename, 'wb') as f:
+            f.write(data)
+        partial = PartialDownload(self.filename)
+        partial.start('https://dds.cr.usgs.gov/file', FakeResponse(200, {'ETag': etag, 'Content-Length': str(size)}))
+        partial.offset = len(data)
+        partial.save()
+
+    def test_should_not_resume_without_journal(self):
+        with open(self.filename, 'wb') as f:
+            f.write('12345')
+        self.assertEqual({}, PartialDownload(self.filename).range_headers())
+
+    def test_should_resume_from_journal_offset(self):
+        self.write_partial('12345')
+        partial = PartialDownload(self.filename)
+        self.assertEqual({'Range': 'bytes=5-', 'If-Range': '"abc"'}, partial.range_headers())
+
+        mode = partial.start('https://dds.cr.usgs.gov/file',
+                             FakeResponse(206, {'ETag': '"abc"', 'Content-Range': 'bytes 5-9/10'}))
+        self.assertEqual('r+b', mode)
+        self.assertEqual(10, partial.size)
+
+    def test_should_restart_if_file_is_changed(self):
+        self.write_partial('12345')
+        partial = PartialDownload(self.filename)
+
+        mode = partial.start('https://dds.cr.usgs.gov/file',
+                             FakeResponse(200, {'ETag': '"def"', 'Content-Length': '12'}))
+        self.assertEqual('wb', mode)
+        self.assertEqual(0, partial.offset)
+        self.assertEqual(12, partial.size)
+
+    def test_should_remove_journal_when_complete(self):
+        self.write_partial('1234567890')
+        partial = PartialDownload(self.filename)
+        self.assertTrue(partial.is_complete())
+
+        partial.complete()
+        self.assertFalse(os.path.exists(partial.journal))
+        self.assertTrue(os.path.exists(self.filename))
+
+    def test_should_check_remote_size_of_complete_file(self):
+        self.write_partial('1234567890')
+        partial = PartialDownload(self.filename)
+
+        self.assertTrue(partial.is_complete_by(FakeResponse(416, {'Content-Range': 'bytes */10'})))
+        self.assertTrue(partial.is_complete_by(FakeResponse(416, {})))
+        self.assertFalse(partial.is_complete_by(FakeResponse(416, {'Content-Range': 'bytes */8'})))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import io
+import json
+import os
+import pickle
+import unittest
+
+from ee_downloader.scene import Scene, download_option, json_default, msgpack
+from ee_downloader.scraper import parse_result_index, parse_metadata, parse_download_options
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def read_fixture(name):
+    with io.open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def filled_scenes():
+    scenes = parse_result_index(read_fixture('result_index.html'), 12864)
+    metadata = parse_metadata(read_fixture('metadata.html'))
+    options = dict((name, url) for name, url, disabled in parse_download_options(read_fixture('download_options.html'))
+                   if not disabled)
+    for scene in scenes:
+        scene.update(metadata)
+        scene.update(options)
+    return scenes
+
+
+class SceneTest(unittest.TestCase):
+    def test_should_behave_as_dictionary(self):
+        scene = Scene({'id': 'a'}, preview='p')
+        scene['error'] = 'broken'
+        scene['error'] = 'still broken'
+
+        self.assertEqual({'id': 'a', 'preview': 'p', 'error': 'still broken'}, scene.as_dict())
+        self.assertEqual(scene.as_dict(), dict(scene))
+        self.assertEqual(['id', 'preview', 'error'], scene.keys())
+        self.assertIn('preview', scene)
+        self.assertIsNone(scene.get('file_name'))
+        with self.assertRaises(KeyError):
+            _ = scene['file_name']
+
+        self.assertEqual('still broken', scene.pop('error'))
+        self.assertEqual({'id': 'a', 'preview': 'p'}, scene)
+        self.assertEqual(2, len(scene))
+
+    def test_should_share_field_names(self):
+        first, second = filled_scenes()
+
+        self.assertIs(first._layout, second._layout)
+        self.assertEqual(first['Landsat Product Identifier'], second['Landsat Product Identifier'])
+        copy = first.copy()
+        copy['file_name'] = 'a.tar.gz'
+        self.assertNotIn('file_name', first)
+
+    def test_should_index_download_options(self):
+        scene = filled_scenes()[0]
+        name = download_option(scene, 'Level-1 GeoTIFF Data Product')
+
+        self.assertEqual(download_option(scene.as_dict(), 'Level-1 GeoTIFF Data Product'), name)
+        self.assertTrue(scene[name].startswith('https://'))
+        self.assertIsNone(scene.download_option('L1C Tile in JPEG2000 format'))
+        self.assertIsNone(scene.download_option('Unknown format'))
+
+    def test_should_serialize(self):
+        scene = filled_scenes()[0]
+
+        self.assertEqual(scene, Scene.from_json(scene.to_json()))
+        self.assertEqual(scene.as_dict(), json.loads(json.dumps({'scene': scene}, default=json_default))['scene'])
+        self.assertEqual(scene, pickle.loads(pickle.dumps(scene)))
+        self.assertEqual(scene, pickle.loads(pickle.dumps(scene, pickle.HIGHEST_PROTOCOL)))
+
+    @unittest.skipIf(msgpack is None, 'msgpack isn\'t installed')
+    def test_should_serialize_to_msgpack(self):
+        scene = filled_scenes()[0]
+        self.assertEqual(scene, Scene.from_msgpack(scene.to_msgpack()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import time
+import unittest
+
+from ee_downloader.scheduler import TokenBucket, CircuitBreaker, RequestScheduler, retry_after, backoff_delay
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeServer(object):
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def send(self, method, url, **kwargs):
+        self.requests.append((method, url))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def scheduler(retries=3):
+    return RequestScheduler(retries=retries, rates={}, default_rate=1000,
+                            breaker=CircuitBreaker(threshold=100, pause=0, max_pause=0.2))
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_should_lower_and_restore_rate(self):
+        bucket = TokenBucket(16)
+        bucket.slow_down()
+        bucket.slow_down()
+        self.assertEqual(4, bucket.rate)
+        for _ in range(100):
+            bucket.speed_up()
+        self.assertEqual(16, bucket.rate)
+
+    def test_should_not_lower_rate_below_min_rate(self):
+        bucket = TokenBucket(16, min_rate=4)
+        for _ in range(10):
+            bucket.slow_down()
+        self.assertEqual(4, bucket.rate)
+
+
+    def test_should_go_into_debt(self):
+        bucket = TokenBucket(100, burst=10)
+        self.assertEqual(0, bucket.consume(10))
+        self.assertAlmostEqual(0.5, bucket.consume(50), delta=0.05)
+
+
+class BackoffTest(unittest.TestCase):
+    def test_should_limit_delay(self):
+        for attempt in range(10):
+            delay = backoff_delay(attempt, 1, 30)
+            self.assertTrue(0 <= delay <= min(30, 2 ** attempt))
+
+    def test_should_parse_retry_after(self):
+        self.assertEqual(7, retry_after(FakeResponse(503, {'Retry-After': '7'})))
+        self.assertEqual(0, retry_after(FakeResponse(503, {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})))
+        self.assertIsNone(retry_after(FakeResponse(503)))
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_should_open_after_threshold(self):
+        breaker = CircuitBreaker(threshold=2, pause=10)
+        breaker.failure()
+        self.assertFalse(breaker.is_open)
+        breaker.failure()
+        self.assertTrue(breaker.is_open)
+
+    def test_should_open_for_pause_asked_by_server(self):
+        breaker = CircuitBreaker(threshold=100, pause=0, max_pause=0.1)
+        breaker.failure(30)
+        self.assertTrue(breaker.is_open)
+        start = time.time()
+        breaker.wait()
+        self.assertLess(time.time() - start, 1)
+
+
+class RequestSchedulerTest(unittest.TestCase):
+    def test_should_repeat_unavailable_responses(self):
+        unavailable = FakeResponse(503, {'Retry-After': '0'})
+        server = FakeServer([unavailable, IOError('Connection reset'), FakeResponse(200)])
+        s = scheduler()
+
+        response = s.request(server.send, 'GET', 'https://earthexplorer.usgs.gov/form/metadatalookup/')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(3, len(server.requests))
+        self.assertTrue(unavailable.closed)
+
+    def test_should_return_last_response(self):
+        server = FakeServer([FakeResponse(502), FakeResponse(502)])
+        response = scheduler(retries=2).request(server.send, 'GET', 'https://earthexplorer.usgs.gov/')
+        self.assertEqual(502, response.status_code)
+
+    def test_should_raise_last_error(self):
+        server = FakeServer([IOError('Connection reset'), IOError('Connection reset')])
+        with self.assertRaises(IOError):
+            scheduler(retries=2).request(server.send, 'GET', 'https://earthexplorer.usgs.gov/')
+
+    def test_should_slow_down_endpoint_on_pushback(self):
+        s = scheduler()
+        server = FakeServer([FakeResponse(429, {'Retry-After': '0'}), FakeResponse(200)])
+        s.request(server.send, 'GET', 'https://earthexplorer.usgs.gov/result/index')
+
+        self.assertLess(s.bucket('https://earthexplorer.usgs.gov/result/other').rate, 1000)
+        self.assertEqual(1000, s.bucket('https://earthexplorer.usgs.gov/form/').rate)
+
+    def test_should_not_repeat_client_errors(self):
+        server = FakeServer([FakeResponse(404)])
+        self.assertEqual(404, scheduler().request(server.send, 'GET', 'https://earthexplorer.usgs.gov/').status_code)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import io
+import os
+import unittest
+
+from bs4 import BeautifulSoup
+
+from ee_downloader.scraper import parse_result_index, parse_metadata, parse_download_options, parse_size
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def read_fixture(name):
+    with io.open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def soup_metadata(html):
+    metadata = dict()
+    soup = BeautifulSoup(html, 'html.parser')
+    for tr in soup.find_all('tr'):
+        if tr.td is not None:
+            metadata[tr.td.a.string] = tr.td.next_sibling.next_sibling.string
+    return metadata
+
+
+def soup_download_options(html):
+    options = []
+    soup = BeautifulSoup(html, 'html.parser')
+    for input in soup.find_all('input'):
+        onclick = input['onclick'].replace("'", "").replace("window.location=", "")
+        options.append((unicode.strip(input.findNext('div').text), onclick, 'disabled' in input.attrs))
+    return options
+
+
+class ScraperTest(unittest.TestCase):
+    def test_should_parse_result_index(self):
+        scenes = parse_result_index(read_fixture('result_index.html'), 12864)
+
+        self.assertEqual(['LC81370172017096LGN00', 'LC81370182017096LGN00'], [scene['id'] for scene in scenes])
+        self.assertEqual('https://ims.cr.usgs.gov/browse/landsat_8_c1/2017/137/017/'
+                         'LC08_L1TP_137017_20170406_20170414_01_T1.jpg', scenes[0]['preview'])
+        self.assertTrue(scenes[0]['metadata'].endswith(
+            '/form/metadatalookup/?collection_id=12864&entity_id=LC81370172017096LGN00'))
+
+    def test_should_parse_metadata_as_beautiful_soup(self):
+        html = read_fixture('metadata.html')
+        metadata = parse_metadata(html)
+
+        self.assertEqual(soup_metadata(html), metadata)
+        self.assertEqual(u'LC08_L1TP_137017_20170406_20170414_01_T1', metadata[u'Landsat Product Identifier'])
+        self.assertEqual(u'34.81', metadata[u'Sun Elevation L1'])
+        self.assertNotIn(u'Commented Field', metadata)
+
+    def test_should_parse_download_options_as_beautiful_soup(self):
+        html = read_fixture('download_options.html')
+        options = parse_download_options(html)
+
+        self.assertEqual(soup_download_options(html), options)
+        self.assertEqual(4, len(options))
+        self.assertTrue(options[2][2])
+
+    def test_should_parse_size_of_download_option(self):
+        options = parse_download_options(read_fixture('download_options.html'))
+
+        self.assertEqual(int(966.4 * 1024 * 1024), parse_size(options[3][0]))
+        self.assertIsNone(parse_size(options[1][0]))
+        self.assertEqual(2 * 1024 ** 3, parse_size(u'L1C Tile in JPEG2000 format (2 GB)'))
+        self.assertEqual(512, parse_size(u'Metadata (512 B)'))
+
+
+if __name__ == '__main__':
+    unittest.main()
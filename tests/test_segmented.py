@@ -0,0 +1,109 @@
+import io
+import os
+import re
+import shutil
+import tempfile
+import time
+import unittest
+
+from ee_downloader import config as downloader_config
+from ee_downloader.segmented import SegmentedDownload, probe_ranges
+from ee_downloader.workers import HostThrottle
+
+
+class SlowRaw(io.BytesIO):
+    def readinto(self, b):
+        time.sleep(0.002)
+        return io.BytesIO.readinto(self, b)
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, headers, data):
+        self.status_code = status_code
+        self.headers = headers
+        self.raw = SlowRaw(data)
+
+    def close(self):
+        pass
+
+
+class RangeSession(object):
+    def __init__(self, data, latency=0):
+        self.data = data
+        self.latency = latency
+        self.ranges = []
+
+    def get(self, url, stream=False, headers=None):
+        time.sleep(self.latency)
+        match = re.match(r'bytes=(\d+)-(\d+)', headers['Range'])
+        start, end = int(match.group(1)), int(match.group(2))
+        self.ranges.append((start, end))
+        return FakeResponse(206, {'Content-Range': 'bytes {0}-{1}/{2}'.format(start, end, len(self.data))},
+                            self.data[start:end + 1])
+
+
+class SegmentedDownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.temp_dir, 'scene.tar.gz.part')
+        self.chunk_size = downloader_config.DOWNLOAD_CHUNK_SIZE
+        self.probe_interval = downloader_config.SEGMENT_PROBE_INTERVAL
+        downloader_config.DOWNLOAD_CHUNK_SIZE = 1024
+        downloader_config.SEGMENT_PROBE_INTERVAL = 0.01
+
+    def tearDown(self):
+        downloader_config.DOWNLOAD_CHUNK_SIZE = self.chunk_size
+        downloader_config.SEGMENT_PROBE_INTERVAL = self.probe_interval
+        shutil.rmtree(self.temp_dir)
+
+    def test_should_probe_file_size(self):
+        _, size = probe_ranges(RangeSession('x' * 100), 'https://dds.cr.usgs.gov/file')
+        self.assertEqual(100, size)
+
+    def test_should_assemble_file_from_segments(self):
+        data = os.urandom(300 * 1024)
+        session = RangeSession(data)
+
+        download = SegmentedDownload(session, 'https://dds.cr.usgs.gov/file', self.filename, len(data),
+                                     max_segments=4, min_segment_size=16 * 1024)
+        download.run()
+
+        with open(self.filename, 'rb') as f:
+            self.assertEqual(data, f.read())
+        self.assertGreater(download.segments, 1)
+
+    def test_should_time_first_response_of_segments(self):
+        data = os.urandom(64 * 1024)
+        download = SegmentedDownload(RangeSession(data, latency=0.05), 'https://dds.cr.usgs.gov/file',
+                                     self.filename, len(data), max_segments=1)
+        self.assertIsNone(download.first_byte)
+
+        start = time.time()
+        download.run()
+        self.assertGreaterEqual(download.first_byte - start, 0.05)
+        self.assertLessEqual(download.first_byte, time.time())
+
+    def download_throttled(self, data, max_per_host):
+        url = 'https://dds.cr.usgs.gov/file'
+        throttle = HostThrottle(max_per_host, reserved=0)
+        # The caller holds the connection of the first segment
+        with throttle.acquire(url):
+            download = SegmentedDownload(RangeSession(data), url, self.filename, len(data), max_segments=4,
+                                         min_segment_size=16 * 1024, throttle=throttle)
+            download.run()
+
+        with open(self.filename, 'rb') as f:
+            self.assertEqual(data, f.read())
+        # Connections of the added segments are given back
+        for _ in range(max_per_host):
+            self.assertTrue(throttle.try_acquire(url))
+        return download
+
+    def test_should_add_segments_only_for_free_connections(self):
+        data = os.urandom(300 * 1024)
+        self.assertEqual(1, self.download_throttled(data, 1).segments)
+        self.assertGreater(self.download_throttled(data, 2).segments, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
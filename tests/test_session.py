@@ -0,0 +1,119 @@
+import threading
+import unittest
+
+import requests
+
+from ee_downloader.scheduler import RequestScheduler
+from ee_downloader.session import EESession, SessionPool
+from test_end_to_end import EndToEndTest
+
+
+class EESessionTest(EndToEndTest):
+    server_options = {'scene_count': 1}
+
+    def setUp(self):
+        super(EESessionTest, self).setUp()
+        self.session = EESession(self.server.login, self.server.password, scheduler=RequestScheduler())
+        self.browse_url = self.server.url + '/browse/0.jpg'
+
+    def tearDown(self):
+        self.session.close()
+        super(EESessionTest, self).tearDown()
+
+    def test_should_detect_expired_session(self):
+        response = requests.get(self.browse_url, allow_redirects=False)
+        self.assertTrue(EESession.is_expired(response))
+        # The redirect to the login page is followed
+        self.assertTrue(EESession.is_expired(requests.get(self.browse_url)))
+
+        response = requests.Response()
+        response.status_code = 401
+        self.assertTrue(EESession.is_expired(response))
+
+        self.assertFalse(EESession.is_expired(self.session.get(self.browse_url)))
+
+    def test_should_skip_outdated_login(self):
+        self.session.get(self.browse_url)
+        self.assertEqual(2, self.server.requests['/login/'])
+
+        # Somebody has already logged in again after the generation 0 had expired
+        self.session.authenticate(0)
+        self.assertEqual(2, self.server.requests['/login/'])
+        self.session.authenticate(1)
+        self.assertEqual(4, self.server.requests['/login/'])
+
+    def test_should_login_again_once(self):
+        self.session.get(self.browse_url)
+        self.server.sessions.clear()
+        # Requests are slowed down, so all the workers see the expired session
+        self.server.latency = 0.02
+
+        start = threading.Event()
+        responses = []
+
+        def worker():
+            start.wait()
+            responses.append(self.session.get(self.browse_url))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join(10)
+
+        self.assertEqual([200] * 8, [response.status_code for response in responses])
+        # Every expired request follows the redirect to the login page, but the form is posted once
+        self.assertEqual(1, len(self.server.sessions))
+        self.assertEqual(2, self.session._generation)
+
+    def test_should_clone_with_own_login(self):
+        self.session.get(self.browse_url)
+        clone = self.session.clone()
+        try:
+            self.assertFalse(clone.authenticated)
+            self.assertEqual((self.session.login, self.session.password), (clone.login, clone.password))
+            self.assertIs(self.session.scheduler, clone.scheduler)
+
+            self.assertEqual(200, clone.get(self.browse_url).status_code)
+            self.assertEqual(4, self.server.requests['/login/'])
+            self.assertEqual(2, len(self.server.sessions))
+            self.assertEqual(200, self.session.get(self.browse_url).status_code)
+            self.assertEqual(4, self.server.requests['/login/'])
+        finally:
+            clone.close()
+
+
+class FakeSession(object):
+    def __init__(self):
+        self.clones = []
+        self.closed = False
+
+    def clone(self):
+        self.clones.append(FakeSession())
+        return self.clones[-1]
+
+    def close(self):
+        self.closed = True
+
+
+class SessionPoolTest(unittest.TestCase):
+    def test_should_clone_only_when_all_sessions_are_busy(self):
+        session = FakeSession()
+        pool = SessionPool(session)
+
+        first, second = pool.get(), pool.get()
+        self.assertIs(session, first)
+        self.assertEqual([second], session.clones)
+        pool.put(first)
+        pool.put(second)
+        self.assertEqual(set([first, second]), set([pool.get(), pool.get()]))
+        self.assertEqual(1, len(session.clones))
+
+        pool.close()
+        self.assertTrue(second.closed)
+        self.assertFalse(session.closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
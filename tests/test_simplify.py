@@ -0,0 +1,70 @@
+import math
+import unittest
+
+import shapely.wkt
+from shapely.geometry import Polygon, MultiPolygon
+
+from ee_downloader import utils
+from ee_downloader.utils import CoordinateConverter, simplify_geom, simplify_geoms
+
+
+def coastline(points, cx=175, cy=60, radius=4):
+    coords = []
+    for i in range(points):
+        angle = 2 * math.pi * i / points
+        r = radius * (1 + 0.3 * math.sin(7 * angle) + 0.15 * math.sin(53 * angle))
+        x = cx + r * math.cos(angle)
+        coords.append((x - 360 if x > 180 else x, cy + 0.5 * r * math.sin(angle)))
+    return MultiPolygon([Polygon(coords)]).wkt
+
+
+class SimplifyGeomTest(unittest.TestCase):
+    def setUp(self):
+        utils._simplify_cache.clear()
+
+    def assertCovers(self, wkt, simplified, max_points):
+        original = CoordinateConverter.toWorkProj(shapely.wkt.loads(wkt).geoms[0])
+        result = CoordinateConverter.toWorkProj(shapely.wkt.loads(simplified))
+        self.assertLessEqual(len(result.exterior.coords), max_points)
+        self.assertTrue(result.contains(original))
+
+    def test_should_cover_geometry_by_every_method(self):
+        wkt = coastline(1000)
+        for method in ('bisect', 'buffer'):
+            self.assertCovers(wkt, simplify_geom(wkt, 30, method), 30)
+
+    def test_should_keep_small_geometry(self):
+        wkt = MultiPolygon([Polygon([(170, 50), (175, 50), (175, 55), (170, 55)])]).wkt
+        self.assertEqual(4 + 1, len(shapely.wkt.loads(simplify_geom(wkt)).exterior.coords))
+
+    def test_should_memoize_results(self):
+        calls = []
+        simplify = utils._simplify_geom
+
+        def counted(*args):
+            calls.append(args)
+            return simplify(*args)
+
+        utils._simplify_geom = counted
+        try:
+            wkt = coastline(100)
+            self.assertEqual(simplify_geom(wkt), simplify_geom(wkt))
+        finally:
+            utils._simplify_geom = simplify
+        self.assertEqual(1, len(calls))
+
+    def test_should_simplify_batch_in_order(self):
+        wkts = [coastline(200 + i * 50) for i in range(3)]
+        results = simplify_geoms(wkts + wkts[:1], processes=2)
+        self.assertEqual(4, len(results))
+        self.assertEqual(results[0], results[3])
+        for wkt, result in zip(wkts, results):
+            self.assertCovers(wkt, result, 30)
+
+    def test_should_reject_unknown_method(self):
+        with self.assertRaises(ValueError):
+            simplify_geom(coastline(100), method='unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
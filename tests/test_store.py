@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from ee_downloader.store import SceneStore, link_file
+
+
+PRODUCT = 12864
+FORMAT = 'Level-1 GeoTIFF Data Product'
+
+
+class SceneStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.temp_dir, 'store')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def make_file(self, name, size=1000):
+        filename = os.path.join(self.temp_dir, name)
+        with open(filename, 'wb') as f:
+            f.write(os.urandom(size))
+        return filename
+
+    def test_should_store_and_link_files(self):
+        store = SceneStore(self.root)
+        self.assertIsNone(store.get(PRODUCT, 'LC08_A', FORMAT))
+
+        data = open(self.make_file('a.part'), 'rb').read()
+        stored = store.put(PRODUCT, 'LC08_A', FORMAT, os.path.join(self.temp_dir, 'a.part'))
+        self.assertTrue(stored.endswith('.tar.gz'))
+        self.assertEqual(stored, store.get(PRODUCT, 'LC08_A', FORMAT))
+        self.assertEqual(1000, store.size)
+
+        target = os.path.join(self.temp_dir, 'LC08_A.tar.gz')
+        self.assertEqual('hardlink', link_file(stored, target, ['hardlink']))
+        self.assertEqual(data, open(target, 'rb').read())
+        self.assertEqual(os.stat(stored).st_ino, os.stat(target).st_ino)
+        self.assertIn(store.link(stored, target), ('reflink', 'hardlink', 'copy'))
+        store.close()
+
+        # The index is shared by the next processes
+        store = SceneStore(self.root)
+        self.assertEqual(stored, store.get(PRODUCT, 'LC08_A', FORMAT))
+
+    def test_should_evict_least_recently_used_files(self):
+        store = SceneStore(self.root, max_size=2500)
+        for name in ('a', 'b'):
+            store.put(PRODUCT, name, FORMAT, self.make_file(name))
+            time.sleep(0.01)
+        store.get(PRODUCT, 'a', FORMAT)
+        time.sleep(0.01)
+
+        with store.lock(PRODUCT, 'a', FORMAT):
+            store.put(PRODUCT, 'c', FORMAT, self.make_file('c'))
+        self.assertIsNone(store.get(PRODUCT, 'b', FORMAT))
+        self.assertIsNotNone(store.get(PRODUCT, 'a', FORMAT))
+        self.assertIsNotNone(store.get(PRODUCT, 'c', FORMAT))
+        self.assertEqual(2000, store.size)
+
+        # Locked files aren't evicted
+        store.max_size = 500
+        with store.lock(PRODUCT, 'a', FORMAT):
+            self.assertEqual(1, store.evict())
+        self.assertIsNotNone(store.get(PRODUCT, 'a', FORMAT))
+
+    def test_should_serialize_workers_of_one_scene(self):
+        stores = [SceneStore(self.root), SceneStore(self.root)]
+        downloads = []
+
+        def worker(store, i):
+            with store.lock(PRODUCT, 'a', FORMAT):
+                if store.get(PRODUCT, 'a', FORMAT) is None:
+                    time.sleep(0.05)
+                    downloads.append(i)
+                    store.put(PRODUCT, 'a', FORMAT, self.make_file('a{0}'.format(i)))
+
+        threads = [threading.Thread(target=worker, args=(stores[i % 2], i)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, len(downloads))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import io
+import os
+import re
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from ee_downloader.subset import RangeFile, fetch_bands
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, content='', headers=None, url=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.url = url
+        self.raw = io.BytesIO(content)
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeSession(object):
+    """
+    Session serving one file with Range support and counting the requests.
+    """
+
+    def __init__(self, data, ranges=True):
+        self.data = data
+        self.ranges = ranges
+        self.requests = []
+
+    def get(self, url, stream=False, headers=None):
+        match = re.match(r'bytes=(\d+)-(\d+)$', (headers or {}).get('Range', ''))
+        self.requests.append(match.groups() if match else None)
+        if not match or not self.ranges:
+            return FakeResponse(200, self.data, url=url)
+        start, end = int(match.group(1)), int(match.group(2)) + 1
+        return FakeResponse(206, self.data[start:end], url=url,
+                            headers={'Content-Range': 'bytes {0}-{1}/{2}'.format(start, end - 1, len(self.data))})
+
+
+class FakeBandwidth(object):
+    def __init__(self):
+        self.transfers = []
+
+    def transfer(self, size, priority=None):
+        self.transfers.append((size, priority))
+
+
+def make_zip(band_size=256 * 1024):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w', zipfile.ZIP_STORED) as archive:
+        for band in range(1, 9):
+            archive.writestr('S2A.SAFE/GRANULE/IMG_DATA/T39UWB_B0{0}.jp2'.format(band), os.urandom(band_size))
+        archive.writestr('S2A.SAFE/MTD_MSIL1C.xml', '<metadata/>')
+    return data.getvalue()
+
+
+class RangeFileTest(unittest.TestCase):
+    def test_should_read_blocks(self):
+        data = os.urandom(10000)
+        session = FakeSession(data)
+        remote = RangeFile(session, 'http://test/file', len(data), block_size=1000)
+
+        remote.seek(-100, os.SEEK_END)
+        self.assertEqual(data[-100:], remote.read())
+        remote.seek(500)
+        self.assertEqual(data[500:600], remote.read(100))
+        self.assertEqual(data[600:700], remote.read(100))
+        self.assertEqual(700, remote.tell())
+        self.assertEqual(2, remote.requests)
+        self.assertEqual(data[700:3000], remote.read(2300))
+        self.assertEqual('', RangeFile(session, 'http://test/file', 0).read())
+
+
+class FetchBandsTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.extract_dir = os.path.join(self.temp_dir, 'S2A')
+        self.data = make_zip()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_should_read_only_requested_zip_members(self):
+        session = FakeSession(self.data)
+        result = fetch_bands(session, 'http://test/file', '.zip', self.extract_dir, [2, 4])
+
+        self.assertEqual([2, 4], sorted(result['bands']))
+        self.assertEqual(os.path.join(self.extract_dir, 'MTD_MSIL1C.xml'), result['meta'])
+        self.assertEqual(sorted(['T39UWB_B02.jp2', 'T39UWB_B04.jp2', 'MTD_MSIL1C.xml']),
+                         sorted(os.listdir(self.extract_dir)))
+        fetched = sum(int(end) - int(start) + 1 for start, end in session.requests)
+        self.assertLess(fetched, len(self.data) / 2)
+
+    def test_should_download_zip_without_ranges(self):
+        session = FakeSession(self.data, ranges=False)
+        result = fetch_bands(session, 'http://test/file', '.zip', self.extract_dir, [8])
+        self.assertEqual([8], list(result['bands']))
+
+    def test_should_account_fetched_bytes_in_bandwidth(self):
+        for ranges in (True, False):
+            session = FakeSession(self.data, ranges)
+            bandwidth = FakeBandwidth()
+            fetch_bands(session, 'http://test/file', '.zip', self.extract_dir, [2], bandwidth, priority=0)
+
+            if ranges:
+                # The probe of the first byte isn't read
+                fetched = sum(int(end) - int(start) + 1 for start, end in session.requests[1:])
+            else:
+                fetched = len(self.data)
+            self.assertEqual(fetched, sum(size for size, _ in bandwidth.transfers))
+            self.assertEqual(set([0]), set(priority for _, priority in bandwidth.transfers))
+
+    def test_should_fail_without_requested_bands(self):
+        session = FakeSession(self.data)
+        self.assertRaises(IOError, fetch_bands, session, 'http://test/file', '.zip', self.extract_dir, [9])
+        self.assertEqual([], os.listdir(self.temp_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
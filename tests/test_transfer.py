@@ -0,0 +1,40 @@
+import io
+import unittest
+
+from ee_downloader.transfer import StreamWriter
+
+
+class FakeRaw(io.BytesIO):
+    decode_content = False
+
+
+class FakeResponse(object):
+    def __init__(self, data):
+        self.raw = FakeRaw(data)
+
+
+class StreamWriterTest(unittest.TestCase):
+    def test_should_copy_response_body(self):
+        data = ''.join(chr(i % 256) for i in range(10000))
+        f = io.BytesIO()
+        sizes = []
+
+        writer = StreamWriter(chunk_size=4096, preallocate=False)
+        self.assertEqual(len(data), writer.write(FakeResponse(data), f, callback=lambda chunk: sizes.append(len(chunk))))
+
+        self.assertEqual(data, f.getvalue())
+        self.assertEqual([4096, 4096, 1808], sizes)
+        self.assertEqual(len(data), writer.bytes)
+
+    def test_should_write_preallocated_file_from_position(self):
+        f = io.BytesIO('abc')
+        f.seek(3)
+
+        writer = StreamWriter(chunk_size=2, preallocate=True)
+        writer.write(FakeResponse('defgh'), f, size=5)
+
+        self.assertEqual('abcdefgh', f.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,302 @@
+import itertools
+import threading
+import time
+import unittest
+
+import requests
+
+from ee_downloader import config as downloader_config
+from ee_downloader.workers import WorkerPool, DownloadScheduler, HostThrottle, DownloadResults, RateLimiter, \
+    BandwidthLimiter, download_priority, imap_unordered, pipeline, retry
+
+
+class WorkerPoolTest(unittest.TestCase):
+    def test_should_run_every_task(self):
+        results = DownloadResults()
+        with WorkerPool(3) as pool:
+            for i in range(10):
+                pool.submit(results.add, {'id': i}, 'file_%d' % i if i % 2 else None)
+
+        self.assertEqual(10, len(results))
+        self.assertEqual(5, len(results.succeeded()))
+        self.assertEqual(5, len(results.failed()))
+
+    def test_should_collect_task_errors(self):
+        def fail():
+            raise RuntimeError('broken')
+
+        with WorkerPool(2) as pool:
+            pool.submit(fail)
+            pool.submit(fail)
+
+        self.assertEqual(2, len(pool.errors))
+
+    def test_should_raise_exception_if_workers_count_is_wrong(self):
+        with self.assertRaises(ValueError):
+            WorkerPool(0)
+
+    def test_should_run_tasks_in_order_of_keys(self):
+        started = threading.Event()
+        done = []
+        with WorkerPool(1) as pool:
+            pool.submit(started.wait, 5)
+            for key in (30, 10, 20, 10):
+                pool.submit_ordered(key, done.append, key)
+            started.set()
+
+        self.assertEqual([10, 10, 20, 30], done)
+
+
+class DownloadSchedulerTest(unittest.TestCase):
+    def test_should_not_wait_for_bulk_tasks(self):
+        release = threading.Event()
+        preview = threading.Event()
+        with DownloadScheduler(workers=1, interactive_workers=1) as scheduler:
+            scheduler.submit(downloader_config.PRIORITY_BULK, 1024, release.wait, 5)
+            scheduler.submit(downloader_config.PRIORITY_INTERACTIVE, 1, preview.set)
+            self.assertTrue(preview.wait(1))
+            self.assertFalse(release.is_set())
+            release.set()
+        self.assertEqual([], scheduler.errors)
+
+    def test_should_run_shortest_tasks_first(self):
+        started = threading.Event()
+        done = []
+        with DownloadScheduler(workers=1) as scheduler:
+            scheduler.submit(downloader_config.PRIORITY_BULK, 0, started.wait, 5)
+            for size in (700, 5, 1024, 30):
+                scheduler.submit(downloader_config.PRIORITY_BULK, size, done.append, size)
+            started.set()
+
+        self.assertEqual([5, 30, 700, 1024], done)
+
+    def test_should_run_smallest_scenes_of_format_first(self):
+        product_format = 'Level-1 GeoTIFF Data Product'
+        scenes = [{'id': 'big', product_format + ' (966.4 MB)': 'url'},
+                  {'id': 'unknown', product_format: 'url'},
+                  {'id': 'small', product_format + ' (120.5 MB)': 'url'}]
+        started = threading.Event()
+        done = []
+        with DownloadScheduler(workers=1) as scheduler:
+            scheduler.submit(downloader_config.PRIORITY_BULK, 0, started.wait, 5)
+            for scene in scenes:
+                priority, size = download_priority(product_format, scene)
+                scheduler.submit(priority, size, done.append, scene['id'])
+            started.set()
+
+        # The size of the format from config is used when the option doesn't show the size
+        self.assertEqual(['small', 'big', 'unknown'], done)
+        self.assertEqual(download_priority(product_format), download_priority(product_format, scenes[1]))
+
+
+class HostThrottleTest(unittest.TestCase):
+    def test_should_limit_connections_per_host(self):
+        throttle = HostThrottle(2, reserved=0)
+        lock = threading.Lock()
+        state = {'active': 0, 'max': 0}
+
+        def download(url):
+            with throttle.acquire(url):
+                with lock:
+                    state['active'] += 1
+                    state['max'] = max(state['max'], state['active'])
+                time.sleep(0.01)
+                with lock:
+                    state['active'] -= 1
+
+        with WorkerPool(6) as pool:
+            for i in range(12):
+                pool.submit(download, 'https://dds.cr.usgs.gov/file_%d' % i)
+
+        self.assertEqual(2, state['max'])
+
+    def test_should_reserve_connections_for_interactive_downloads(self):
+        url = 'https://dds.cr.usgs.gov/file'
+        throttle = HostThrottle(3, reserved=1)
+
+        self.assertTrue(throttle.try_acquire(url))
+        self.assertTrue(throttle.try_acquire(url, downloader_config.PRIORITY_BULK))
+        self.assertFalse(throttle.try_acquire(url))
+        self.assertTrue(throttle.try_acquire(url, downloader_config.PRIORITY_INTERACTIVE))
+        # Both classes share the limit
+        self.assertFalse(throttle.try_acquire(url, downloader_config.PRIORITY_INTERACTIVE))
+        # One connection is left to the bulk downloads
+        self.assertEqual(0, HostThrottle(1, reserved=1).reserved)
+
+    def test_should_give_free_connection_to_interactive_download_first(self):
+        url = 'https://dds.cr.usgs.gov/file'
+        throttle = HostThrottle(2, reserved=1)
+        self.assertTrue(throttle.try_acquire(url))
+        self.assertTrue(throttle.try_acquire(url, downloader_config.PRIORITY_INTERACTIVE))
+        order = []
+
+        def download(priority):
+            with throttle.acquire(url, priority):
+                order.append(priority)
+
+        threads = [threading.Thread(target=download, args=(priority,))
+                   for priority in (downloader_config.PRIORITY_BULK, downloader_config.PRIORITY_INTERACTIVE)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.05)
+        throttle.release(url)
+        threads[1].join(5)
+        # The bulk download doesn't take the reserved connection
+        self.assertEqual([downloader_config.PRIORITY_INTERACTIVE], order)
+        throttle.release(url)
+        threads[0].join(5)
+
+        self.assertEqual([downloader_config.PRIORITY_INTERACTIVE, downloader_config.PRIORITY_BULK], order)
+        self.assertRaises(ValueError, throttle.release, url)
+
+
+class ImapUnorderedTest(unittest.TestCase):
+    def test_should_yield_every_result(self):
+        results = imap_unordered(lambda x: x * x, iter(range(20)), workers=4)
+        self.assertEqual(sorted(x * x for x in range(20)), sorted(results))
+
+    def test_should_reraise_exception(self):
+        def square(x):
+            if x == 3:
+                raise ValueError('broken')
+            return x * x
+
+        with self.assertRaises(ValueError):
+            list(imap_unordered(square, range(5), workers=2))
+
+
+class PipelineTest(unittest.TestCase):
+    def test_should_process_items_while_source_is_running(self):
+        produced = []
+
+        def source():
+            for i in range(50):
+                produced.append(i)
+                yield i
+
+        results = pipeline(source(), lambda x: x * 2, workers=3, queue_size=2)
+        first = next(results)
+        self.assertLess(len(produced), 50)
+        self.assertEqual(sorted(x * 2 for x in range(50)), sorted([first] + list(results)))
+
+    def test_should_reraise_source_exception(self):
+        def source():
+            yield 1
+            raise RuntimeError('search failed')
+
+        with self.assertRaises(RuntimeError):
+            list(pipeline(source(), lambda x: x, workers=2))
+
+    def test_should_stop_threads_when_consumer_stops(self):
+        closed = threading.Event()
+
+        def source():
+            try:
+                for i in itertools.count():
+                    yield i
+            finally:
+                closed.set()
+
+        def fail(x):
+            if x == 5:
+                raise RuntimeError('broken')
+            return x
+
+        threads = threading.active_count()
+        results = pipeline(source(), lambda x: x, workers=3, queue_size=2)
+        next(results)
+        results.close()
+        self.assertTrue(closed.is_set())
+        self.assertEqual(threads, threading.active_count())
+
+        with self.assertRaises(RuntimeError):
+            list(pipeline(source(), fail, workers=3, queue_size=2))
+        self.assertEqual(threads, threading.active_count())
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_should_limit_rate(self):
+        limiter = RateLimiter(rate=100, burst=1)
+        start = time.time()
+        for _ in range(11):
+            limiter.wait()
+        self.assertGreaterEqual(time.time() - start, 0.09)
+
+
+class BandwidthLimiterTest(unittest.TestCase):
+    def test_should_slow_down_bulk_downloads(self):
+        limiter = BandwidthLimiter(rate=100 * 1024, burst=10 * 1024)
+        start = time.time()
+        for _ in range(3):
+            limiter.transfer(10 * 1024, downloader_config.PRIORITY_BULK)
+        self.assertGreaterEqual(time.time() - start, 0.18)
+
+    def test_should_slow_down_interactive_downloads(self):
+        limiter = BandwidthLimiter(rate=100 * 1024, burst=10 * 1024)
+        start = time.time()
+        for _ in range(3):
+            limiter.transfer(10 * 1024, downloader_config.PRIORITY_INTERACTIVE)
+        self.assertGreaterEqual(time.time() - start, 0.18)
+
+    def test_should_give_bandwidth_to_interactive_downloads_first(self):
+        limiter = BandwidthLimiter(rate=100 * 1024, burst=10 * 1024)
+        # The bucket is empty for 0.2 second
+        limiter.transfer(20 * 1024)
+        order = []
+
+        def download(priority):
+            limiter.transfer(10 * 1024, priority)
+            order.append(priority)
+
+        threads = [threading.Thread(target=download, args=(priority,))
+                   for priority in (downloader_config.PRIORITY_BULK, downloader_config.PRIORITY_INTERACTIVE)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.02)
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual([downloader_config.PRIORITY_INTERACTIVE, downloader_config.PRIORITY_BULK], order)
+
+
+class RetryTest(unittest.TestCase):
+    def setUp(self):
+        self.retry_delay = downloader_config.RETRY_DELAY
+        downloader_config.RETRY_DELAY = 0
+
+    def tearDown(self):
+        downloader_config.RETRY_DELAY = self.retry_delay
+
+    def test_should_repeat_failed_call(self):
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) < downloader_config.REQUEST_RETRIES:
+                raise IOError('Service Unavailable')
+            return 'ok'
+
+        self.assertEqual('ok', retry(flaky))
+        self.assertEqual(downloader_config.REQUEST_RETRIES, len(calls))
+
+    def test_should_raise_exception_after_last_attempt(self):
+        def broken():
+            raise IOError('Service Unavailable')
+
+        with self.assertRaises(IOError):
+            retry(broken)
+
+    def test_should_not_repeat_requests_repeated_by_scheduler(self):
+        calls = []
+
+        def unavailable():
+            calls.append(1)
+            raise requests.exceptions.HTTPError('503 Server Error: Service Unavailable')
+
+        with self.assertRaises(requests.exceptions.HTTPError):
+            retry(unavailable)
+        self.assertEqual(1, len(calls))
+
+
+if __name__ == '__main__':
+    unittest.main()